@@ -2,8 +2,6 @@
 RedTox application initialization
 """
 from flask import Flask
-import logging
-import sys
 
 def create_app(config_object=None):
     """Create and configure the Flask application."""
@@ -15,37 +13,79 @@ def create_app(config_object=None):
     else:
         app.config.from_pyfile('../config.py')
     
-    # Configure logging - always set up regardless of debug mode
-    log_level = getattr(logging, app.config.get('LOG_LEVEL', 'INFO'))
-    
-    # Configure root logger
-    root_logger = logging.getLogger()
-    # Clear existing handlers to avoid duplicate messages
-    for handler in root_logger.handlers[:]:
-        root_logger.removeHandler(handler)
-    
-    # Set up console handler for direct output
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setLevel(log_level)
+    # Configure logging - always set up regardless of debug mode; records are
+    # written by a background thread so log I/O stays off the request threads
+    from app.logs import configure_logging
+    configure_logging(app)
+        
+    app.logger.info(f"Application initialized with DEBUG={app.config.get('DEBUG', False)}")
+
+    # Request latencies, hot-path timing spans and upstream error counts for /metrics
+    from app.metrics import Metrics
+    metrics = Metrics.from_config(app.config)
+    metrics.init_app(app)
+    app.extensions['metrics'] = metrics
+
+    # Shared moderation client pool, lives for the whole process
+    from app.moderation_pool import ModerationClientPool
+    pool = ModerationClientPool.from_config(app.config)
+    app.extensions['moderation_pool'] = pool
+    if app.config.get('MODERATION_POOL_WARM', False):
+        try:
+            pool.warm()
+        except Exception as e:
+            app.logger.error(f"Failed to pre-warm moderation clients: {str(e)}")
+
+    # Circuit breaker and latency record shared by every moderation call in the process
+    from app.resilience import CircuitBreaker, LatencyTracker, RateLimiter
+    app.extensions['moderation_breaker'] = CircuitBreaker.from_config(app.config)
+    app.extensions['moderation_latency'] = LatencyTracker()
+
+    # Micro-batcher gathering moderation calls from concurrent requests
+    if app.config.get('MODERATION_BATCHING', True):
+        from app.batcher import MicroBatcher
+        from app.scorers import fetch_toxicity_json
+        app.extensions['moderation_batcher'] = MicroBatcher.from_config(app.config, item_fn=fetch_toxicity_json)
+
+    # Toxicity score cache shared by all requests (and workers with CACHE_TYPE=sqlite)
+    from app.cache import create_cache
+    app.extensions['score_cache'] = create_cache(app, 'scores', app.config.get('SCORE_CACHE_TIMEOUT'))
+
+    # Offline lexicon scorer and prefilter, loaded once per process when a local mode is configured
+    scorer_mode = app.config.get('TOXICITY_SCORER', 'remote')
+    if scorer_mode in ('local', 'tiered', 'local_first'):
+        from app.scorers import LocalLexiconScorer
+        app.extensions['local_scorer'] = LocalLexiconScorer.from_config(app.config)
+    if scorer_mode in ('tiered', 'local_first'):
+        from app.prefilter import Prefilter
+        app.extensions['prefilter'] = Prefilter.from_config(
+            app.config, app.extensions['local_scorer'],
+            known_safe=create_cache(app, 'known_safe', app.config.get('KNOWN_SAFE_TIMEOUT'))
+        )
     
-    # Use different format based on debug mode
-    if app.config.get('DEBUG', False):
-        console_format = logging.Formatter('API DEBUG: %(levelname)s: %(message)s')
-    else:
-        console_format = logging.Formatter('API INFO: %(levelname)s: %(message)s')
+    # ETag/Last-Modified validators and parsed pages for conditional Reddit fetches
+    app.extensions['reddit_cache'] = create_cache(app, 'reddit', app.config.get('REDDIT_REVALIDATE_TIMEOUT'))
+    # Pacing of the requests to Reddit, None when REDDIT_RATE_LIMIT is 0
+    app.extensions['reddit_rate_limiter'] = RateLimiter.from_config(app.config)
     
-    console_handler.setFormatter(console_format)
-    root_logger.addHandler(console_handler)
-    root_logger.setLevel(log_level)
+    # Scored threads shared by /analyze and /thread
+    from app.analysis_store import AnalysisStore
+    analysis_max_age = app.config.get('ANALYSIS_MAX_AGE', 300)
+    snapshot_max_age = max(analysis_max_age, app.config.get('ANALYSIS_SNAPSHOT_MAX_AGE', 86400))
+    app.extensions['analysis_store'] = AnalysisStore(
+        create_cache(app, 'analysis', snapshot_max_age), analysis_max_age, snapshot_max_age
+    )
     
-    # Set Flask logger level
-    app.logger.setLevel(log_level)
+    # Single-flight groups: concurrent requests for the same text, thread fetch
+    # or thread analysis wait for one call instead of repeating it
+    from app.singleflight import SingleFlight
+    app.extensions['moderation_flights'] = SingleFlight('moderation')
+    app.extensions['reddit_flights'] = SingleFlight('reddit')
+    app.extensions['analysis_flights'] = SingleFlight.from_config(app.config, 'analysis')
     
-    # Only reduce werkzeug noise in production
-    if not app.config.get('DEBUG', False):
-        logging.getLogger('werkzeug').setLevel(logging.WARNING)
-        
-    app.logger.info(f"Application initialized with DEBUG={app.config.get('DEBUG', False)}")
+    # Background analysis jobs for /analyze
+    from app.jobs import JobQueue
+    app.extensions['job_queue'] = JobQueue.from_app(app)
     
     # Register blueprints
     from app.routes import main
@@ -0,0 +1,134 @@
+"""
+Server-side store of scored threads.
+
+Keeping the raw per-comment scores lets a threshold change, or the usual
+/analyze then /thread visit, be answered from stored results instead of
+re-fetching and re-scoring the thread. Once an entry is stale it still
+serves as the snapshot for an incremental re-analysis (app.snapshots).
+
+Entries are stored in the compact binary format of app.records: the scored
+comments as columns, with the rest of the entry in its header. Loading one
+maps the columns without copying and hands the comments out as dict views.
+app.records (and numpy with it) is imported on first use, not at start-up.
+"""
+import logging
+import time
+
+from app.snapshots import ThreadSnapshot
+
+logger = logging.getLogger(__name__)
+
+
+def copy_comments(comments):
+    """Copy scored comments so they can be reclassified without affecting other readers."""
+    from app.records import ScoredThread
+    if isinstance(comments, ScoredThread):
+        return comments.copy()
+    return [dict(c, toxicity=dict(c['toxicity'])) for c in comments]
+
+
+class AnalysisStore:
+    """Stores thread metadata and scored comments in a cache backend."""
+
+    def __init__(self, cache, max_age=300, snapshot_max_age=None):
+        """
+        Initialize the store.
+
+        Args:
+            cache: Cache backend from app.cache holding the entries
+            max_age: Seconds after fetching during which an entry is fresh
+            snapshot_max_age: Seconds during which an entry is used as the
+                snapshot for re-analysis, defaults to max_age
+        """
+        self.cache = cache
+        self.max_age = max_age
+        self.snapshot_max_age = max(max_age, snapshot_max_age or 0)
+
+    @staticmethod
+    def key(thread_id, safer_value):
+        """Build the store key for a thread scored with a given safer value."""
+        return f"{thread_id}:{safer_value}"
+
+    def save(self, thread_id, safer_value, metadata, comments, snapshot=None):
+        """
+        Store a scored thread.
+
+        Threads with comments the API could not score are only kept as a
+        snapshot, so the next visit scores the gaps instead of reusing them.
+
+        Args:
+            thread_id: Reddit thread ID
+            safer_value: Safer value the comments were scored with
+            metadata: Thread metadata dict
+            comments: Comment dicts with a 'toxicity' field
+            snapshot: ThreadSnapshot the comments were analyzed with, whose
+                ScoreStats are kept with the entry
+
+        Returns:
+            dict: The stored entry, or None if it is incomplete
+        """
+        complete = all(c.get('toxicity', {}).get('status', 'ok') == 'ok' for c in comments)
+        header = {
+            'thread_id': thread_id,
+            'safer_value': safer_value,
+            'fetched_at': time.time(),
+            'complete': complete,
+            'metadata': metadata,
+            'score_stats': snapshot.stats.to_dict() if snapshot is not None else None,
+        }
+        from app.records import ScoredThread
+        data = ScoredThread.from_comments(comments).to_bytes(header)
+        self.cache.set(self.key(thread_id, safer_value), data, timeout=self.snapshot_max_age)
+        return dict(header, comments=comments) if complete else None
+
+    def _get(self, thread_id, safer_value):
+        """Read an entry; its comments are a ScoredThread private to the caller."""
+        value = self.cache.get(self.key(thread_id, safer_value))
+        if value is None:
+            return None
+        if not isinstance(value, bytes):
+            # Entry stored as JSON before the binary format
+            return dict(value, comments=copy_comments(value['comments']))
+        from app.records import ScoredThread
+        try:
+            comments, header = ScoredThread.from_bytes(value)
+        except ValueError as e:
+            logger.warning(f"Ignoring unreadable analysis of thread {thread_id}: {str(e)}")
+            return None
+        return dict(header, comments=comments)
+
+    def load(self, thread_id, safer_value, max_age=None):
+        """
+        Load a stored thread if it was fetched recently enough.
+
+        The comments are decoded for each call, so that callers can
+        reclassify them without affecting other requests reading the entry.
+
+        Args:
+            thread_id: Reddit thread ID
+            safer_value: Safer value the comments must have been scored with
+            max_age: Maximum age in seconds, defaults to the store's max_age
+
+        Returns:
+            dict or None: The stored entry, if present and fresh
+        """
+        entry = self._get(thread_id, safer_value)
+        if entry is None or not entry.get('complete', True):
+            return None
+        max_age = self.max_age if max_age is None else max_age
+        if time.time() - entry['fetched_at'] > max_age:
+            return None
+        return entry
+
+    def load_snapshot(self, thread_id, safer_value):
+        """
+        Load the last analysis of a thread, fresh or not, for re-analysis.
+
+        Returns:
+            ThreadSnapshot: The stored scores, or an empty snapshot if the
+                thread was not analyzed within snapshot_max_age
+        """
+        entry = self._get(thread_id, safer_value)
+        if entry is None or time.time() - entry['fetched_at'] > self.snapshot_max_age:
+            return ThreadSnapshot()
+        return ThreadSnapshot.from_entry(entry)
@@ -0,0 +1,124 @@
+"""
+ASGI serving mode.
+
+GET /thread is handled by a coroutine on the event loop. It fetches Reddit
+with httpx and awaits the moderation calls, so one worker process can keep
+hundreds of analyses in flight instead of one per sync worker. Every other
+route runs the regular Flask app through asgiref's WsgiToAsgi adapter. At
+lifespan shutdown the worker's httpx client is closed.
+"""
+import logging
+
+from asgiref.wsgi import WsgiToAsgi
+
+from app.reddit_client import close_async_client
+from app.routes import thread_view_async
+
+logger = logging.getLogger(__name__)
+
+# Path -> coroutine view served natively; the view runs inside a Flask request context
+ASYNC_VIEWS = {
+    '/thread': thread_view_async,
+}
+
+
+def _environ(scope):
+    """Build the WSGI environ Flask needs for a request context from an ASGI scope."""
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+    if path.startswith(root_path):
+        path = path[len(root_path):]
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path.encode('utf-8').decode('latin-1'),
+        'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': None,
+        'wsgi.errors': None,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope.get('headers', []):
+        key = name.decode('latin-1').upper().replace('-', '_')
+        if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            key = f"HTTP_{key}"
+        value = value.decode('latin-1')
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+class AsgiApp:
+    """ASGI application serving ASYNC_VIEWS natively and the rest of the Flask app through WSGI."""
+
+    def __init__(self, flask_app, async_views=None):
+        """
+        Wrap a Flask application.
+
+        Args:
+            flask_app: Application from create_app
+            async_views: Path -> coroutine view mapping, defaults to ASYNC_VIEWS
+        """
+        self.flask_app = flask_app
+        self.async_views = ASYNC_VIEWS if async_views is None else async_views
+        self.wsgi = WsgiToAsgi(flask_app)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        view = self.async_views.get(scope.get('path')) if scope['type'] == 'http' else None
+        if view is None or scope['method'] not in ('GET', 'HEAD'):
+            await self.wsgi(scope, receive, send)
+            return
+        await self._serve(view, scope, send)
+
+    async def _lifespan(self, receive, send):
+        """Answer the server's startup and shutdown events, closing pooled connections at shutdown."""
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                try:
+                    await close_async_client()
+                except Exception as e:
+                    logger.warning(f"Closing the Reddit client failed: {str(e)}")
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _serve(self, view, scope, send):
+        """Run a coroutine view the way Flask's wsgi_app runs a regular one."""
+        app = self.flask_app
+        with app.request_context(_environ(scope)):
+            try:
+                try:
+                    rv = app.preprocess_request()
+                    if rv is None:
+                        rv = await view()
+                except Exception as e:
+                    rv = app.handle_user_exception(e)
+                response = app.finalize_request(rv)
+            except Exception as e:
+                response = app.handle_exception(e)
+            body = response.get_data()
+
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                        for name, value in response.headers.items()],
+        })
+        await send({'type': 'http.response.body', 'body': b'' if scope['method'] == 'HEAD' else body})
+
+
+def create_asgi_app(flask_app):
+    """Wrap a Flask application for an ASGI server such as uvicorn."""
+    return AsgiApp(flask_app)
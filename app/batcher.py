@@ -0,0 +1,251 @@
+"""
+Micro-batching of moderation requests across concurrent users.
+
+Every request thread submits the texts it needs scored to one process-wide
+``MicroBatcher``. A dispatcher thread gathers whatever arrives within a short
+window (or until the batch is full), drops duplicates, and sends the batch
+upstream: in one call when the backend takes batches, otherwise as
+individual calls spread over the in-flight slots. Results are delivered
+through each caller's ``Future``.
+
+A ``Future`` can be shared by several requests, so a caller that stops
+waiting ``release``s it rather than cancelling it: the item is withdrawn only
+when nobody else is waiting and it has not been sent yet.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Collects submitted items into small batches and dispatches them.
+
+    Exactly one of ``batch_fn`` (takes a list of items, returns a list of
+    results in the same order) or ``item_fn`` (takes one item, returns its
+    result) must be given. Items submitted with a key that is already queued
+    or in flight share the existing future instead of being sent again.
+    """
+
+    def __init__(self, item_fn=None, batch_fn=None, window=0.005, max_batch_size=32,
+                 max_in_flight=4, name='moderation'):
+        """
+        Initialize the batcher.
+
+        Args:
+            item_fn: Callable scoring a single item
+            batch_fn: Callable scoring a list of items in one upstream call
+            window: Seconds to wait for more items after the first one arrives
+            max_batch_size: Maximum number of items dispatched together
+            max_in_flight: Maximum number of upstream calls running at once
+            name: Name used for the dispatcher and worker threads
+        """
+        if (item_fn is None) == (batch_fn is None):
+            raise ValueError("Exactly one of item_fn or batch_fn is required")
+        self.item_fn = item_fn
+        self.batch_fn = batch_fn
+        self.window = window
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.name = name
+        self._reset()
+
+    @classmethod
+    def from_config(cls, config, item_fn=None, batch_fn=None):
+        """Create a batcher from a Flask config mapping."""
+        return cls(
+            item_fn=item_fn,
+            batch_fn=batch_fn,
+            window=config.get('MODERATION_BATCH_WINDOW', 0.005),
+            max_batch_size=config.get('MODERATION_BATCH_MAX_SIZE', 32),
+            max_in_flight=config.get('MODERATION_MAX_IN_FLIGHT', 4),
+        )
+
+    def _reset(self):
+        """(Re)initialize batcher state for the current process."""
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._queue = deque()
+        # key -> [future, callers waiting for it]
+        self._futures = {}
+        self._slots = threading.BoundedSemaphore(self.max_in_flight)
+        self._executor = None
+        self._thread = None
+        self._counters = {
+            'submitted': 0, 'deduplicated': 0, 'batches': 0, 'dispatched': 0,
+            'calls': 0, 'errors': 0, 'largest_batch': 0, 'in_flight': 0, 'withdrawn': 0,
+        }
+        self._wait_total = 0.0
+
+    def _check_pid(self):
+        """Start over after a fork; the parent's dispatcher thread does not exist here."""
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    logger.info("Process fork detected, resetting micro-batcher")
+                    self._reset()
+
+    def _ensure_started(self):
+        """Start the dispatcher thread on first use. Caller holds the lock."""
+        if self._thread is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_in_flight, thread_name_prefix=f"{self.name}-call"
+            )
+            self._thread = threading.Thread(
+                target=self._dispatch_loop, name=f"{self.name}-batcher", daemon=True
+            )
+            self._thread.start()
+
+    def submit(self, key, item):
+        """
+        Queue an item for the next batch.
+
+        Args:
+            key: Hashable identity of the item, used to share duplicate work
+            item: The value passed to item_fn / batch_fn
+
+        Returns:
+            Future: Resolves to the item's result or raises the upstream error
+        """
+        self._check_pid()
+        with self._lock:
+            self._counters['submitted'] += 1
+            entry = self._futures.get(key)
+            if entry is not None:
+                entry[1] += 1
+                self._counters['deduplicated'] += 1
+                return entry[0]
+            future = Future()
+            self._futures[key] = [future, 1]
+            self._queue.append((key, item, future, time.monotonic()))
+            self._ensure_started()
+            self._ready.notify()
+        return future
+
+    def release(self, key, future):
+        """
+        Drop one caller's interest in a submitted item.
+
+        The item is withdrawn, if it has not been sent yet, once no caller is
+        waiting for it; other callers sharing the Future still get its result.
+        """
+        with self._lock:
+            entry = self._futures.get(key)
+            if entry is None or entry[0] is not future:
+                return
+            entry[1] -= 1
+            if entry[1] > 0:
+                return
+            del self._futures[key]
+            self._counters['withdrawn'] += 1
+        # Fails once the dispatcher has marked the item as running
+        future.cancel()
+
+    def _next_batch(self):
+        """Block until a batch is ready, then take it off the queue."""
+        with self._lock:
+            while not self._queue:
+                self._ready.wait()
+            # Give other requests a moment to add to this batch
+            deadline = time.monotonic() + self.window
+            while len(self._queue) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._ready.wait(remaining)
+            size = min(len(self._queue), self.max_batch_size)
+            batch = [self._queue.popleft() for _ in range(size)]
+
+            now = time.monotonic()
+            self._counters['batches'] += 1
+            self._counters['dispatched'] += size
+            self._counters['largest_batch'] = max(self._counters['largest_batch'], size)
+            self._wait_total += sum(now - submitted for _, _, _, submitted in batch)
+        return batch
+
+    def _dispatch_loop(self):
+        while True:
+            # Items withdrawn by all their callers are dropped; the rest can no longer be cancelled
+            batch = [entry for entry in self._next_batch() if entry[2].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            if self.batch_fn is not None:
+                self._start_call(self._run_batch, batch)
+            else:
+                for entry in batch:
+                    self._start_call(self._run_item, entry)
+
+    def _start_call(self, fn, arg):
+        """Run one upstream call once an in-flight slot is free."""
+        # Blocking here lets the queue build up into larger batches under load
+        self._slots.acquire()
+        with self._lock:
+            self._counters['calls'] += 1
+            self._counters['in_flight'] += 1
+        self._executor.submit(fn, arg)
+
+    def _finish_call(self):
+        with self._lock:
+            self._counters['in_flight'] -= 1
+        self._slots.release()
+
+    def _resolve(self, key, future, result=None, error=None):
+        """Deliver a result and allow the key to be submitted again."""
+        with self._lock:
+            entry = self._futures.get(key)
+            if entry is not None and entry[0] is future:
+                del self._futures[key]
+            if error is not None:
+                self._counters['errors'] += 1
+        if future.done():
+            return
+        try:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        except InvalidStateError:
+            # Completed by another thread in the meantime; the dispatcher must keep running
+            pass
+
+    def _run_item(self, entry):
+        key, item, future, _ = entry
+        try:
+            result = self.item_fn(item)
+        except Exception as e:
+            self._resolve(key, future, error=e)
+        else:
+            self._resolve(key, future, result)
+        finally:
+            self._finish_call()
+
+    def _run_batch(self, batch):
+        try:
+            results = self.batch_fn([item for _, item, _, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(f"Batch returned {len(results)} results for {len(batch)} items")
+        except Exception as e:
+            for key, _, future, _ in batch:
+                self._resolve(key, future, error=e)
+        else:
+            for (key, _, future, _), result in zip(batch, results):
+                self._resolve(key, future, result)
+        finally:
+            self._finish_call()
+
+    def stats(self):
+        """Return batching counters."""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['queued'] = len(self._queue)
+            stats['max_batch_size'] = self.max_batch_size
+            stats['max_in_flight'] = self.max_in_flight
+            stats['avg_batch_size'] = stats['dispatched'] / stats['batches'] if stats['batches'] else 0
+            stats['avg_wait_ms'] = self._wait_total * 1000 / stats['dispatched'] if stats['dispatched'] else 0
+        return stats
@@ -0,0 +1,333 @@
+"""
+Cache backends shared by the toxicity detector and the routes.
+
+Two backends are provided: an in-process LRU bounded by a byte budget, and a
+SQLite store that every gunicorn worker on the host can read. Values must be
+JSON-serializable, or bytes, which are stored as they are. Both backends
+expire entries after a TTL and keep hit/miss counters. The in-process caches
+of one app split CACHE_MAX_BYTES between them (MEMORY_CACHE_SHARES), so
+together they stay within it.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+# Fraction of CACHE_MAX_BYTES each in-memory cache namespace may use
+MEMORY_CACHE_SHARES = {
+    'analysis': 0.4,
+    'reddit': 0.25,
+    'scores': 0.25,
+    'known_safe': 0.1,
+}
+# Share for a namespace missing from MEMORY_CACHE_SHARES
+DEFAULT_MEMORY_CACHE_SHARE = 0.1
+
+
+def normalize_text(text):
+    """Normalize comment text so trivially different copies share a cache entry."""
+    return _WHITESPACE_RE.sub(' ', unicodedata.normalize('NFC', text)).strip()
+
+
+def estimate_size(value):
+    """
+    Approximate the JSON-encoded size of a value in bytes, without encoding it.
+
+    Long lists are sized from an evenly spaced sample of their items, so a
+    parsed thread costs about as much to measure as a few of its comments.
+    """
+    if isinstance(value, (str, bytes)):
+        return len(value) + 2
+    if isinstance(value, dict):
+        return 2 + sum(len(key) + 4 + estimate_size(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        count = len(value)
+        sample = value[::count // 16] if count > 32 else value
+        return 2 + sum(estimate_size(item) + 1 for item in sample) * count // max(len(sample), 1)
+    return 8
+
+
+def score_cache_key(text, safer_value):
+    """Build the content-addressed cache key for a toxicity score."""
+    digest = hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+    return f"{safer_value}:{digest}"
+
+
+class BaseCache:
+    """Common counters and interface for cache backends."""
+
+    def __init__(self, default_timeout=300):
+        self.default_timeout = default_timeout
+        self._stats_lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'sets': 0, 'evictions': 0, 'expired': 0}
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self._counters[name] += amount
+
+    def _expiry(self, timeout):
+        timeout = self.default_timeout if timeout is None else timeout
+        return time.time() + timeout if timeout else None
+
+    def get(self, key):
+        """Return the cached value for key, or None."""
+        raise NotImplementedError
+
+    def set(self, key, value, timeout=None):
+        """Store value under key for timeout seconds (0 means no expiry)."""
+        raise NotImplementedError
+
+    def delete(self, key):
+        """Remove key from the cache."""
+        raise NotImplementedError
+
+    def clear(self):
+        """Remove every entry."""
+        raise NotImplementedError
+
+    def stats(self):
+        """Return hit/miss counters and the hit rate."""
+        with self._stats_lock:
+            stats = dict(self._counters)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0
+        return stats
+
+
+class NullCache(BaseCache):
+    """Cache that stores nothing, used when caching is disabled."""
+
+    def get(self, key):
+        self._count('misses')
+        return None
+
+    def set(self, key, value, timeout=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+
+class MemoryCache(BaseCache):
+    """In-process LRU cache bounded by an approximate byte budget."""
+
+    def __init__(self, default_timeout=300, max_bytes=64 * 1024 * 1024):
+        super().__init__(default_timeout)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, size, value = entry
+                if expires is not None and expires < time.time():
+                    del self._entries[key]
+                    self._bytes -= size
+                    entry = None
+                    self._count('expired')
+                else:
+                    self._entries.move_to_end(key)
+        if entry is None:
+            self._count('misses')
+            return None
+        self._count('hits')
+        return value
+
+    def set(self, key, value, timeout=None):
+        size = len(key) + estimate_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (self._expiry(timeout), size, value)
+            self._bytes += size
+            evicted = 0
+            while self._bytes > self.max_bytes:
+                _, (_, old_size, _) = self._entries.popitem(last=False)
+                self._bytes -= old_size
+                evicted += 1
+        self._count('sets')
+        if evicted:
+            self._count('evictions', evicted)
+
+    def delete(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+        return stats
+
+
+class SQLiteCache(BaseCache):
+    """
+    Cache stored in a SQLite file so that all worker processes share it.
+
+    Entries are evicted once expired, and least recently used entries are
+    trimmed when the table grows past ``max_entries``.
+    """
+
+    def __init__(self, path, namespace='cache', default_timeout=300, max_entries=100000):
+        super().__init__(default_timeout)
+        self.path = path
+        self.table = re.sub(r'\W', '_', namespace)
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._sets_since_trim = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "expires REAL, accessed REAL NOT NULL)"
+            )
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_accessed ON {self.table} (accessed)")
+
+    def _connect(self):
+        """Return this thread's connection, reopening it after a fork."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        now = time.time()
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                f"SELECT value, expires FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and row[1] is not None and row[1] < now:
+                conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self._count('expired')
+                row = None
+            if row is not None:
+                conn.execute(f"UPDATE {self.table} SET accessed = ? WHERE key = ?", (now, key))
+        except sqlite3.Error as e:
+            logger.error(f"Cache read failed: {str(e)}")
+            row = None
+        if row is None:
+            self._count('misses')
+            return None
+        self._count('hits')
+        # bytes come back from a BLOB as they were stored
+        return row[0] if isinstance(row[0], bytes) else json.loads(row[0])
+
+    def set(self, key, value, timeout=None):
+        try:
+            self._connect().execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+                (key, value if isinstance(value, bytes) else json.dumps(value, separators=(',', ':')),
+                 self._expiry(timeout), time.time())
+            )
+        except sqlite3.Error as e:
+            logger.error(f"Cache write failed: {str(e)}")
+            return
+        self._count('sets')
+        self._sets_since_trim += 1
+        if self._sets_since_trim >= 100:
+            self._sets_since_trim = 0
+            self.trim()
+
+    def trim(self):
+        """Drop expired entries and the least recently used overflow."""
+        try:
+            conn = self._connect()
+            expired = conn.execute(
+                f"DELETE FROM {self.table} WHERE expires IS NOT NULL AND expires < ?", (time.time(),)
+            ).rowcount
+            overflow = conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0] - self.max_entries
+            evicted = 0
+            if overflow > 0:
+                evicted = conn.execute(
+                    f"DELETE FROM {self.table} WHERE key IN "
+                    f"(SELECT key FROM {self.table} ORDER BY accessed LIMIT ?)", (overflow,)
+                ).rowcount
+        except sqlite3.Error as e:
+            logger.error(f"Cache trim failed: {str(e)}")
+            return
+        if expired:
+            self._count('expired', expired)
+        if evicted:
+            self._count('evictions', evicted)
+
+    def delete(self, key):
+        try:
+            self._connect().execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+        except sqlite3.Error as e:
+            logger.error(f"Cache delete failed: {str(e)}")
+
+    def clear(self):
+        try:
+            self._connect().execute(f"DELETE FROM {self.table}")
+        except sqlite3.Error as e:
+            logger.error(f"Cache clear failed: {str(e)}")
+
+    def stats(self):
+        stats = super().stats()
+        try:
+            stats['entries'] = self._connect().execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        except sqlite3.Error:
+            pass
+        return stats
+
+
+def create_cache(app, namespace, timeout=None):
+    """
+    Create a cache backend based on the application's CACHE_TYPE.
+
+    Args:
+        app: Flask application
+        namespace: Name separating this cache from others sharing a backend
+        timeout: Default TTL in seconds, defaults to CACHE_DEFAULT_TIMEOUT
+
+    Returns:
+        A cache backend instance
+    """
+    config = app.config
+    cache_type = config.get('CACHE_TYPE', 'simple').lower()
+    if timeout is None:
+        timeout = config.get('CACHE_DEFAULT_TIMEOUT', 300)
+
+    if cache_type in ('null', 'none'):
+        return NullCache(timeout)
+    if cache_type == 'sqlite':
+        path = config.get('CACHE_SQLITE_PATH') or os.path.join(app.instance_path, 'redtox-cache.sqlite3')
+        return SQLiteCache(path, namespace, timeout, config.get('CACHE_MAX_ENTRIES', 100000))
+    if cache_type not in ('simple', 'memory'):
+        logger.warning(f"Unknown CACHE_TYPE '{cache_type}', using in-memory cache")
+    share = MEMORY_CACHE_SHARES.get(namespace, DEFAULT_MEMORY_CACHE_SHARE)
+    return MemoryCache(timeout, int(config.get('CACHE_MAX_BYTES', 64 * 1024 * 1024) * share))
@@ -0,0 +1,393 @@
+"""
+Background thread analysis jobs.
+
+``/analyze`` can hand a thread to a ``JobQueue`` and return at once. Worker
+threads in the same process fetch and score the thread, reporting progress
+(queued, fetching, scoring n of m, done or failed) in a job record. The
+finished analysis goes to the analysis store, where ``/analyze`` and
+``thread_view`` find it.
+
+Job records live in a ``MemoryJobStore`` (one process) or a
+``SQLiteJobStore`` (shared by every worker process on the host, which then
+also share the queue). Submitting a thread that already has an active job
+returns that job instead of starting a duplicate.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from app.analysis_store import copy_comments
+from app.reddit_client import get_thread_data
+from app.toxicity_detector import ToxicityDetector
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+FETCHING = 'fetching'
+SCORING = 'scoring'
+DONE = 'done'
+FAILED = 'failed'
+ACTIVE = (QUEUED, FETCHING, SCORING)
+
+
+def _new_job(thread_id, thread_url, safer_value):
+    now = time.time()
+    return {
+        'id': uuid.uuid4().hex[:16],
+        'thread_id': thread_id,
+        'thread_url': thread_url,
+        'safer_value': safer_value,
+        'status': QUEUED,
+        'done': 0,
+        'total': 0,
+        'error': None,
+        'stats': None,
+        'created': now,
+        'updated': now,
+    }
+
+
+class MemoryJobStore:
+    """Job records in a dict, visible to the current process only."""
+
+    def __init__(self, max_age=3600):
+        """
+        Initialize the store.
+
+        Args:
+            max_age: Seconds finished jobs are kept
+        """
+        self.max_age = max_age
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def create(self, thread_id, thread_url, safer_value, stale_after):
+        """
+        Queue a job for a thread, or return its active job.
+
+        Returns:
+            tuple: (job dict, whether a new job was created)
+        """
+        now = time.time()
+        with self._lock:
+            self._purge(now)
+            for job in self._jobs.values():
+                if (job['thread_id'] == thread_id and job['safer_value'] == safer_value
+                        and job['status'] in ACTIVE and now - job['updated'] < stale_after):
+                    return dict(job), False
+            job = _new_job(thread_id, thread_url, safer_value)
+            self._jobs[job['id']] = job
+            return dict(job), True
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fields, updated=time.time())
+
+    def claim(self, stale_after):
+        """Mark the oldest queued (or abandoned) job as fetching and return it, or None."""
+        now = time.time()
+        with self._lock:
+            claimable = [
+                job for job in self._jobs.values()
+                if job['status'] == QUEUED or (job['status'] in ACTIVE and now - job['updated'] >= stale_after)
+            ]
+            if not claimable:
+                return None
+            job = min(claimable, key=lambda item: item['created'])
+            job.update(status=FETCHING, updated=now)
+            return dict(job)
+
+    def _purge(self, now):
+        """Forget finished jobs older than max_age. Caller holds the lock."""
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job['status'] not in ACTIVE and now - job['updated'] > self.max_age]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+class SQLiteJobStore:
+    """Job records in a SQLite file shared by all worker processes."""
+
+    COLUMNS = ('id', 'thread_id', 'thread_url', 'safer_value', 'status', 'done', 'total',
+               'error', 'stats', 'created', 'updated')
+
+    def __init__(self, path, max_age=3600):
+        """
+        Initialize the store.
+
+        Args:
+            path: SQLite database file
+            max_age: Seconds finished jobs are kept
+        """
+        self.path = path
+        self.max_age = max_age
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, thread_id TEXT NOT NULL, thread_url TEXT, safer_value REAL, "
+                "status TEXT NOT NULL, done INTEGER NOT NULL, total INTEGER NOT NULL, "
+                "error TEXT, stats TEXT, created REAL NOT NULL, updated REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_thread ON jobs (thread_id, safer_value)")
+
+    def _connect(self):
+        """Return this thread's connection, reopening it after a fork."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _row_to_job(self, row):
+        job = dict(zip(self.COLUMNS, row))
+        job['stats'] = json.loads(job['stats']) if job['stats'] else None
+        return job
+
+    def create(self, thread_id, thread_url, safer_value, stale_after):
+        now = time.time()
+        conn = self._connect()
+        # IMMEDIATE takes the write lock up front, so two processes can't both insert
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM jobs WHERE status IN (?, ?) AND updated < ?", (DONE, FAILED, now - self.max_age))
+            row = conn.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE thread_id = ? AND safer_value = ? "
+                f"AND status IN (?, ?, ?) AND updated > ? ORDER BY created LIMIT 1",
+                (thread_id, safer_value, *ACTIVE, now - stale_after)
+            ).fetchone()
+            if row is not None:
+                conn.execute("COMMIT")
+                return self._row_to_job(row), False
+            job = _new_job(thread_id, thread_url, safer_value)
+            conn.execute(
+                f"INSERT INTO jobs ({', '.join(self.COLUMNS)}) VALUES ({', '.join('?' * len(self.COLUMNS))})",
+                tuple(job[column] for column in self.COLUMNS)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return job, True
+
+    def get(self, job_id):
+        row = self._connect().execute(
+            f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        return self._row_to_job(row) if row is not None else None
+
+    def update(self, job_id, **fields):
+        if 'stats' in fields:
+            fields['stats'] = json.dumps(fields['stats'], separators=(',', ':'))
+        fields['updated'] = time.time()
+        assignments = ', '.join(f"{name} = ?" for name in fields)
+        try:
+            self._connect().execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+        except sqlite3.Error as e:
+            logger.error(f"Job update failed: {str(e)}")
+
+    def claim(self, stale_after):
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE status = ? "
+                f"OR (status IN (?, ?) AND updated < ?) ORDER BY created LIMIT 1",
+                (QUEUED, FETCHING, SCORING, now - stale_after)
+            ).fetchone()
+            if row is not None:
+                conn.execute("UPDATE jobs SET status = ?, updated = ? WHERE id = ?", (FETCHING, now, row[0]))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        job = self._row_to_job(row)
+        job.update(status=FETCHING, updated=now)
+        return job
+
+
+class JobQueue:
+    """
+    Runs analysis jobs on a small pool of worker threads.
+
+    Workers are started on the first submission in each process and pick up
+    jobs from the store, polling it so that jobs queued by other processes
+    sharing a SQLite store are run too.
+    """
+
+    def __init__(self, app, store, workers=2, poll_interval=0.5, stale_after=300):
+        """
+        Initialize the queue.
+
+        Args:
+            app: Flask application the jobs run in
+            store: MemoryJobStore or SQLiteJobStore holding the job records
+            workers: Number of worker threads per process
+            poll_interval: Seconds between checks of the store for new jobs
+            stale_after: Seconds without progress after which an active job is
+                considered abandoned (e.g. its process died) and run again
+        """
+        self.app = app
+        self.store = store
+        self.workers = max(1, int(workers))
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self._reset()
+
+    @classmethod
+    def from_app(cls, app):
+        """Create a queue from the application's JOB_* settings."""
+        config = app.config
+        max_age = config.get('JOB_RESULT_TTL', 3600)
+        processes = config.get('WORKER_PROCESSES', 1)
+        backend = config.get('JOB_BACKEND') or ('sqlite' if processes > 1 else 'memory')
+        if backend == 'memory' and processes > 1:
+            logger.warning(
+                f"JOB_BACKEND=memory with {processes} worker processes: job status requests that reach "
+                "another worker get a 404, set JOB_BACKEND=sqlite"
+            )
+        if backend == 'sqlite':
+            path = config.get('JOB_SQLITE_PATH') or os.path.join(app.instance_path, 'redtox-jobs.sqlite3')
+            store = SQLiteJobStore(path, max_age)
+        else:
+            store = MemoryJobStore(max_age)
+        return cls(app, store, workers=config.get('JOB_WORKERS', 2), stale_after=config.get('JOB_STALE_AFTER', 300))
+
+    def _reset(self):
+        """(Re)initialize worker state for the current process."""
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._threads = []
+        self._counters = {'submitted': 0, 'deduplicated': 0, 'completed': 0, 'failed': 0}
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                logger.info("Process fork detected, restarting job workers")
+                self._reset()
+            if not self._threads:
+                for index in range(self.workers):
+                    thread = threading.Thread(target=self._work, name=f"analysis-job-{index}", daemon=True)
+                    thread.start()
+                    self._threads.append(thread)
+
+    def submit(self, thread_id, thread_url=None):
+        """
+        Queue an analysis of a thread, sharing an active job for the same thread.
+
+        Returns:
+            tuple: (job dict, whether a new job was created)
+        """
+        safer_value = self.app.config.get('SAFER_VALUE', 0.02)
+        job, created = self.store.create(thread_id, thread_url, safer_value, self.stale_after)
+        self._ensure_started()
+        with self._lock:
+            self._counters['submitted'] += 1
+            if not created:
+                self._counters['deduplicated'] += 1
+        if created:
+            logger.info(f"Queued analysis job {job['id']} for thread {thread_id}")
+            self._wake.set()
+        return job, created
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    def _work(self):
+        while True:
+            try:
+                job = self.store.claim(self.stale_after)
+            except Exception as e:
+                logger.error(f"Failed to claim an analysis job: {str(e)}")
+                job = None
+            if job is None:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+            self._run(job)
+
+    def _run(self, job):
+        """
+        Fetch and score a job's thread, recording progress in the store.
+
+        The analysis goes through the app's analysis_flights like the
+        thread pages', so a job and a concurrent request for the same thread
+        share one analysis; a job that waits for a request's analysis reports
+        no progress until it is done.
+        """
+        job_id = job['id']
+        thread_id = job['thread_id']
+        safer_value = job['safer_value']
+        started = time.monotonic()
+        with self.app.app_context():
+            try:
+                analysis_store = self.app.extensions['analysis_store']
+                detector = ToxicityDetector()
+
+                def analyze():
+                    thread_data = get_thread_data(thread_id=thread_id)
+                    comments = thread_data['comments']
+                    total = len(comments)
+                    self.store.update(job_id, status=SCORING, done=0, total=total)
+
+                    snapshot = analysis_store.load_snapshot(thread_id, safer_value)
+                    report_every = max(1, total // 20)
+                    for done, _ in enumerate(detector.iter_analyze_comments(comments, snapshot, thread_id=thread_id), 1):
+                        if done % report_every == 0 and done < total:
+                            self.store.update(job_id, done=done)
+                    analysis_store.save(thread_id, safer_value, thread_data['metadata'], comments, snapshot)
+                    return thread_data['metadata'], comments, snapshot
+
+                def recheck():
+                    # Another worker process has probably stored the thread
+                    entry = analysis_store.load(thread_id, safer_value)
+                    return (entry['metadata'], entry['comments'], None) if entry is not None else None
+
+                _, comments, snapshot = self.app.extensions['analysis_flights'].do(
+                    (thread_id, safer_value), analyze, recheck=recheck)
+                # The comments may be shared with requests classifying them at their own threshold
+                comments = copy_comments(comments)
+                if snapshot is None:
+                    stats = detector.reclassify(comments)
+                else:
+                    stats = detector.reclassify(comments, score_stats=snapshot.stats)
+                    stats.update(snapshot.counts())
+
+                total = len(comments)
+                self.store.update(job_id, status=DONE, done=total, total=total, stats=stats)
+                with self._lock:
+                    self._counters['completed'] += 1
+                logger.info(f"Analysis job {job_id} done: {total} comments in {time.monotonic() - started:.1f}s")
+            except Exception as e:
+                self.store.update(job_id, status=FAILED, error=str(e))
+                with self._lock:
+                    self._counters['failed'] += 1
+                logger.error(f"Analysis job {job_id} failed: {str(e)}")
+
+    def stats(self):
+        """Return job counters for this process."""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['workers'] = len(self._threads)
+        return stats
@@ -0,0 +1,153 @@
+"""
+Logging setup for the application and its hot paths.
+
+``configure_logging`` puts a queue handler on the root logger: a request
+thread checks the level, merges the message with its arguments and puts the
+record on a queue, and a ``QueueListener`` thread formats and writes it, so
+log I/O never runs on a request thread. Records are formatted lazily
+(``logger.info("... %s", x)``), so nothing is formatted for a disabled level.
+
+With LOG_FORMAT=json every record is one JSON object, including the
+structured fields passed as ``extra={'fields': {...}}``, e.g. the summary
+logged once per analyzed thread. ``sample_comment`` picks the comments that
+get a per-comment debug record (LOG_COMMENT_SAMPLE_RATE).
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+from flask.logging import default_handler
+
+# The listener of the current process and the handler feeding it
+_listener = None
+_queue_handler = None
+# Settings the root logger was last configured with, and the handler installed then
+_configured = None
+# Renders a queued record's traceback before its frames are dropped
+_exception_formatter = logging.Formatter()
+
+
+class LazyQueueHandler(QueueHandler):
+    """Queue handler that leaves formatting to the listener thread."""
+
+    def prepare(self, record):
+        # QueueHandler runs the whole formatter here, on the caller's thread;
+        # only the message is merged, so the record doesn't log arguments in
+        # the state they have later on the listener thread, or keep them alive
+        # while it waits in the queue. The same goes for a traceback's frames.
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = _exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with the record's structured fields as keys."""
+
+    def format(self, record):
+        data = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        data.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data['exc_info'] = record.exc_text
+        return json.dumps(data, default=str)
+
+
+def _restart_listener():
+    """Start a new listener in a forked worker, whose copy of the listener thread doesn't run."""
+    global _listener
+    if _listener is None:
+        return
+    handlers = _listener.handlers
+    records = queue.SimpleQueue()
+    _queue_handler.queue = records
+    _listener = QueueListener(records, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def _stop_listener():
+    # Flush what is still queued at exit
+    if _listener is not None:
+        _listener.stop()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_listener)
+atexit.register(_stop_listener)
+
+
+def configure_logging(app):
+    """
+    Configure the root logger from the app's LOG_* settings.
+
+    Only the first call in a process sets up the handlers; later apps with
+    the same settings (tests, several entry points) just reuse them.
+
+    Args:
+        app: Flask application whose config holds LOG_LEVEL, LOG_FORMAT and LOG_QUEUE
+    """
+    global _listener, _queue_handler, _configured
+    config = app.config
+    log_level = getattr(logging, config.get('LOG_LEVEL', 'INFO'))
+    settings = (log_level, config.get('LOG_FORMAT', 'text'), config.get('LOG_QUEUE', True), config.get('DEBUG', False))
+    root_logger = logging.getLogger()
+    if _configured is not None and _configured[0] == settings and _configured[1] in root_logger.handlers:
+        _configure_app_logger(app, log_level)
+        return
+
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setLevel(log_level)
+    if config.get('LOG_FORMAT', 'text') == 'json':
+        console_handler.setFormatter(JsonFormatter())
+    elif config.get('DEBUG', False):
+        console_handler.setFormatter(logging.Formatter('API DEBUG: %(levelname)s: %(message)s'))
+    else:
+        console_handler.setFormatter(logging.Formatter('API INFO: %(levelname)s: %(message)s'))
+
+    # Clear existing handlers (and a previous app's listener) to avoid duplicate messages
+    for handler in root_logger.handlers[:]:
+        root_logger.removeHandler(handler)
+    _stop_listener()
+    _listener = _queue_handler = None
+
+    if config.get('LOG_QUEUE', True):
+        records = queue.SimpleQueue()
+        _queue_handler = LazyQueueHandler(records)
+        _listener = QueueListener(records, console_handler, respect_handler_level=True)
+        _listener.start()
+        root_logger.addHandler(_queue_handler)
+    else:
+        root_logger.addHandler(console_handler)
+    root_logger.setLevel(log_level)
+    _configured = (settings, root_logger.handlers[-1])
+
+    # Only reduce werkzeug noise in production
+    if not config.get('DEBUG', False):
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    _configure_app_logger(app, log_level)
+
+
+def _configure_app_logger(app, log_level):
+    # Set Flask logger level; its records (and those of the app.* module loggers
+    # below it) go to the root handler, not to a handler of Flask's own
+    app.logger.setLevel(log_level)
+    app.logger.removeHandler(default_handler)
+
+
+def sample_comment(logger, rate):
+    """Whether to log a debug record for this comment: rate is the fraction of comments logged."""
+    return rate > 0 and logger.isEnabledFor(logging.DEBUG) and (rate >= 1 or random.random() < rate)
@@ -0,0 +1,359 @@
+"""
+Request and hot-path instrumentation.
+
+``Metrics`` keeps counters and latency histograms in process memory:
+per-route request latencies, spans timed around the hot paths (Reddit fetch,
+page parse, moderation calls, scoring, aggregation, template render) and
+upstream error and timeout counts. ``render`` adds counters and gauges read
+from the shared objects' ``stats()`` (cache hits, in-flight calls, queues) and
+returns everything as Prometheus text for GET /metrics. Each worker process
+keeps its own numbers, so scrape every worker or aggregate by instance.
+
+With SERVER_TIMING on, the spans of a request are also summed into its
+``Server-Timing`` header. A streamed page sends its headers before the
+comments are scored, so its header only covers the work done before that.
+
+When METRICS_ENABLED is off no request hooks are installed and ``span``
+returns a shared no-op context manager, so the instrumentation costs an
+attribute lookup and a branch.
+"""
+import bisect
+import contextvars
+import logging
+import threading
+import time
+from contextlib import nullcontext
+
+from flask import current_app, g, has_app_context, request
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+METRIC_HELP = {
+    'redtox_request_duration_seconds': ('histogram', 'Time to serve a request, by route, method and status'),
+    'redtox_span_seconds': ('histogram', 'Time spent in an instrumented step, by span'),
+    'redtox_upstream_errors_total': ('counter', 'Failed upstream calls, by upstream and kind'),
+    'redtox_requests_in_flight': ('gauge', 'Requests being served by this process'),
+}
+
+# (metric family, name label, extension, attribute): objects whose stats() are exported
+STAT_SOURCES = (
+    ('cache', 'scores', 'score_cache', None),
+    ('cache', 'reddit', 'reddit_cache', None),
+    ('cache', 'analysis', 'analysis_store', 'cache'),
+    ('cache', 'known_safe', 'prefilter', 'known_safe'),
+    ('singleflight', 'moderation', 'moderation_flights', None),
+    ('singleflight', 'reddit', 'reddit_flights', None),
+    ('singleflight', 'analysis', 'analysis_flights', None),
+    ('batcher', 'moderation', 'moderation_batcher', None),
+    ('breaker', 'moderation', 'moderation_breaker', None),
+    ('pool', 'moderation', 'moderation_pool', None),
+    ('prefilter', 'local', 'prefilter', None),
+    ('jobs', 'analysis', 'job_queue', None),
+)
+
+# stats() keys that only ever grow, per family: exported as counters named redtox_<family>_<key>_total.
+# Every other number is a gauge.
+STAT_COUNTERS = {
+    'cache': {'hits', 'misses', 'sets', 'evictions', 'expired'},
+    'singleflight': {'leaders', 'coalesced', 'rechecked', 'lock_waits'},
+    'batcher': {'submitted', 'deduplicated', 'batches', 'dispatched', 'calls', 'errors', 'withdrawn'},
+    'breaker': {'opened', 'rejected', 'successes', 'failures'},
+    'pool': {'created', 'rebuilt', 'checkouts'},
+    'prefilter': {'assessed', 'clean', 'toxic', 'uncertain', 'remote_avoided'},
+    'jobs': {'submitted', 'deduplicated', 'completed', 'failed'},
+}
+
+_NULL_SPAN = nullcontext()
+
+# Spans of the request being served in this thread or task, for Server-Timing
+_request_timings = contextvars.ContextVar('redtox_request_timings', default=None)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _label_text(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class RequestTimings:
+    """Total time and count per span for one request; calls on other threads may add to it."""
+
+    __slots__ = ('spans', '_lock')
+
+    def __init__(self):
+        self.spans = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            total = self.spans.setdefault(name, [0.0, 0])
+            total[0] += seconds
+            total[1] += 1
+
+    def header(self, total=None):
+        """Server-Timing header value, e.g. 'reddit_fetch;dur=120.4, moderation;dur=912.0;desc="20 calls"'."""
+        with self._lock:
+            spans = list(self.spans.items())
+        parts = []
+        for name, (seconds, count) in spans:
+            part = f"{name};dur={seconds * 1000:.1f}"
+            if count > 1:
+                part += f';desc="{count} calls"'
+            parts.append(part)
+        if total is not None:
+            parts.append(f"total;dur={total * 1000:.1f}")
+        return ', '.join(parts)
+
+
+class _Span:
+    """Context manager timing one block into a Metrics span."""
+
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.record_span(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _LatencyHistogram:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+
+class Metrics:
+    """Counters and latency histograms of one process, rendered as Prometheus text."""
+
+    def __init__(self, enabled=True, server_timing=False, buckets=LATENCY_BUCKETS):
+        """
+        Initialize the registry.
+
+        Args:
+            enabled: Whether anything is recorded
+            server_timing: Whether responses get a Server-Timing header
+            buckets: Upper bounds in seconds of the latency histogram buckets
+        """
+        self.enabled = enabled
+        self.server_timing = enabled and server_timing
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._in_flight = 0
+
+    @classmethod
+    def from_config(cls, config):
+        """Create a registry from the METRICS_ENABLED and SERVER_TIMING settings."""
+        return cls(
+            enabled=config.get('METRICS_ENABLED', True),
+            server_timing=config.get('SERVER_TIMING', False),
+        )
+
+    def init_app(self, app):
+        """Time every request of the app; nothing is installed when disabled."""
+        if not self.enabled:
+            return
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def inc(self, name, amount=1, **labels):
+        """Add to a counter."""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, seconds, **labels):
+        """Record a duration in a latency histogram."""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _LatencyHistogram(self.buckets)
+            histogram.counts[index] += 1
+            histogram.sum += seconds
+            histogram.count += 1
+
+    def span(self, name):
+        """Context manager timing a block as the named span."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def record_span(self, name, seconds, timings=None):
+        """
+        Record a span timed by the caller.
+
+        Args:
+            name: Span name
+            seconds: Its duration
+            timings: RequestTimings to add it to, defaults to the current
+                request's; pass the one from ``request_timings()`` when the
+                span ends on another thread
+        """
+        if not self.enabled:
+            return
+        self.observe('redtox_span_seconds', seconds, span=name)
+        if timings is None:
+            timings = _request_timings.get()
+        if timings is not None:
+            timings.add(name, seconds)
+
+    @staticmethod
+    def request_timings():
+        """The current request's RequestTimings, or None without Server-Timing."""
+        return _request_timings.get()
+
+    def upstream_error(self, upstream, kind):
+        """Count a failed call to Reddit or the moderation API ('timeout', 'error', ...)."""
+        self.inc('redtox_upstream_errors_total', upstream=upstream, kind=kind)
+
+    def _before_request(self):
+        g.metrics_start = time.perf_counter()
+        with self._lock:
+            self._in_flight += 1
+        if self.server_timing:
+            _request_timings.set(RequestTimings())
+
+    def _after_request(self, response):
+        g.metrics_status = response.status_code
+        timings = _request_timings.get()
+        if timings is not None:
+            response.headers['Server-Timing'] = timings.header(time.perf_counter() - g.metrics_start)
+        return response
+
+    def _teardown_request(self, exc):
+        # Runs once a streamed response has been sent as well
+        start = g.pop('metrics_start', None)
+        if start is None:
+            return
+        with self._lock:
+            self._in_flight -= 1
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        status = g.pop('metrics_status', 500)
+        self.observe('redtox_request_duration_seconds', time.perf_counter() - start,
+                     route=route, method=request.method, status=status)
+        _request_timings.set(None)
+
+    def render(self, extensions=None):
+        """
+        Render every metric in the Prometheus text exposition format.
+
+        Args:
+            extensions: app.extensions, whose STAT_SOURCES are exported as counters and gauges
+        """
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                ((key, (list(h.counts), h.sum, h.count)) for key, h in self._histograms.items()),
+                key=lambda item: item[0]
+            )
+            in_flight = self._in_flight
+
+        lines = []
+        described = set()
+
+        def describe(name, metric_type=None, help_text=None):
+            if name in described:
+                return
+            described.add(name)
+            known_type, known_help = METRIC_HELP.get(name, (metric_type or 'untyped', help_text))
+            if known_help:
+                lines.append(f"# HELP {name} {known_help}")
+            lines.append(f"# TYPE {name} {known_type}")
+
+        describe('redtox_requests_in_flight')
+        lines.append(f"redtox_requests_in_flight {in_flight}")
+        for (name, labels), (counts, total, count) in histograms:
+            describe(name, 'histogram')
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_label_text(labels + (('le', _number(bound)),))} {cumulative}")
+            lines.append(f"{name}_sum{_label_text(labels)} {_number(total)}")
+            lines.append(f"{name}_count{_label_text(labels)} {count}")
+        for (name, labels), value in counters:
+            describe(name, 'counter')
+            lines.append(f"{name}{_label_text(labels)} {_number(value)}")
+        if extensions is not None:
+            for name, (metric_type, samples) in self._stat_samples(extensions).items():
+                describe(name, metric_type)
+                lines.extend(samples)
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _stat_samples(extensions):
+        """
+        Counters and gauges from the stats() of the shared caches, single-flight groups, batcher and so on.
+
+        Returns:
+            dict: Metric name -> (metric type, sample lines), since each metric's samples must be listed together
+        """
+        samples = {}
+        for family, label, extension, attribute in STAT_SOURCES:
+            source = extensions.get(extension)
+            if source is not None and attribute is not None:
+                source = getattr(source, attribute, None)
+            if source is None or not hasattr(source, 'stats'):
+                continue
+            try:
+                stats = source.stats()
+            except Exception as e:
+                logger.warning(f"Could not read {family} '{label}' stats: {str(e)}")
+                continue
+            counters = STAT_COUNTERS.get(family, ())
+            for key, value in stats.items():
+                if isinstance(value, (int, float)):
+                    if key in counters:
+                        name, metric_type = f"redtox_{family}_{key}_total", 'counter'
+                    else:
+                        name, metric_type = f"redtox_{family}_{key}", 'gauge'
+                    sample = f"{name}{_label_text((('name', label),))} {_number(+value)}"
+                elif isinstance(value, str):
+                    # e.g. the circuit breaker's state
+                    name, metric_type = f"redtox_{family}_{key}", 'gauge'
+                    sample = f"{name}{_label_text((('name', label), (key, value)))} 1"
+                else:
+                    continue
+                samples.setdefault(name, (metric_type, []))[1].append(sample)
+        return samples
+
+
+_DISABLED = Metrics(enabled=False)
+
+
+def current_metrics():
+    """The application's Metrics, or a disabled registry outside an application context."""
+    if has_app_context():
+        return current_app.extensions.get('metrics', _DISABLED)
+    return _DISABLED
@@ -0,0 +1,279 @@
+"""
+Process-wide pool of warmed Friendly_Text_Moderation clients.
+
+Creating a ``gradio_client.Client`` performs several HTTP round trips to the
+Hugging Face Space, so clients are built once per worker process and checked
+out/in around each API call instead of being rebuilt for every request.
+
+With MODERATION_BACKEND=http the pool holds ``HttpModerationClient``s
+instead, which call a plain HTTP endpoint with the same response (e.g. the
+offline stand-in in benchmarks.standins).
+"""
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import partial
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(RuntimeError):
+    """Raised when no moderation client becomes available in time."""
+
+
+class PooledClient:
+    """A moderation client plus the bookkeeping the pool needs to manage it."""
+
+    __slots__ = ('client', 'created_at', 'last_used', 'failures')
+
+    def __init__(self, client):
+        self.client = client
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.failures = 0
+
+
+def default_client_factory(space):
+    """Build a gradio client for the given Space name or URL."""
+    from gradio_client import Client
+    return Client(space, verbose=False)
+
+
+class HttpModerationClient:
+    """
+    Client for an HTTP endpoint that answers like the Space's /fetch_toxicity_level.
+
+    ``predict`` POSTs {"msg": text, "safer": safer_value} to <url><api_name>
+    and returns (None, JSON result string), the shape the gradio client
+    returns without the plot.
+    """
+
+    def __init__(self, url, timeout=30):
+        """
+        Initialize the client.
+
+        Args:
+            url: Base URL of the endpoint
+            timeout: Seconds to wait for a response
+        """
+        self.src = url.rstrip('/')
+        self.timeout = timeout
+        self._session = requests.Session()
+
+    def predict(self, msg, safer, api_name='/fetch_toxicity_level'):
+        response = self._session.post(f"{self.src}{api_name}", json={'msg': msg, 'safer': safer},
+                                      timeout=self.timeout)
+        response.raise_for_status()
+        return None, response.text
+
+
+class ModerationClientPool:
+    """
+    Thread-safe pool of moderation API clients.
+
+    Clients are created lazily (or up front via ``warm``) up to ``size``.
+    Idle clients that have not been used for ``max_idle`` seconds are
+    health-checked on checkout and transparently rebuilt if the probe fails.
+    """
+
+    def __init__(self, space, size=4, checkout_timeout=30, max_idle=300,
+                 health_check_timeout=5, client_factory=None):
+        """
+        Initialize the pool.
+
+        Args:
+            space: Hugging Face Space name or URL of the moderation API
+            size: Maximum number of clients kept by this process
+            checkout_timeout: Seconds to wait for a free client
+            max_idle: Idle seconds after which a client is health-checked
+            health_check_timeout: Timeout for the health probe request
+            client_factory: Callable taking ``space`` and returning a client
+        """
+        self.space = space
+        self.size = max(1, int(size))
+        self.checkout_timeout = checkout_timeout
+        self.max_idle = max_idle
+        self.health_check_timeout = health_check_timeout
+        self.client_factory = client_factory or default_client_factory
+        self._reset()
+
+    @classmethod
+    def from_config(cls, config):
+        """Create a pool from a Flask config mapping."""
+        backend = config.get('MODERATION_BACKEND', 'gradio')
+        client_factory = None
+        if backend == 'http':
+            client_factory = partial(HttpModerationClient, timeout=config.get('MODERATION_CALL_TIMEOUT', 20))
+        elif backend != 'gradio':
+            logger.warning(f"Unknown MODERATION_BACKEND '{backend}', using the gradio client")
+        return cls(
+            space=config.get('MODERATION_SPACE', 'duchaba/Friendly_Text_Moderation'),
+            size=config.get('MODERATION_POOL_SIZE', 4),
+            checkout_timeout=config.get('MODERATION_POOL_TIMEOUT', 30),
+            max_idle=config.get('MODERATION_CLIENT_MAX_IDLE', 300),
+            client_factory=client_factory,
+        )
+
+    def _reset(self):
+        """(Re)initialize pool state for the current process."""
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._idle = []
+        self._created = 0
+        self._rebuilt = 0
+        self._checkouts = 0
+
+    def _check_pid(self):
+        """Drop clients inherited from a parent process after a fork."""
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    logger.info("Process fork detected, resetting moderation client pool")
+                    self._reset()
+
+    def _build(self):
+        """Create a new pooled client."""
+        logger.info(f"Initializing moderation client for {self.space}")
+        start = time.monotonic()
+        entry = PooledClient(self.client_factory(self.space))
+        with self._lock:
+            self._created += 1
+        logger.info(f"Moderation client ready in {time.monotonic() - start:.2f}s")
+        return entry
+
+    def _is_healthy(self, entry):
+        """Probe an idle client's Space to confirm it is still reachable."""
+        src = getattr(entry.client, 'src', None)
+        if not src:
+            return True
+        try:
+            response = requests.head(src, timeout=self.health_check_timeout)
+            return response.status_code < 500
+        except requests.RequestException:
+            return False
+
+    def checkout(self, timeout=None):
+        """
+        Take a client out of the pool, creating or rebuilding one if needed.
+
+        Args:
+            timeout: Seconds to wait for a free slot, defaults to checkout_timeout
+
+        Returns:
+            PooledClient: The checked-out client entry
+        """
+        self._check_pid()
+        timeout = self.checkout_timeout if timeout is None else timeout
+        if not self._slots.acquire(timeout=timeout):
+            raise PoolTimeoutError(f"No moderation client available after {timeout}s")
+
+        try:
+            with self._lock:
+                entry = self._idle.pop() if self._idle else None
+                self._checkouts += 1
+
+            if entry is not None and entry.failures:
+                entry = self._rebuild(entry, "previous call failed")
+            elif entry is not None and time.monotonic() - entry.last_used > self.max_idle:
+                if not self._is_healthy(entry):
+                    entry = self._rebuild(entry, "health check failed")
+
+            return entry if entry is not None else self._build()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def checkin(self, entry, failed=False):
+        """
+        Return a client to the pool.
+
+        Args:
+            entry: The PooledClient previously returned by checkout
+            failed: Whether the last call on this client raised an error
+        """
+        if self._pid != os.getpid():
+            return
+        entry.last_used = time.monotonic()
+        entry.failures = entry.failures + 1 if failed else 0
+        with self._lock:
+            self._idle.append(entry)
+        self._slots.release()
+
+    def _rebuild(self, entry, reason):
+        """Replace a stale client with a fresh one."""
+        logger.warning(f"Rebuilding moderation client: {reason}")
+        with self._lock:
+            self._rebuilt += 1
+        return self._build()
+
+    @contextmanager
+    def client(self, timeout=None):
+        """Context manager yielding a checked-out gradio client."""
+        entry = self.checkout(timeout)
+        failed = False
+        try:
+            yield entry.client
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.checkin(entry, failed=failed)
+
+    def predict(self, *args, **kwargs):
+        """
+        Call ``predict`` on a pooled client.
+
+        If the call fails, the client is rebuilt and the call retried once so
+        that a stale connection does not drop the request. If the retry fails
+        too, the API itself is failing: the fresh client goes back to the pool
+        as it is rather than being rebuilt again on its next checkout.
+        """
+        entry = self.checkout()
+        try:
+            result = entry.client.predict(*args, **kwargs)
+        except Exception as e:
+            try:
+                entry = self._rebuild(entry, f"call failed ({e})")
+            except Exception:
+                self.checkin(entry, failed=True)
+                raise
+            try:
+                result = entry.client.predict(*args, **kwargs)
+            finally:
+                self.checkin(entry)
+            return result
+        self.checkin(entry)
+        return result
+
+    def warm(self, count=None):
+        """
+        Pre-create clients so the first requests do not pay for the handshake.
+
+        Args:
+            count: Number of clients to create, defaults to the pool size
+        """
+        count = min(self.size, count or self.size)
+        entries = []
+        try:
+            for _ in range(count):
+                entries.append(self.checkout())
+        finally:
+            for entry in entries:
+                self.checkin(entry)
+        return len(entries)
+
+    def stats(self):
+        """Return pool counters."""
+        with self._lock:
+            return {
+                'size': self.size,
+                'created': self._created,
+                'rebuilt': self._rebuilt,
+                'idle': len(self._idle),
+                'checkouts': self._checkouts,
+            }
@@ -0,0 +1,246 @@
+"""
+Cheap first tier of the tiered scoring pipeline.
+
+Most Reddit comments are plainly benign, so before anything is sent to the
+moderation API each text goes through in-process checks, cheapest first:
+
+1. Known-safe texts: common replies, and texts the API already scored as clean.
+2. A keyword automaton over the lexicon terms. It matches obfuscated spellings
+   ("1d1ot", "s.t.u.p.i.d") that the lexicon scorer's tokenizer misses.
+3. Length and character heuristics: texts without letters, and very short
+   texts without keywords.
+4. The local lexicon score, compared with the configured confidence band.
+
+Each text comes out 'clean', 'toxic' or 'uncertain'. Only uncertain texts
+need the remote model. A clean text's score is capped below ``clean_below``,
+so its result stays clean when it is classified again at another threshold.
+Given the request's threshold, a verdict that its score would contradict at
+that threshold is left to the remote model instead.
+"""
+import hashlib
+import logging
+import re
+import threading
+from collections import deque
+
+from app.cache import normalize_text
+
+logger = logging.getLogger(__name__)
+
+CLEAN = 'clean'
+TOXIC = 'toxic'
+UNCERTAIN = 'uncertain'
+
+# Replies common enough to skip scoring outright (compared after normalization)
+COMMON_SAFE_REPLIES = frozenset([
+    'thanks', 'thank you', 'thanks!', 'thank you!', 'ty', 'lol', 'lmao', 'haha', 'this', 'this.',
+    'same', 'same here', 'agreed', 'agreed.', 'i agree', 'yes', 'no', 'yep', 'nope', 'ok', 'okay',
+    '+1', 'source?', 'nice', 'nice!', 'cool', 'wow', 'exactly', 'exactly.', 'true', 'so true',
+    'underrated comment', 'came here to say this', 'username checks out', 'happy cake day!',
+    '[deleted]', '[removed]',
+])
+
+_LEET = str.maketrans({'0': 'o', '1': 'i', '3': 'e', '4': 'a', '5': 's', '7': 't', '@': 'a', '$': 's', '!': 'i'})
+_NON_WORD_RE = re.compile(r"[^a-z' ]+")
+_SPACES_RE = re.compile(r'\s+')
+_REPEAT_RE = re.compile(r'(.)\1{2,}')
+_LETTER_RE = re.compile(r'[^\W\d_]')
+
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton finding every keyword occurrence in one pass over a text."""
+
+    def __init__(self, keywords):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [()]
+        for keyword in keywords:
+            self._add(keyword)
+        self._build()
+
+    def _add(self, keyword):
+        state = 0
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(())
+            state = next_state
+        self._output[state] = self._output[state] + (keyword,)
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                candidate = self._goto[fail].get(char, 0)
+                self._fail[next_state] = candidate if candidate != next_state else 0
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def find(self, text):
+        """Return the keywords occurring in text, in order of their end position."""
+        found = []
+        state = 0
+        goto, fail, output = self._goto, self._fail, self._output
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found.extend(output[state])
+        return found
+
+
+class Decision:
+    """Outcome of the prefilter for one text."""
+
+    __slots__ = ('verdict', 'reason', 'result', 'keywords')
+
+    def __init__(self, verdict, reason, result, keywords=()):
+        self.verdict = verdict
+        self.reason = reason
+        self.result = result
+        self.keywords = keywords
+
+
+class Prefilter:
+    """
+    Decides confidently clean or toxic texts locally.
+
+    Texts whose local score falls below ``clean_below`` (and contain no
+    keyword) are clean. Texts scoring above ``toxic_above`` are toxic.
+    Everything else is uncertain and should be confirmed remotely.
+    """
+
+    def __init__(self, local_scorer, clean_below=0.2, toxic_above=0.9, short_words=2,
+                 known_safe=None, extra_keywords=()):
+        """
+        Initialize the prefilter.
+
+        Args:
+            local_scorer: LocalLexiconScorer providing scores and keywords
+            clean_below: Local scores below this are clean
+            toxic_above: Local scores above this are toxic
+            short_words: Texts with at most this many words and no keyword are clean
+            known_safe: Cache of texts the remote model scored as clean
+            extra_keywords: Keywords to match in addition to the lexicon terms
+        """
+        self.local_scorer = local_scorer
+        self.clean_below = clean_below
+        self.toxic_above = toxic_above
+        self.short_words = short_words
+        self.known_safe = known_safe
+
+        keywords = set(local_scorer.vocabulary) | set(extra_keywords)
+        # Word-bounded matches on the normalized text, plus squashed matches for
+        # longer keywords so that spaced or dotted spellings are caught too
+        self._words = KeywordAutomaton(f" {keyword} " for keyword in keywords)
+        self._squashed = KeywordAutomaton(k for k in keywords if ' ' not in k and len(k) >= 5)
+
+        self._lock = threading.Lock()
+        self._counters = {'assessed': 0, CLEAN: 0, TOXIC: 0, UNCERTAIN: 0}
+        self._reasons = {}
+
+    @classmethod
+    def from_config(cls, config, local_scorer, known_safe=None):
+        """Create a prefilter from a Flask config mapping."""
+        return cls(
+            local_scorer,
+            clean_below=config.get('LOCAL_CONFIRM_LOW', 0.2),
+            toxic_above=config.get('LOCAL_CONFIRM_HIGH', 0.9),
+            short_words=config.get('PREFILTER_SHORT_WORDS', 2),
+            known_safe=known_safe,
+        )
+
+    @staticmethod
+    def _known_safe_key(text, safer_value):
+        digest = hashlib.sha256(normalize_text(text).lower().encode('utf-8')).hexdigest()
+        return f"{safer_value}:{digest}"
+
+    def is_known_safe(self, text, safer_value=None):
+        """Whether the text is a common reply or was already scored clean remotely at this safer value."""
+        if normalize_text(text).lower() in COMMON_SAFE_REPLIES:
+            return True
+        return self.known_safe is not None and self.known_safe.get(self._known_safe_key(text, safer_value)) is not None
+
+    def remember(self, text, result, safer_value=None):
+        """Record a remote result so identical clean texts skip the model next time."""
+        if self.known_safe is not None and result.get('categories') and result.get('score', 1) < self.clean_below:
+            self.known_safe.set(self._known_safe_key(text, safer_value), 1)
+
+    def keywords(self, text):
+        """Keywords found in the text, including obfuscated spellings."""
+        lowered = _REPEAT_RE.sub(r'\1\1', text.lower().translate(_LEET))
+        words = ' ' + _SPACES_RE.sub(' ', _NON_WORD_RE.sub(' ', lowered)).strip() + ' '
+        found = [keyword.strip() for keyword in self._words.find(words)]
+        squashed = _REPEAT_RE.sub(r'\1\1', words.replace(' ', '').replace("'", ''))
+        found.extend(self._squashed.find(squashed))
+        return tuple(dict.fromkeys(found))
+
+    def assess_batch(self, texts, safer_value=None, threshold=None):
+        """
+        Assess several non-empty texts.
+
+        Args:
+            texts (list): Texts to assess
+            safer_value (float): Safer value of the remote results remembered as known safe
+            threshold (float): Threshold the results will be classified at; a
+                verdict the result's score contradicts at it becomes uncertain
+
+        Returns:
+            list: A Decision per text; result holds the local scorer's result,
+                its score capped below clean_below for clean texts
+        """
+        local_results = self.local_scorer.score_batch(texts)
+        decisions = []
+        for text, result in zip(texts, local_results):
+            decision = self._decide(text, result, safer_value)
+            if decision.verdict == CLEAN:
+                result['score'] = min(result['score'], self.clean_below)
+            if threshold is not None and decision.verdict != UNCERTAIN and \
+                    (result['score'] >= threshold) != (decision.verdict == TOXIC):
+                decision = Decision(UNCERTAIN, 'threshold', result, decision.keywords)
+            decision.result['source'] = 'prefilter'
+            decisions.append(decision)
+
+        with self._lock:
+            self._counters['assessed'] += len(decisions)
+            for decision in decisions:
+                self._counters[decision.verdict] += 1
+                self._reasons[decision.reason] = self._reasons.get(decision.reason, 0) + 1
+        return decisions
+
+    def _decide(self, text, result, safer_value=None):
+        if self.is_known_safe(text, safer_value):
+            return Decision(CLEAN, 'known_safe', result)
+
+        score = result['score']
+        if score > self.toxic_above:
+            return Decision(TOXIC, 'high_score', result)
+
+        keywords = self.keywords(text)
+        if keywords:
+            return Decision(UNCERTAIN, 'keyword', result, keywords)
+        if not _LETTER_RE.search(text):
+            return Decision(CLEAN, 'no_letters', result)
+        if len(text.split()) <= self.short_words:
+            return Decision(CLEAN, 'short', result)
+        if score < self.clean_below:
+            return Decision(CLEAN, 'low_score', result)
+        return Decision(UNCERTAIN, 'band', result)
+
+    def stats(self):
+        """Return decision counters, including how many remote calls were avoided."""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['reasons'] = dict(self._reasons)
+        stats['remote_avoided'] = stats[CLEAN] + stats[TOXIC]
+        stats['avoided_rate'] = stats['remote_avoided'] / stats['assessed'] if stats['assessed'] else 0
+        return stats
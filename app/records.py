@@ -0,0 +1,534 @@
+"""
+Compact columnar storage of scored comments.
+
+A scored comment is a dict holding a nested toxicity dict with an 11-key
+categories dict: a dozen small objects per comment, slow to serialize for a
+big thread. ``ScoredThread`` keeps a thread's comments column by column
+instead: NumPy arrays for the numbers, including a comments x categories
+score matrix, and UTF-8 blobs with offsets for the strings. ``to_bytes``
+writes the columns as aligned raw buffers behind a small JSON header, and
+``from_bytes`` maps them back with ``numpy.frombuffer`` without copying.
+
+The rest of the app and the templates see the comments through
+``CommentRecord`` and ``ToxicityView``, ``__slots__`` views that behave like
+the original dicts. A None value (the parent_id of a top-level comment) is
+marked in a null mask next to the column. Keys the layout does not know, and
+values of another type (an error message), are kept per comment in a JSON
+``extras`` column, so every comment survives the round trip. ``classify``
+and ``score_stats`` work on whole columns and only go comment by comment for
+the rows whose toxicity result has such extras.
+"""
+import copy
+import json
+import struct
+from collections.abc import Mapping, MutableMapping, Sequence
+
+import numpy as np
+
+from app.scorers import CATEGORIES
+from app.stats import Histogram, RunningStats, ScoreStats
+
+MAGIC = b'RTXC'
+FORMAT_VERSION = 2
+# Version 1 had no null masks: its None values are in the extras column
+_READABLE_VERSIONS = (1, 2)
+_PREFIX = struct.Struct('<4sII')  # magic, format version, header length
+_ALIGN = 8
+
+# (key, kind): kind is a NumPy dtype, 'str', 'label' (index into the thread's
+# list of distinct strings), 'toxicity' or 'categories'
+COMMENT_FIELDS = (
+    ('id', 'str'), ('author', 'str'), ('body', 'str'), ('score', '<i8'),
+    ('created_utc', '<i8'), ('permalink', 'str'), ('parent_id', 'str'),
+    ('depth', '<i4'), ('body_hash', 'str'), ('toxicity', 'toxicity'),
+)
+TOXICITY_FIELDS = (
+    ('score', '<f8'), ('flagged', '?'), ('categories', 'categories'), ('max_category', 'label'),
+    ('max_value', '<f8'), ('source', 'label'), ('is_toxic', '?'), ('status', 'label'),
+)
+
+_COMMENT_KINDS = dict(COMMENT_FIELDS)
+_TOXICITY_KINDS = dict(TOXICITY_FIELDS)
+_COMMENT_BITS = {key: 1 << i for i, (key, _) in enumerate(COMMENT_FIELDS)}
+_TOXICITY_BITS = {key: 1 << i for i, (key, _) in enumerate(TOXICITY_FIELDS)}
+_CATEGORY_INDEX = {category: i for i, category in enumerate(CATEGORIES)}
+_INT_RANGES = {'<i4': (-2 ** 31, 2 ** 31 - 1), '<i8': (-2 ** 63, 2 ** 63 - 1)}
+
+# Kinds whose None values are kept in the column's null mask rather than the extras
+_NULLABLE = ('str', 'label', '<i4', '<i8', '<f8', '?')
+
+# Columns classify() writes to; the others stay read-only views of the buffer
+_WRITABLE = ('toxicity.present', 'toxicity.null', 'toxicity.extra', 'toxicity.is_toxic', 'toxicity.status')
+
+
+def _fits(kind, value):
+    """Whether value can be stored in a column of the given kind."""
+    if kind in ('str', 'label'):
+        return isinstance(value, str)
+    if kind in _INT_RANGES:
+        low, high = _INT_RANGES[kind]
+        return type(value) is int and low <= value <= high
+    if kind == '<f8':
+        return type(value) in (int, float)
+    if kind == '?':
+        return type(value) is bool
+    if kind == 'toxicity':
+        return isinstance(value, Mapping)
+    if kind == 'categories':
+        return isinstance(value, Mapping) and all(
+            key in _CATEGORY_INDEX and type(v) in (int, float) for key, v in value.items()
+        )
+    return False
+
+
+def _aligned(offset):
+    return -(-offset // _ALIGN) * _ALIGN
+
+
+def _encode_strings(name, values):
+    """Offsets and UTF-8 blob columns for a list of strings."""
+    encoded = [value.encode('utf-8') for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype='<u4')
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    return {
+        f'{name}.offsets': offsets,
+        f'{name}.data': np.frombuffer(b''.join(encoded), dtype='u1'),
+    }
+
+
+def _add_null_masks(columns):
+    """Empty null masks for a version 1 buffer, flagging the rows with toxicity extras."""
+    n = len(columns['comment.present'])
+    columns['comment.null'] = np.zeros(n, dtype='<u4')
+    columns['toxicity.null'] = np.zeros(n, dtype='<u4')
+    extra = np.zeros(n, dtype='?')
+    offsets = columns['extras.offsets']
+    for row in np.flatnonzero(np.diff(offsets.astype(np.int64)) > 0):
+        row_extras = json.loads(columns['extras.data'][offsets[row]:offsets[row + 1]].tobytes())
+        extra[row] = bool(row_extras['toxicity']) or 'toxicity' in row_extras['comment']
+    columns['toxicity.extra'] = extra
+
+
+class ScoredThread(Sequence):
+    """A thread's scored comments stored column by column."""
+
+    def __init__(self, columns, labels):
+        """
+        Initialize the thread.
+
+        Args:
+            columns: Column name -> NumPy array, as built by from_comments
+            labels: Distinct strings the 'label' columns index into
+        """
+        self.columns = columns
+        self.labels = list(labels)
+        self._label_index = {label: i for i, label in enumerate(self.labels)}
+        # Row -> {'comment': {...}, 'toxicity': {...}}, decoded from the extras column on first use
+        self._extras = {}
+
+    @classmethod
+    def from_comments(cls, comments):
+        """Build the columns from comment dicts with a 'toxicity' field."""
+        n = len(comments)
+        columns = {
+            'comment.present': np.zeros(n, dtype='<u4'),
+            'comment.null': np.zeros(n, dtype='<u4'),
+            'toxicity.present': np.zeros(n, dtype='<u4'),
+            'toxicity.null': np.zeros(n, dtype='<u4'),
+            # Rows whose toxicity result is not entirely in the columns
+            'toxicity.extra': np.zeros(n, dtype='?'),
+            'toxicity.categories': np.zeros((n, len(CATEGORIES)), dtype='<f8'),
+            'toxicity.category_mask': np.zeros(n, dtype='<u4'),
+        }
+        strings = {}
+        for key, kind in COMMENT_FIELDS:
+            if kind == 'str':
+                strings[f'comment.{key}'] = [''] * n
+            elif kind != 'toxicity':
+                columns[f'comment.{key}'] = np.zeros(n, dtype=kind)
+        for key, kind in TOXICITY_FIELDS:
+            if kind == 'label':
+                columns[f'toxicity.{key}'] = np.full(n, -1, dtype='<i2')
+            elif kind != 'categories':
+                columns[f'toxicity.{key}'] = np.zeros(n, dtype=kind)
+
+        thread = cls(columns, [])
+        extras = [''] * n
+        for row, comment in enumerate(comments):
+            row_extras = {'comment': {}, 'toxicity': {}}
+            present = 0
+            nulls = 0
+            for key, value in comment.items():
+                kind = _COMMENT_KINDS.get(key)
+                if value is None and kind in _NULLABLE:
+                    present |= _COMMENT_BITS[key]
+                    nulls |= _COMMENT_BITS[key]
+                    continue
+                if kind is None or not _fits(kind, value):
+                    row_extras['comment'][key] = value
+                    continue
+                present |= _COMMENT_BITS[key]
+                if kind == 'str':
+                    strings[f'comment.{key}'][row] = value
+                elif kind == 'toxicity':
+                    thread._fill_toxicity(row, value, row_extras['toxicity'])
+                else:
+                    columns[f'comment.{key}'][row] = value
+            columns['comment.present'][row] = present
+            columns['comment.null'][row] = nulls
+            columns['toxicity.extra'][row] = bool(row_extras['toxicity']) or 'toxicity' in row_extras['comment']
+            if row_extras['comment'] or row_extras['toxicity']:
+                extras[row] = json.dumps(row_extras, separators=(',', ':'))
+        for name, values in strings.items():
+            columns.update(_encode_strings(name, values))
+        columns.update(_encode_strings('extras', extras))
+        return thread
+
+    def _fill_toxicity(self, row, toxicity, row_extras):
+        present = 0
+        nulls = 0
+        for key, value in toxicity.items():
+            kind = _TOXICITY_KINDS.get(key)
+            if value is None and kind in _NULLABLE:
+                present |= _TOXICITY_BITS[key]
+                nulls |= _TOXICITY_BITS[key]
+                continue
+            if kind is None or not _fits(kind, value):
+                row_extras[key] = value
+                continue
+            present |= _TOXICITY_BITS[key]
+            if kind == 'categories':
+                mask = 0
+                for category, score in value.items():
+                    index = _CATEGORY_INDEX[category]
+                    self.columns['toxicity.categories'][row, index] = score
+                    mask |= 1 << index
+                self.columns['toxicity.category_mask'][row] = mask
+            elif kind == 'label':
+                self.columns[f'toxicity.{key}'][row] = self._label(value)
+            else:
+                self.columns[f'toxicity.{key}'][row] = value
+        self.columns['toxicity.present'][row] = present
+        self.columns['toxicity.null'][row] = nulls
+
+    def _label(self, value):
+        index = self._label_index.get(value)
+        if index is None:
+            index = self._label_index[value] = len(self.labels)
+            self.labels.append(value)
+        return index
+
+    def to_bytes(self, header=None):
+        """
+        Serialize the columns, with a JSON-serializable header such as the thread's metadata.
+
+        Returns:
+            bytes: The prefix, the JSON layout and header, then each column's
+                raw buffer at an 8-byte aligned offset
+        """
+        columns = dict(self.columns)
+        if self._extras:
+            columns.update(_encode_strings('extras', [self._extras_json(row) for row in range(len(self))]))
+        layout = []
+        size = 0
+        for name, array in columns.items():
+            size = _aligned(size)
+            layout.append([name, array.dtype.str, list(array.shape), size])
+            size += array.nbytes
+        meta = json.dumps(
+            {'labels': self.labels, 'columns': layout, 'header': header or {}},
+            separators=(',', ':')
+        ).encode('utf-8')
+        start = _aligned(_PREFIX.size + len(meta))
+        data = bytearray(start + size)
+        _PREFIX.pack_into(data, 0, MAGIC, FORMAT_VERSION, len(meta))
+        data[_PREFIX.size:_PREFIX.size + len(meta)] = meta
+        for (name, _, _, offset), array in zip(layout, columns.values()):
+            data[start + offset:start + offset + array.nbytes] = np.ascontiguousarray(array).tobytes()
+        return bytes(data)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Map a buffer written by to_bytes, without copying the columns.
+
+        Returns:
+            tuple: (ScoredThread, header)
+
+        Raises:
+            ValueError: If data is not in this format
+        """
+        if len(data) < _PREFIX.size:
+            raise ValueError("Not a scored thread buffer")
+        magic, version, meta_length = _PREFIX.unpack_from(data)
+        if magic != MAGIC or version not in _READABLE_VERSIONS:
+            raise ValueError(f"Unsupported scored thread format {magic!r} v{version}")
+        meta = json.loads(bytes(data[_PREFIX.size:_PREFIX.size + meta_length]))
+        start = _aligned(_PREFIX.size + meta_length)
+        columns = {}
+        for name, dtype, shape, offset in meta['columns']:
+            count = int(np.prod(shape))
+            columns[name] = np.frombuffer(data, dtype=dtype, count=count, offset=start + offset).reshape(shape)
+        if version == 1:
+            _add_null_masks(columns)
+        for name in _WRITABLE:
+            columns[name] = columns[name].copy()
+        return cls(columns, meta['labels']), meta['header']
+
+    def copy(self):
+        """A copy that can be classified without affecting this one; the read-only columns are shared."""
+        columns = dict(self.columns)
+        for name in _WRITABLE:
+            columns[name] = columns[name].copy()
+        thread = ScoredThread(columns, self.labels)
+        thread._extras = copy.deepcopy(self._extras)
+        return thread
+
+    def __len__(self):
+        return len(self.columns['comment.present'])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [CommentRecord(self, row) for row in range(len(self))[index]]
+        return CommentRecord(self, range(len(self))[index])
+
+    def __iter__(self):
+        return (CommentRecord(self, row) for row in range(len(self)))
+
+    @property
+    def scores(self):
+        """Overall score of each comment (0 where missing)."""
+        return self.columns['toxicity.score']
+
+    @property
+    def category_scores(self):
+        """Comments x CATEGORIES score matrix (0 where a comment lacks the category)."""
+        return self.columns['toxicity.categories']
+
+    def _string(self, name, row):
+        offsets = self.columns[f'{name}.offsets']
+        return self.columns[f'{name}.data'][offsets[row]:offsets[row + 1]].tobytes().decode('utf-8')
+
+    def _row_extras(self, row, create=False):
+        extras = self._extras.get(row)
+        if extras is None:
+            encoded = self._string('extras', row)
+            if not encoded and not create:
+                return None
+            extras = self._extras[row] = json.loads(encoded) if encoded else {'comment': {}, 'toxicity': {}}
+        return extras
+
+    def _extras_json(self, row):
+        extras = self._extras.get(row)
+        if extras is None:
+            return self._string('extras', row)
+        return json.dumps(extras, separators=(',', ':')) if extras['comment'] or extras['toxicity'] else ''
+
+    def _fallback_rows(self):
+        """Rows whose toxicity result classify() and score_stats() have to read comment by comment."""
+        return self.columns['toxicity.extra'] | (self.columns['toxicity.null'] != 0)
+
+    def _plain_rows(self, fallback):
+        """Rows with a toxicity result held entirely in the columns."""
+        scored = (self.columns['comment.present'] & ~self.columns['comment.null'] & _COMMENT_BITS['toxicity']) != 0
+        return scored & ~fallback
+
+    def _comment_keys(self, row):
+        present = self.columns['comment.present'][row]
+        keys = [key for key, _ in COMMENT_FIELDS if present & _COMMENT_BITS[key]]
+        extras = self._row_extras(row)
+        return keys + list(extras['comment']) if extras else keys
+
+    def _comment_value(self, row, key):
+        kind = _COMMENT_KINDS.get(key)
+        if kind is not None and self.columns['comment.present'][row] & _COMMENT_BITS[key]:
+            if self.columns['comment.null'][row] & _COMMENT_BITS[key]:
+                return None
+            if kind == 'str':
+                return self._string(f'comment.{key}', row)
+            if kind == 'toxicity':
+                return ToxicityView(self, row)
+            return self.columns[f'comment.{key}'][row].item()
+        extras = self._row_extras(row)
+        if extras is not None and key in extras['comment']:
+            return extras['comment'][key]
+        raise KeyError(key)
+
+    def _toxicity_keys(self, row):
+        present = self.columns['toxicity.present'][row]
+        keys = [key for key, _ in TOXICITY_FIELDS if present & _TOXICITY_BITS[key]]
+        extras = self._row_extras(row)
+        return keys + list(extras['toxicity']) if extras else keys
+
+    def _toxicity_value(self, row, key):
+        kind = _TOXICITY_KINDS.get(key)
+        if kind is not None and self.columns['toxicity.present'][row] & _TOXICITY_BITS[key]:
+            if self.columns['toxicity.null'][row] & _TOXICITY_BITS[key]:
+                return None
+            if kind == 'categories':
+                mask = int(self.columns['toxicity.category_mask'][row])
+                values = self.columns['toxicity.categories'][row]
+                return {category: values[i].item() for i, category in enumerate(CATEGORIES) if mask >> i & 1}
+            value = self.columns[f'toxicity.{key}'][row]
+            return self.labels[value] if kind == 'label' else value.item()
+        extras = self._row_extras(row)
+        if extras is not None and key in extras['toxicity']:
+            return extras['toxicity'][key]
+        raise KeyError(key)
+
+    def _set_toxicity(self, row, key, value):
+        kind = _TOXICITY_KINDS.get(key)
+        present = self.columns['toxicity.present']
+        nulls = self.columns['toxicity.null']
+        column = self.columns.get(f'toxicity.{key}') if kind != 'categories' else None
+        in_column = column is not None and column.flags.writeable and _fits(kind, value)
+        if in_column or (value is None and kind in _NULLABLE):
+            if in_column:
+                column[row] = self._label(value) if kind == 'label' else value
+                nulls[row] &= np.uint32(~_TOXICITY_BITS[key] & 0xFFFFFFFF)
+            else:
+                nulls[row] |= _TOXICITY_BITS[key]
+            present[row] |= _TOXICITY_BITS[key]
+            extras = self._row_extras(row)
+            if extras is not None:
+                extras['toxicity'].pop(key, None)
+            return
+        if kind is not None:
+            present[row] &= np.uint32(~_TOXICITY_BITS[key] & 0xFFFFFFFF)
+        self._row_extras(row, create=True)['toxicity'][key] = value
+        self.columns['toxicity.extra'][row] = True
+
+    def _delete_toxicity(self, row, key):
+        self._toxicity_value(row, key)  # KeyError if missing
+        if key in _TOXICITY_BITS:
+            self.columns['toxicity.present'][row] &= np.uint32(~_TOXICITY_BITS[key] & 0xFFFFFFFF)
+            self.columns['toxicity.null'][row] &= np.uint32(~_TOXICITY_BITS[key] & 0xFFFFFFFF)
+        extras = self._row_extras(row)
+        if extras is not None:
+            extras['toxicity'].pop(key, None)
+
+    def classify(self, threshold):
+        """
+        Set is_toxic on every comment at a threshold, in bulk.
+
+        Applies the same rule as ToxicityDetector.classify: a comment is toxic
+        if it was scored ('ok' status, which is filled in when missing), has
+        categories and its score reaches the threshold.
+
+        Returns:
+            int: The number of toxic comments
+        """
+        present = self.columns['toxicity.present']
+        fallback = self._fallback_rows()
+        plain = self._plain_rows(fallback)
+        status = self.columns['toxicity.status']
+        ok_label = self._label('ok')
+        status[plain & ((present & _TOXICITY_BITS['status']) == 0)] = ok_label
+        scores = np.where(present & _TOXICITY_BITS['score'], self.scores, 0)
+        is_toxic = self.columns['toxicity.is_toxic']
+        is_toxic[plain] = ((status == ok_label) & (self.columns['toxicity.category_mask'] != 0) & (scores >= threshold))[plain]
+        present[plain] |= _TOXICITY_BITS['status'] | _TOXICITY_BITS['is_toxic']
+
+        toxic_count = int(is_toxic[plain].sum())
+        for row in np.flatnonzero(fallback):
+            comment = CommentRecord(self, int(row))
+            if 'toxicity' not in comment:
+                continue
+            toxicity = comment['toxicity']
+            toxicity['is_toxic'] = (
+                toxicity.setdefault('status', 'ok') == 'ok' and bool(toxicity.get('categories'))
+                and toxicity.get('score', 0) >= threshold
+            )
+            toxic_count += toxicity['is_toxic']
+        return toxic_count
+
+    def score_stats(self):
+        """ScoreStats of the comments, computed from the columns."""
+        present = self.columns['toxicity.present']
+        fallback = self._fallback_rows()
+        plain = self._plain_rows(fallback)
+        has_status = (present & _TOXICITY_BITS['status']) != 0
+        ok_label = self._label_index.get('ok', -1)
+        ok = plain & (~has_status | (self.columns['toxicity.status'] == ok_label))
+
+        stats = ScoreStats()
+        stats.unscored = int((plain & ~ok).sum())
+        scores = np.where(present & _TOXICITY_BITS['score'], self.scores, 0.0)[ok]
+        if scores.size:
+            mean = float(scores.mean())
+            stats.scores = RunningStats(int(scores.size), mean, float(((scores - mean) ** 2).sum()))
+            bins = len(stats.histogram.counts)
+            indexes = np.clip((scores * bins).astype(np.int64), 0, bins - 1)
+            stats.histogram = Histogram(np.bincount(indexes, minlength=bins).tolist())
+
+        with_categories = ok & ((present & _TOXICITY_BITS['categories']) != 0)
+        mask = self.columns['toxicity.category_mask']
+        for index, category in enumerate(CATEGORIES):
+            rows = with_categories & ((mask >> index) & 1).astype(bool)
+            count = int(rows.sum())
+            if count:
+                stats.categories[category] = [float(self.category_scores[rows, index].sum()), count]
+        max_values = np.where(present & _TOXICITY_BITS['max_value'], self.columns['toxicity.max_value'], 0.0)
+        max_values = np.where(with_categories, max_values, 0.0)
+        if max_values.size and max_values.max() > 0:
+            row = int(max_values.argmax())
+            has_label = present[row] & _TOXICITY_BITS['max_category']
+            stats.top_category = self.labels[self.columns['toxicity.max_category'][row]] if has_label else None
+            stats.top_category_value = float(max_values[row])
+
+        rest = ScoreStats()
+        for row in np.flatnonzero(fallback):
+            comment = CommentRecord(self, int(row))
+            if 'toxicity' in comment:
+                rest.add(comment['toxicity'])
+        return stats.merge(rest)
+
+
+class CommentRecord(Mapping):
+    """Read-only dict view of one comment of a ScoredThread."""
+
+    __slots__ = ('_thread', '_row')
+
+    def __init__(self, thread, row):
+        self._thread = thread
+        self._row = row
+
+    def __getitem__(self, key):
+        return self._thread._comment_value(self._row, key)
+
+    def __iter__(self):
+        return iter(self._thread._comment_keys(self._row))
+
+    def __len__(self):
+        return len(self._thread._comment_keys(self._row))
+
+    def __repr__(self):
+        return f"CommentRecord({dict(self)!r})"
+
+
+class ToxicityView(MutableMapping):
+    """Dict view of one comment's toxicity result; classification can update it."""
+
+    __slots__ = ('_thread', '_row')
+
+    def __init__(self, thread, row):
+        self._thread = thread
+        self._row = row
+
+    def __getitem__(self, key):
+        return self._thread._toxicity_value(self._row, key)
+
+    def __setitem__(self, key, value):
+        self._thread._set_toxicity(self._row, key, value)
+
+    def __delitem__(self, key):
+        self._thread._delete_toxicity(self._row, key)
+
+    def __iter__(self):
+        return iter(self._thread._toxicity_keys(self._row))
+
+    def __len__(self):
+        return len(self._thread._toxicity_keys(self._row))
+
+    def __repr__(self):
+        return f"ToxicityView({dict(self)!r})"
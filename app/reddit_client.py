@@ -1,13 +1,151 @@
 """
 Reddit scraping client for fetching thread and comment data without using the Reddit API.
 """
+import os
 import re
 import json
+import logging
+import threading
 import time
-from datetime import datetime
+from datetime import datetime, timezone
 import requests
-from bs4 import BeautifulSoup
 from flask import current_app
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from app.metrics import current_metrics
+from app.thread_parser import (
+    ThreadPageParser, comment_id_from_class, insert_replies, more_stub_from_onclick,
+    parse_more_children, parse_thread_json, parse_thread_page
+)
+
+logger = logging.getLogger(__name__)
+
+REDDIT_BASE_URL = 'https://old.reddit.com'
+
+# Most children IDs Reddit accepts in one morechildren call
+MORE_CHILDREN_BATCH = 100
+
+# Subreddit listings: sort orders, time windows of 'top' and 'controversial',
+# and the most threads Reddit returns per page
+LISTING_SORTS = ('hot', 'new', 'top', 'rising', 'controversial')
+LISTING_TIME_FILTERS = ('hour', 'day', 'week', 'month', 'year', 'all')
+LISTING_PAGE_SIZE = 100
+
+# Shared HTTP session so connections to Reddit are kept alive between requests
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+class RetryWithCappedWait(Retry):
+    """Retry policy that honors Retry-After but never waits longer than max_retry_after."""
+    
+    max_retry_after = 30
+    
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, self.max_retry_after)
+
+def create_session(config):
+    """
+    Create a pooled HTTP session for Reddit requests.
+    
+    Args:
+        config: Flask config with REDDIT_POOL_SIZE and retry settings
+        
+    Returns:
+        requests.Session with connection pooling and retry/backoff on 429/5xx
+    """
+    retry = RetryWithCappedWait(
+        total=config.get('REDDIT_MAX_RETRIES', 3),
+        backoff_factor=config.get('REDDIT_RETRY_BACKOFF', 0.5),
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(['GET']),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    retry.max_retry_after = config.get('REDDIT_MAX_RETRY_AFTER', 30)
+    pool_size = config.get('REDDIT_POOL_SIZE', 10)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+def get_session():
+    """Get the process-wide Reddit session, creating a new one after a fork."""
+    global _session, _session_pid
+    if _session is None or _session_pid != os.getpid():
+        with _session_lock:
+            if _session is None or _session_pid != os.getpid():
+                _session = create_session(current_app.config)
+                _session_pid = os.getpid()
+    return _session
+
+def _copy_thread_data(thread_data):
+    """Copy cached thread data so callers can annotate comments freely."""
+    return {
+        'metadata': dict(thread_data['metadata']),
+        'comments': [dict(comment) for comment in thread_data['comments']],
+        'more': [dict(stub, children=list(stub['children'])) for stub in thread_data.get('more', [])]
+    }
+
+class FetchBudget:
+    """
+    Upper bound on the work spent fetching one thread.
+    
+    Limits the number of comments kept, the reply depth, the number of
+    upstream requests (the thread page plus "load more" calls) and the
+    wall-clock time since the fetch started.
+    """
+    
+    def __init__(self, max_comments=20, max_depth=10, max_calls=6, deadline=30):
+        """
+        Initialize the budget.
+        
+        Args:
+            max_comments: Maximum number of comments to collect
+            max_depth: Deepest reply level to keep (0 is top-level)
+            max_calls: Maximum number of requests to Reddit
+            deadline: Seconds after which no new request is started
+        """
+        self.max_comments = max_comments
+        self.max_depth = max_depth
+        self.max_calls = max_calls
+        self.deadline = deadline
+        self.started = time.monotonic()
+        self.calls = 0
+    
+    @classmethod
+    def from_config(cls, config):
+        """Create a budget from a Flask config mapping."""
+        return cls(
+            max_comments=config.get('REDDIT_COMMENT_LIMIT', 20),
+            max_depth=config.get('REDDIT_MAX_DEPTH', 10),
+            max_calls=config.get('REDDIT_MAX_CALLS', 6),
+            deadline=config.get('REDDIT_FETCH_DEADLINE', 30),
+        )
+    
+    def elapsed(self):
+        """Seconds since the fetch started."""
+        return time.monotonic() - self.started
+    
+    def remaining_time(self):
+        """Seconds left before the deadline."""
+        return max(0.0, self.deadline - self.elapsed())
+    
+    def can_call(self):
+        """Whether another upstream request fits in the budget."""
+        return self.calls < self.max_calls and self.remaining_time() > 0
+    
+    def spend_call(self):
+        """Record an upstream request."""
+        self.calls += 1
+    
+    def timeout(self, default):
+        """Request timeout that does not overrun the deadline."""
+        return max(0.5, min(default, self.remaining_time()))
 
 def get_reddit_headers():
     """Get headers for Reddit requests."""
@@ -20,6 +158,22 @@ def get_reddit_headers():
         'Cache-Control': 'max-age=0',
     }
 
+def rate_limit_delay():
+    """
+    Reserve a slot for one request to Reddit under REDDIT_RATE_LIMIT.
+    
+    Returns:
+        float: Seconds to wait before sending the request
+    """
+    limiter = current_app.extensions.get('reddit_rate_limiter')
+    return limiter.reserve() if limiter is not None else 0.0
+
+def wait_for_rate_limit():
+    """Block until REDDIT_RATE_LIMIT allows another request to Reddit."""
+    delay = rate_limit_delay()
+    if delay > 0:
+        time.sleep(delay)
+
 def extract_thread_id(url):
     """Extract the thread ID from a Reddit URL."""
     # Match patterns like https://www.reddit.com/r/subreddit/comments/abcdef/...
@@ -29,16 +183,21 @@ def extract_thread_id(url):
         return match.group(1)
     return None
 
-def get_thread_data(thread_id=None, thread_url=None):
+def get_thread_data(thread_id=None, thread_url=None, budget=None):
     """
     Retrieve data for a Reddit thread including comments by scraping Reddit.
     
+    Comments come back in page order with 'parent_id' and 'depth'. "load
+    more comments" stubs are expanded until the budget runs out. Concurrent
+    requests for the same thread with the default budget share one fetch.
+    
     Args:
         thread_id: The Reddit thread ID
         thread_url: The full Reddit thread URL
+        budget: FetchBudget bounding the work, defaults to the configured one
         
     Returns:
-        Dict containing thread data and comments
+        Dict containing thread data, comments and the stubs left unexpanded
     """
     if thread_url and not thread_id:
         thread_id = extract_thread_id(thread_url)
@@ -48,36 +207,572 @@ def get_thread_data(thread_id=None, thread_url=None):
     if not thread_id:
         raise ValueError("Either thread_id or thread_url must be provided")
     
-    # Construct the URL with old.reddit.com which is easier to scrape
-    url = f"https://old.reddit.com/r/all/comments/{thread_id}/"
+    flights = current_app.extensions.get('reddit_flights')
+    if budget is None and flights is not None:
+        # Every caller gets its own copy to annotate
+        return _copy_thread_data(flights.do(thread_id, lambda: _get_thread_data(thread_id)))
+    return _get_thread_data(thread_id, budget)
+
+def _get_thread_data(thread_id, budget=None):
+    """Fetch a thread and expand its "load more comments" stubs."""
+    if budget is None:
+        budget = FetchBudget.from_config(current_app.config)
+    
+    backend = current_app.config.get('REDDIT_BACKEND', 'html')
+    thread_data = None
+    if backend == 'json':
+        try:
+            thread_data = fetch_thread(thread_id, 'json', budget)
+        except ValueError as e:
+            logger.warning("JSON listing unavailable, falling back to HTML: %s", e)
+    if thread_data is None:
+        thread_data = fetch_thread(thread_id, 'html', budget)
+    
+    return expand_more_comments(thread_id, thread_data, budget)
+
+def fetch_subreddit_listing(subreddit, sort='top', time_filter='day', limit=100):
+    """
+    List a subreddit's threads the way its front page sorts them.
+    
+    Pages through /r/<subreddit>/<sort>.json, LISTING_PAGE_SIZE threads per
+    request, each request paced by REDDIT_RATE_LIMIT.
+    
+    Args:
+        subreddit: Subreddit name, without the r/ prefix
+        sort: One of LISTING_SORTS
+        time_filter: One of LISTING_TIME_FILTERS; only 'top' and
+            'controversial' listings use it
+        limit: Most threads to return
+        
+    Returns:
+        list: Thread metadata dicts (id, title, author, score, created_utc,
+            permalink, num_comments, subreddit) in listing order
+    """
+    if sort not in LISTING_SORTS:
+        raise ValueError(f"Unknown listing sort: {sort}")
+    if time_filter not in LISTING_TIME_FILTERS:
+        raise ValueError(f"Unknown listing time filter: {time_filter}")
+    
+    url = f"{reddit_base_url()}/r/{subreddit}/{sort}.json"
+    headers = get_reddit_headers()
+    headers['Accept'] = 'application/json'
+    metrics = current_metrics()
+    threads = []
+    seen = set()
+    after = None
+    while len(threads) < limit:
+        params = {'limit': min(LISTING_PAGE_SIZE, limit - len(threads)), 'raw_json': 1}
+        if sort in ('top', 'controversial'):
+            params['t'] = time_filter
+        if after:
+            params['after'] = after
+        
+        logger.debug("Fetching r/%s %s listing after %s", subreddit, sort, after)
+        wait_for_rate_limit()
+        try:
+            with metrics.span('reddit_fetch'):
+                response = get_session().get(
+                    url,
+                    params=params,
+                    headers=headers,
+                    timeout=current_app.config['REDDIT_REQUEST_TIMEOUT']
+                )
+            response.raise_for_status()
+            listing = json.loads(response.content)['data']
+            children = listing['children']
+        except requests.RequestException as e:
+            metrics.upstream_error('reddit', 'timeout' if isinstance(e, requests.Timeout) else 'error')
+            raise ValueError(f"Failed to retrieve r/{subreddit} listing: {str(e)}")
+        except (KeyError, IndexError, TypeError, json.JSONDecodeError) as e:
+            metrics.upstream_error('reddit', 'parse')
+            raise ValueError(f"Failed to parse r/{subreddit} listing: {str(e)}")
+        
+        for child in children:
+            post = child.get('data') or {}
+            if child.get('kind') != 't3' or not post.get('id') or post['id'] in seen:
+                continue
+            seen.add(post['id'])
+            threads.append({
+                'id': post['id'],
+                'title': post.get('title', "[Unknown Title]"),
+                'author': post.get('author', "[deleted]"),
+                'score': int(post.get('score') or 0),
+                'created_utc': int(post.get('created_utc') or 0),
+                'permalink': post.get('permalink') or f"/r/{subreddit}/comments/{post['id']}/",
+                'num_comments': int(post.get('num_comments') or 0),
+                'subreddit': post.get('subreddit', subreddit),
+            })
+        after = listing.get('after')
+        if not after or not children:
+            break
+    
+    logger.info("Listed %d threads of r/%s (%s, %s)", len(threads[:limit]), subreddit, sort, time_filter)
+    return threads[:limit]
+
+def reddit_base_url():
+    """Where Reddit is fetched from: old.reddit.com, unless REDDIT_BASE_URL points elsewhere."""
+    return current_app.config.get('REDDIT_BASE_URL', REDDIT_BASE_URL).rstrip('/')
+
+def get_thread_url(thread_id, backend='html'):
+    """Build the old.reddit.com URL for a thread's HTML page or JSON listing."""
+    if backend == 'json':
+        return f"{reddit_base_url()}/comments/{thread_id}.json?raw_json=1"
+    # old.reddit.com is easier to scrape than the redesign
+    return f"{reddit_base_url()}/r/all/comments/{thread_id}/"
+
+def _validator_key(url, backend, budget):
+    """
+    Cache key for a thread's validators and parsed copy.
+    
+    The copy only holds what the budget's comment and depth limits let
+    through, so it is reused for a 304 response to a fetch with the same
+    limits and backend only.
+    """
+    return f"{url}#{backend}:{budget.max_comments}:{budget.max_depth}"
+
+def _thread_request(thread_id, backend, budget):
+    """
+    Build the URL and headers for fetching a thread, revalidating a cached copy.
+    
+    Returns:
+        tuple: (url, headers, validator cache key, cached validator entry or None)
+    """
+    url = get_thread_url(thread_id, backend)
+    headers = get_reddit_headers()
+    if backend == 'json':
+        headers['Accept'] = 'application/json'
+    key = _validator_key(url, backend, budget)
+    validator_cache = current_app.extensions.get('reddit_cache')
+    cached = validator_cache.get(key) if validator_cache is not None else None
+    if cached:
+        if cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
+    return url, headers, key, cached
+
+def _remember_validators(key, response_headers, thread_data):
+    """Remember a response's validators so the next fetch can be a conditional request."""
+    validator_cache = current_app.extensions.get('reddit_cache')
+    etag = response_headers.get('ETag')
+    last_modified = response_headers.get('Last-Modified')
+    if validator_cache is not None and (etag or last_modified):
+        validator_cache.set(key, {
+            'etag': etag,
+            'last_modified': last_modified,
+            'thread_data': _copy_thread_data(thread_data)
+        })
+
+def _parse_thread(content, thread_id, backend, budget, encoding='utf-8'):
+    """
+    Parse a downloaded thread page or JSON listing.
+    
+    Args:
+        content: Response body, or an iterable of chunks for the streaming HTML parser
+        thread_id: The Reddit thread ID
+        backend: 'html' or 'json'
+        budget: FetchBudget supplying the comment and depth limits
+        encoding: Character encoding of an HTML page
+    """
+    limit = budget.max_comments
+    if backend == 'json':
+        if not isinstance(content, bytes):
+            content = b''.join(content)
+        return parse_thread_json(content, thread_id, limit=limit, base_url=REDDIT_BASE_URL, max_depth=budget.max_depth)
+    if current_app.config.get('REDDIT_HTML_PARSER', 'stream') == 'stream':
+        # Parse while downloading and stop once enough comments are found
+        return parse_thread_page(content, thread_id, limit=limit, encoding=encoding, max_depth=budget.max_depth)
+    
+    # Parse the HTML; BeautifulSoup is only imported when this parser is used
+    from bs4 import BeautifulSoup
+    if not isinstance(content, bytes):
+        content = b''.join(content)
+    soup = BeautifulSoup(content.decode(encoding, errors='replace'), 'lxml')
+    
+    # Extract thread metadata and comments
+    comments = extract_comments_from_html(soup, limit=limit, max_depth=budget.max_depth)
+    return {
+        'metadata': get_thread_metadata(soup, thread_id),
+        'comments': comments,
+        'more': extract_more_stubs(soup, budget.max_depth) if len(comments) < limit else []
+    }
+
+def fetch_thread(thread_id, backend='html', budget=None):
+    """
+    Fetch and parse a thread with one ingestion backend.
+    
+    Args:
+        thread_id: The Reddit thread ID
+        backend: 'html' to scrape the thread page, 'json' to read the JSON listing
+        budget: FetchBudget supplying the comment and depth limits
+        
+    Returns:
+        Dict containing thread data, comments and "load more" stubs
+    """
+    if budget is None:
+        budget = FetchBudget.from_config(current_app.config)
+    url, headers, key, cached = _thread_request(thread_id, backend, budget)
     
     # Log the request
-    current_app.logger.info(f"Making request to Reddit: {url}")
+    logger.debug("Making request to Reddit: %s", url)
     
     # Make the request
+    metrics = current_metrics()
+    budget.spend_call()
+    wait_for_rate_limit()
     try:
-        response = requests.get(
-            url, 
-            headers=get_reddit_headers(),
-            timeout=current_app.config['REDDIT_REQUEST_TIMEOUT']
-        )
-        response.raise_for_status()
-        current_app.logger.info(f"Successfully retrieved Reddit thread: {thread_id}")
+        with metrics.span('reddit_fetch'):
+            response = get_session().get(
+                url, 
+                headers=headers,
+                timeout=budget.timeout(current_app.config['REDDIT_REQUEST_TIMEOUT']),
+                stream=True
+            )
+        # Closing returns the connection to the pool, whether or not the body was read
+        with response:
+            if response.status_code == 304 and cached:
+                logger.debug("Reddit thread not modified, reusing parsed copy: %s", thread_id)
+                return _copy_thread_data(cached['thread_data'])
+            response.raise_for_status()
+            logger.debug("Successfully retrieved Reddit thread: %s", thread_id)
+            
+            # The body is downloaded while it is parsed
+            with metrics.span('parse'):
+                thread_data = _parse_thread(
+                    response.iter_content(chunk_size=64 * 1024), thread_id, backend, budget, response.encoding or 'utf-8'
+                )
     except requests.RequestException as e:
-        current_app.logger.error(f"Error fetching Reddit thread: {str(e)}")
+        metrics.upstream_error('reddit', 'timeout' if isinstance(e, requests.Timeout) else 'error')
+        logger.error("Error fetching Reddit thread: %s", e)
         raise ValueError(f"Failed to retrieve Reddit thread: {str(e)}")
+    except (KeyError, IndexError, TypeError, json.JSONDecodeError) as e:
+        metrics.upstream_error('reddit', 'parse')
+        logger.error("Unexpected Reddit %s response: %s", backend, e)
+        raise ValueError(f"Failed to parse Reddit thread: {str(e)}")
     
-    # Parse the HTML
-    soup = BeautifulSoup(response.text, 'lxml')
-    
-    # Extract thread metadata and comments
-    thread_data = {
-        'metadata': get_thread_metadata(soup, thread_id),
-        'comments': extract_comments_from_html(soup)
+    _remember_validators(key, response.headers, thread_data)
+    return thread_data
+
+def _more_children_request(thread_id, stub):
+    """URL, query parameters and headers for one morechildren call."""
+    params = {
+        'api_type': 'json',
+        'link_id': f"t3_{thread_id}",
+        'children': ','.join(stub['children'][:MORE_CHILDREN_BATCH]),
+        'limit_children': 'false',
+        'raw_json': 1,
     }
+    headers = get_reddit_headers()
+    headers['Accept'] = 'application/json'
+    return f"{reddit_base_url()}/api/morechildren.json", params, headers
+
+def fetch_more_children(thread_id, stub, budget):
+    """
+    Fetch one batch of a "load more comments" stub's children.
     
+    Args:
+        thread_id: The Reddit thread ID
+        stub: Stub whose first MORE_CHILDREN_BATCH children are requested
+        budget: FetchBudget the request is charged to
+        
+    Returns:
+        tuple: (comments, more) in tree order
+    """
+    url, params, headers = _more_children_request(thread_id, stub)
+    
+    metrics = current_metrics()
+    budget.spend_call()
+    wait_for_rate_limit()
+    try:
+        with metrics.span('reddit_fetch'):
+            response = get_session().get(
+                url,
+                params=params,
+                headers=headers,
+                timeout=budget.timeout(current_app.config['REDDIT_REQUEST_TIMEOUT'])
+            )
+        response.raise_for_status()
+        with metrics.span('parse'):
+            return parse_more_children(
+                response.content,
+                stub,
+                limit=budget.max_comments,
+                base_url=REDDIT_BASE_URL,
+                max_depth=budget.max_depth
+            )
+    except requests.RequestException as e:
+        metrics.upstream_error('reddit', 'timeout' if isinstance(e, requests.Timeout) else 'error')
+        raise ValueError(f"Failed to load more comments: {str(e)}")
+    except (KeyError, IndexError, TypeError, json.JSONDecodeError) as e:
+        metrics.upstream_error('reddit', 'parse')
+        raise ValueError(f"Failed to parse more comments: {str(e)}")
+
+def _add_replies(comments, pending, stub, replies, more, budget):
+    """Merge one expanded stub's replies into the thread and queue the stubs it left."""
+    replies = replies[:budget.max_comments - len(comments)]
+    insert_replies(comments, stub['parent_id'], replies)
+    
+    # Keep the rest of a large stub, then queue any stubs nested in the replies
+    if len(stub['children']) > MORE_CHILDREN_BATCH:
+        pending.insert(0, dict(stub, children=stub['children'][MORE_CHILDREN_BATCH:]))
+    pending.extend(more)
+    pending.sort(key=lambda item: item['depth'])
+
+def _finish_expansion(thread_id, thread_data, pending, expanded, budget):
+    thread_data['more'] = pending
+    if expanded or pending:
+        fields = {
+            'event': 'thread_expanded', 'thread_id': thread_id, 'stubs_expanded': expanded,
+            'comments': len(thread_data['comments']), 'requests': budget.calls,
+            'duration_ms': round(budget.elapsed() * 1000, 1), 'stubs_left': len(pending),
+        }
+        logger.info("Expanded %d 'load more' stubs for %s: %d comments, %d requests, %.2fs, %d stubs left",
+                    expanded, thread_id, fields['comments'], budget.calls, fields['duration_ms'] / 1000,
+                    len(pending), extra={'fields': fields})
     return thread_data
 
+def expand_more_comments(thread_id, thread_data, budget):
+    """
+    Expand "load more comments" stubs in place until the budget runs out.
+    
+    Shallow stubs are expanded first so the budget covers as many
+    conversations as possible before going deeper into any one of them.
+    
+    Args:
+        thread_id: The Reddit thread ID
+        thread_data: Dict from fetch_thread, updated in place
+        budget: FetchBudget bounding comments, calls and time
+        
+    Returns:
+        The same thread_data, with the stubs left unexpanded under 'more'
+    """
+    comments = thread_data['comments']
+    pending = sorted(thread_data.get('more', []), key=lambda stub: stub['depth'])
+    expanded = 0
+    
+    while pending and len(comments) < budget.max_comments and budget.can_call():
+        stub = pending.pop(0)
+        try:
+            replies, more = fetch_more_children(thread_id, stub, budget)
+        except ValueError as e:
+            logger.warning("Stopping comment expansion for %s: %s", thread_id, e)
+            pending.insert(0, stub)
+            break
+        _add_replies(comments, pending, stub, replies, more, budget)
+        expanded += 1
+    
+    return _finish_expansion(thread_id, thread_data, pending, expanded, budget)
+
+# Async variants for the ASGI app, using a shared httpx.AsyncClient per event loop
+_async_client = None
+_async_client_owner = None
+
+def get_async_client():
+    """Get the process-wide httpx.AsyncClient for the running event loop."""
+    global _async_client, _async_client_owner
+    import asyncio
+    import httpx
+    owner = (os.getpid(), asyncio.get_running_loop())
+    if _async_client is None or _async_client_owner != owner:
+        previous, previous_owner = _async_client, _async_client_owner
+        pool_size = current_app.config.get('REDDIT_POOL_SIZE', 10)
+        _async_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            transport=httpx.AsyncHTTPTransport(retries=1),
+        )
+        _async_client_owner = owner
+        # A forked worker must leave its parent's connections alone
+        if previous is not None and previous_owner[0] == os.getpid():
+            _close_on_loop(previous, previous_owner[1])
+    return _async_client
+
+def _close_on_loop(client, loop):
+    """Close an httpx.AsyncClient on the event loop it was created on."""
+    import asyncio
+    if loop.is_closed():
+        # Its coroutines can no longer run; the connections go with the closed loop
+        return
+    if loop.is_running():
+        asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+    else:
+        loop.run_until_complete(client.aclose())
+
+async def close_async_client():
+    """Close the running event loop's httpx.AsyncClient, e.g. at ASGI lifespan shutdown."""
+    global _async_client, _async_client_owner
+    import asyncio
+    if _async_client is not None and _async_client_owner == (os.getpid(), asyncio.get_running_loop()):
+        client, _async_client, _async_client_owner = _async_client, None, None
+        await client.aclose()
+
+async def _async_get(url, budget, stream=False, **kwargs):
+    """
+    GET a Reddit URL without blocking the event loop.
+    
+    Retries 429 and 5xx responses like the sync session does: exponential
+    backoff, honoring Retry-After up to REDDIT_MAX_RETRY_AFTER, within the
+    budget's remaining time.
+    
+    Returns:
+        httpx.Response, still open when stream is True
+    """
+    import asyncio
+    config = current_app.config
+    client = get_async_client()
+    retries = config.get('REDDIT_MAX_RETRIES', 3)
+    for attempt in range(retries + 1):
+        timeout = budget.timeout(config['REDDIT_REQUEST_TIMEOUT'])
+        request = client.build_request('GET', url, timeout=timeout, **kwargs)
+        response = await client.send(request, stream=True)
+        if response.status_code not in (429, 500, 502, 503, 504) or attempt == retries:
+            if not stream:
+                await response.aread()
+                await response.aclose()
+            return response
+        await response.aclose()
+        
+        retry_after = response.headers.get('Retry-After', '')
+        wait = float(retry_after) if retry_after.isdigit() else config.get('REDDIT_RETRY_BACKOFF', 0.5) * (2 ** attempt)
+        wait = min(wait, config.get('REDDIT_MAX_RETRY_AFTER', 30))
+        remaining = budget.remaining_time()
+        if remaining is not None and wait >= remaining:
+            return response
+        logger.warning("Reddit returned %s, retrying in %.1fs: %s", response.status_code, wait, url)
+        await asyncio.sleep(wait)
+
+async def fetch_thread_async(thread_id, backend='html', budget=None):
+    """Async version of fetch_thread."""
+    import asyncio
+    import httpx
+    if budget is None:
+        budget = FetchBudget.from_config(current_app.config)
+    url, headers, key, cached = _thread_request(thread_id, backend, budget)
+    logger.debug("Making async request to Reddit: %s", url)
+    
+    metrics = current_metrics()
+    budget.spend_call()
+    delay = rate_limit_delay()
+    if delay > 0:
+        await asyncio.sleep(delay)
+    try:
+        with metrics.span('reddit_fetch'):
+            response = await _async_get(url, budget, stream=True, headers=headers)
+        try:
+            if response.status_code == 304 and cached:
+                logger.debug("Reddit thread not modified, reusing parsed copy: %s", thread_id)
+                return _copy_thread_data(cached['thread_data'])
+            response.raise_for_status()
+            logger.debug("Successfully retrieved Reddit thread: %s", thread_id)
+            
+            with metrics.span('parse'):
+                if backend == 'html' and current_app.config.get('REDDIT_HTML_PARSER', 'stream') == 'stream':
+                    # Parse while downloading and stop once enough comments are found
+                    parser = ThreadPageParser(thread_id, budget.max_comments, response.encoding or 'utf-8', budget.max_depth)
+                    async for chunk in response.aiter_bytes(64 * 1024):
+                        if parser.feed(chunk):
+                            break
+                    thread_data = parser.close().result()
+                else:
+                    thread_data = _parse_thread(await response.aread(), thread_id, backend, budget, response.encoding or 'utf-8')
+        finally:
+            await response.aclose()
+    except httpx.HTTPError as e:
+        metrics.upstream_error('reddit', 'timeout' if isinstance(e, httpx.TimeoutException) else 'error')
+        logger.error("Error fetching Reddit thread: %s", e)
+        raise ValueError(f"Failed to retrieve Reddit thread: {str(e)}")
+    except (KeyError, IndexError, TypeError, json.JSONDecodeError) as e:
+        metrics.upstream_error('reddit', 'parse')
+        logger.error("Unexpected Reddit %s response: %s", backend, e)
+        raise ValueError(f"Failed to parse Reddit thread: {str(e)}")
+    
+    _remember_validators(key, response.headers, thread_data)
+    return thread_data
+
+async def fetch_more_children_async(thread_id, stub, budget):
+    """Async version of fetch_more_children."""
+    import asyncio
+    import httpx
+    url, params, headers = _more_children_request(thread_id, stub)
+    metrics = current_metrics()
+    budget.spend_call()
+    delay = rate_limit_delay()
+    if delay > 0:
+        await asyncio.sleep(delay)
+    try:
+        with metrics.span('reddit_fetch'):
+            response = await _async_get(url, budget, params=params, headers=headers)
+        response.raise_for_status()
+        with metrics.span('parse'):
+            return parse_more_children(
+                response.content,
+                stub,
+                limit=budget.max_comments,
+                base_url=REDDIT_BASE_URL,
+                max_depth=budget.max_depth
+            )
+    except httpx.HTTPError as e:
+        metrics.upstream_error('reddit', 'timeout' if isinstance(e, httpx.TimeoutException) else 'error')
+        raise ValueError(f"Failed to load more comments: {str(e)}")
+    except (KeyError, IndexError, TypeError, json.JSONDecodeError) as e:
+        metrics.upstream_error('reddit', 'parse')
+        raise ValueError(f"Failed to parse more comments: {str(e)}")
+
+async def expand_more_comments_async(thread_id, thread_data, budget):
+    """Async version of expand_more_comments."""
+    comments = thread_data['comments']
+    pending = sorted(thread_data.get('more', []), key=lambda stub: stub['depth'])
+    expanded = 0
+    
+    while pending and len(comments) < budget.max_comments and budget.can_call():
+        stub = pending.pop(0)
+        try:
+            replies, more = await fetch_more_children_async(thread_id, stub, budget)
+        except ValueError as e:
+            logger.warning("Stopping comment expansion for %s: %s", thread_id, e)
+            pending.insert(0, stub)
+            break
+        _add_replies(comments, pending, stub, replies, more, budget)
+        expanded += 1
+    
+    return _finish_expansion(thread_id, thread_data, pending, expanded, budget)
+
+async def get_thread_data_async(thread_id=None, thread_url=None, budget=None):
+    """
+    Async version of get_thread_data.
+    
+    Reddit is fetched with httpx, so the event loop can serve other
+    requests while a thread downloads. Parsing still runs on the loop.
+    """
+    if thread_url and not thread_id:
+        thread_id = extract_thread_id(thread_url)
+        if not thread_id:
+            raise ValueError("Invalid Reddit URL format")
+    
+    if not thread_id:
+        raise ValueError("Either thread_id or thread_url must be provided")
+    
+    flights = current_app.extensions.get('reddit_flights')
+    if budget is None and flights is not None:
+        return _copy_thread_data(await flights.do_async(thread_id, lambda: _get_thread_data_async(thread_id)))
+    return await _get_thread_data_async(thread_id, budget)
+
+async def _get_thread_data_async(thread_id, budget=None):
+    """Async version of _get_thread_data."""
+    if budget is None:
+        budget = FetchBudget.from_config(current_app.config)
+    
+    backend = current_app.config.get('REDDIT_BACKEND', 'html')
+    thread_data = None
+    if backend == 'json':
+        try:
+            thread_data = await fetch_thread_async(thread_id, 'json', budget)
+        except ValueError as e:
+            logger.warning("JSON listing unavailable, falling back to HTML: %s", e)
+    if thread_data is None:
+        thread_data = await fetch_thread_async(thread_id, 'html', budget)
+    
+    return await expand_more_comments_async(thread_id, thread_data, budget)
+
 def get_thread_metadata(soup, thread_id):
     """Extract metadata from a Reddit thread HTML."""
     try:
@@ -114,7 +809,7 @@ def get_thread_metadata(soup, thread_id):
         if time_element and time_element.get('datetime'):
             try:
                 datetime_str = time_element.get('datetime')
-                created_utc = int(datetime.strptime(datetime_str, '%Y-%m-%dT%H:%M:%S+00:00').timestamp())
+                created_utc = int(datetime.strptime(datetime_str, '%Y-%m-%dT%H:%M:%S+00:00').replace(tzinfo=timezone.utc).timestamp())
             except (ValueError, TypeError):
                 pass
         
@@ -132,7 +827,7 @@ def get_thread_metadata(soup, thread_id):
             'subreddit': subreddit
         }
     except Exception as e:
-        current_app.logger.error(f"Error extracting thread metadata: {str(e)}")
+        logger.error("Error extracting thread metadata: %s", e)
         return {
             'id': thread_id,
             'title': "Error loading thread",
@@ -144,13 +839,24 @@ def get_thread_metadata(soup, thread_id):
             'subreddit': "unknown"
         }
 
-def extract_comments_from_html(soup, limit=20):
+def _comment_position(element):
+    """Return (parent comment ID, depth) for an element inside the comment tree."""
+    parent = element.find_parent('div', class_='comment')
+    parent_id = comment_id_from_class(' '.join(parent.get('class', []))) if parent else None
+    depth = 0
+    while parent is not None:
+        depth += 1
+        parent = parent.find_parent('div', class_='comment')
+    return parent_id, depth
+
+def extract_comments_from_html(soup, limit=20, max_depth=None):
     """
     Extract comments from Reddit thread HTML.
     
     Args:
         soup: BeautifulSoup object of the thread page
         limit: Maximum number of comments to extract
+        max_depth: Deepest reply level to keep (0 is top-level), None for all
         
     Returns:
         List of comment dictionaries
@@ -169,6 +875,11 @@ def extract_comments_from_html(soup, limit=20):
             # Skip deleted/removed comments
             if 'deleted' in div.get('class', []):
                 continue
+            
+            # Position in the reply tree
+            parent_id, depth = _comment_position(div)
+            if max_depth is not None and depth > max_depth:
+                continue
                 
             # Author
             author_element = div.select_one('a.author')
@@ -182,8 +893,8 @@ def extract_comments_from_html(soup, limit=20):
             if not body or body in ['[deleted]', '[removed]']:
                 continue
                 
-            # Comment score
-            score_element = div.select_one('span.score')
+            # Comment score (logged-out pages also render the +/-1 "likes"/"dislikes" variants)
+            score_element = div.select_one('span.score.unvoted')
             score_text = score_element.get_text(strip=True) if score_element else "0 points"
             score = int(re.search(r'(-?\d+)', score_text).group(1)) if re.search(r'(-?\d+)', score_text) else 0
             
@@ -201,7 +912,7 @@ def extract_comments_from_html(soup, limit=20):
             if time_element and time_element.get('datetime'):
                 try:
                     datetime_str = time_element.get('datetime')
-                    created_utc = int(datetime.strptime(datetime_str, '%Y-%m-%dT%H:%M:%S+00:00').timestamp())
+                    created_utc = int(datetime.strptime(datetime_str, '%Y-%m-%dT%H:%M:%S+00:00').replace(tzinfo=timezone.utc).timestamp())
                 except (ValueError, TypeError):
                     pass
             
@@ -211,13 +922,36 @@ def extract_comments_from_html(soup, limit=20):
                 'body': body,
                 'score': score,
                 'created_utc': created_utc,
-                'permalink': permalink
+                'permalink': permalink,
+                'parent_id': parent_id,
+                'depth': depth
             })
             
             counter += 1
                 
         except Exception as e:
-            current_app.logger.error(f"Error extracting comment: {str(e)}")
+            logger.error("Error extracting comment: %s", e)
             continue
     
-    return comments 
\ No newline at end of file
+    return comments
+
+def extract_more_stubs(soup, max_depth=None):
+    """
+    Extract "load more comments" stubs from Reddit thread HTML.
+    
+    Args:
+        soup: BeautifulSoup object of the thread page
+        max_depth: Deepest reply level to keep (0 is top-level), None for all
+        
+    Returns:
+        List of stubs with 'parent_id', 'depth' and the 'children' IDs to fetch
+    """
+    stubs = []
+    for link in soup.select('a[onclick]'):
+        parent_id, depth = _comment_position(link)
+        if max_depth is not None and depth > max_depth:
+            continue
+        stub = more_stub_from_onclick(link.get('onclick'), parent_id, depth)
+        if stub:
+            stubs.append(stub)
+    return stubs
@@ -0,0 +1,229 @@
+"""
+Failure handling and pacing for calls to the moderation API and Reddit.
+
+- ``CircuitBreaker`` stops sending requests after repeated failures and lets a
+  single probe through once ``reset_timeout`` has passed.
+- ``Deadline`` tracks the time left for a whole request, so that a slow API
+  cannot hold a page for as many call timeouts as it has comments.
+- ``LatencyTracker`` keeps recent call latencies. Hedged requests use its p95
+  to decide when a slow call gets a duplicate.
+- ``RateLimiter`` spaces out requests to Reddit, which throttles clients that
+  send too many, when a scan fetches many threads at once.
+"""
+import logging
+import math
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the API while the circuit is open."""
+
+
+class ScoringTimeout(Exception):
+    """Raised when a moderation call does not finish within its deadline."""
+
+
+class CircuitBreaker:
+    """
+    Closed/open/half-open circuit breaker.
+
+    Closed, calls go through and consecutive failures are counted. After
+    ``failure_threshold`` of them the circuit opens and calls fail at once.
+    Once ``reset_timeout`` seconds have passed it is half-open: one probe call
+    is let through, and its outcome closes or re-opens the circuit.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, name='moderation'):
+        """
+        Initialize the breaker.
+
+        Args:
+            failure_threshold: Consecutive failures that open the circuit
+            reset_timeout: Seconds the circuit stays open before a probe
+            name: Name used in log messages
+        """
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_timeout = reset_timeout
+        self.name = name
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._counters = {'opened': 0, 'rejected': 0, 'successes': 0, 'failures': 0}
+
+    @classmethod
+    def from_config(cls, config):
+        """Create a breaker from a Flask config mapping."""
+        return cls(
+            failure_threshold=config.get('MODERATION_BREAKER_FAILURES', 5),
+            reset_timeout=config.get('MODERATION_BREAKER_RESET', 30),
+        )
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        """State after applying the reset timeout. Caller holds the lock."""
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._probing = False
+        return self._state
+
+    def allow(self):
+        """Whether a call may be made now; counts a rejection if not."""
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                logger.info(f"Circuit '{self.name}' half-open, sending a probe request")
+                return True
+            self._counters['rejected'] += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._counters['successes'] += 1
+            if self._state != self.CLOSED:
+                logger.info(f"Circuit '{self.name}' closed, the API is responding again")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._counters['failures'] += 1
+            self._failures += 1
+            if self._state == self.HALF_OPEN or (self._state == self.CLOSED and self._failures >= self.failure_threshold):
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probing = False
+                self._counters['opened'] += 1
+                logger.warning(f"Circuit '{self.name}' opened after {self._failures} consecutive failures, "
+                               f"retrying in {self.reset_timeout}s")
+
+    def stats(self):
+        """Return the state and counters."""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['state'] = self._current_state()
+            stats['consecutive_failures'] = self._failures
+        return stats
+
+
+class Deadline:
+    """Point in time by which a piece of work must be finished."""
+
+    def __init__(self, seconds=None):
+        """
+        Start the deadline.
+
+        Args:
+            seconds: Time allowed from now, None for no deadline
+        """
+        self.seconds = seconds
+        self.expires = None if seconds is None else time.monotonic() + seconds
+
+    def remaining(self):
+        """Seconds left (never negative), or None without a deadline."""
+        if self.expires is None:
+            return None
+        return max(0.0, self.expires - time.monotonic())
+
+    def expired(self):
+        return self.expires is not None and time.monotonic() >= self.expires
+
+    def timeout(self, limit=None):
+        """The smaller of the time left and limit; either may be None."""
+        remaining = self.remaining()
+        if remaining is None:
+            return limit
+        return remaining if limit is None else min(limit, remaining)
+
+
+class LatencyTracker:
+    """Latencies of the most recent successful calls."""
+
+    def __init__(self, window=200, min_samples=20):
+        """
+        Initialize the tracker.
+
+        Args:
+            window: Number of recent latencies kept
+            min_samples: Samples needed before percentiles are reported
+        """
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q):
+        """The q-th quantile (0-1) of recent latencies, or None with too few samples."""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1)]
+
+
+class RateLimiter:
+    """Token bucket shared by the threads of a process."""
+
+    def __init__(self, rate, burst=1):
+        """
+        Initialize the limiter.
+
+        Args:
+            rate: Requests allowed per second on average
+            burst: Requests allowed back to back after an idle spell
+        """
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        """Limiter for REDDIT_RATE_LIMIT, or None when Reddit requests are not limited."""
+        rate = config.get('REDDIT_RATE_LIMIT', 0)
+        if not rate or rate <= 0:
+            return None
+        return cls(rate, burst=config.get('REDDIT_RATE_BURST', 1))
+
+    def reserve(self):
+        """
+        Take a token, which may only become available in the future.
+
+        Returns:
+            float: Seconds to wait before making the request
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            # A negative balance is the queue of callers already waiting
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def wait(self):
+        """Block until a request may be made."""
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+        return delay
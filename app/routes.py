@@ -1,8 +1,11 @@
 """
 Flask routes for the RedTox application.
 """
-from flask import Blueprint, render_template, request, redirect, url_for, flash, abort, current_app, session, g
-from app.reddit_client import get_thread_data, extract_thread_id
+from flask import Blueprint, Response, render_template, stream_template, request, redirect, url_for, flash, abort, current_app, session, g, jsonify
+from app.analysis_store import copy_comments
+from app.metrics import current_metrics
+from app.stats import ScoreStats
+from app.reddit_client import get_thread_data, get_thread_data_async, extract_thread_id
 from app.toxicity_detector import ToxicityDetector
 
 # Create Blueprint
@@ -12,9 +15,162 @@ main = Blueprint('main', __name__)
 def get_toxicity_detector():
     """Get or create a toxicity detector instance."""
     if 'toxicity_detector' not in g:
-        g.toxicity_detector = ToxicityDetector()
+        g.toxicity_detector = ToxicityDetector(
+            pool=current_app.extensions['moderation_pool'],
+            cache=current_app.extensions['score_cache'],
+            batcher=current_app.extensions.get('moderation_batcher')
+        )
     return g.toxicity_detector
 
+def get_stored_thread(thread_id, toxicity_detector):
+    """
+    Get a thread's stored analysis, classified at the current threshold.
+    
+    Args:
+        thread_id: Reddit thread ID
+        toxicity_detector: Detector whose threshold classifies the comments
+        
+    Returns:
+        tuple: (thread_metadata, comments, toxicity_stats), or None if there
+            is no fresh stored analysis
+    """
+    store = current_app.extensions['analysis_store']
+    entry = store.load(thread_id, current_app.config.get('SAFER_VALUE', 0.02))
+    if entry is None:
+        return None
+    current_app.logger.info(f"Using stored analysis for thread {thread_id} at threshold {toxicity_detector.threshold}")
+    score_stats = ScoreStats.from_dict(entry['score_stats']) if entry.get('score_stats') else None
+    toxicity_stats = toxicity_detector.reclassify(entry['comments'], score_stats=score_stats)
+    return entry['metadata'], entry['comments'], toxicity_stats
+
+def get_scored_thread(thread_id, toxicity_detector, refresh=False):
+    """
+    Get a thread's metadata and scored comments, classified at the current threshold.
+    
+    A fresh entry in the analysis store is reused, so viewing a thread right
+    after analyzing it (or by another visitor) does not fetch or score it again.
+    Concurrent requests for a thread that isn't stored share one analysis,
+    and with SINGLE_FLIGHT_LOCK_DIR set so do other worker processes. A
+    stale stored analysis is the snapshot for the new one: only new and
+    edited comments are scored.
+    
+    Args:
+        thread_id: Reddit thread ID
+        toxicity_detector: Detector whose threshold classifies the comments
+        refresh: Whether to ignore stored results and analyze the thread again
+        
+    Returns:
+        tuple: (thread_metadata, comments, toxicity_stats)
+    """
+    stored = None if refresh else get_stored_thread(thread_id, toxicity_detector)
+    if stored is not None:
+        return stored
+    
+    store = current_app.extensions['analysis_store']
+    safer_value = current_app.config.get('SAFER_VALUE', 0.02)
+    
+    def analyze():
+        thread_data = get_thread_data(thread_id=thread_id)
+        thread_metadata = thread_data['metadata']
+        comments = thread_data['comments']
+        
+        current_app.logger.info(f"Retrieved {len(comments)} comments from thread: {thread_metadata['title']}")
+        
+        snapshot = store.load_snapshot(thread_id, safer_value)
+        analyzed_comments, _ = toxicity_detector.analyze_comments(comments, snapshot, thread_id=thread_id)
+        store.save(thread_id, safer_value, thread_metadata, analyzed_comments, snapshot)
+        return thread_metadata, analyzed_comments, snapshot
+    
+    def recheck():
+        # The worker process we waited for has probably stored the thread
+        entry = store.load(thread_id, safer_value)
+        return (entry['metadata'], entry['comments'], None) if entry is not None else None
+    
+    analysis = current_app.extensions['analysis_flights'].do((thread_id, safer_value), analyze, recheck=recheck)
+    return classify_shared_analysis(analysis, toxicity_detector)
+
+def classify_shared_analysis(analysis, toxicity_detector):
+    """
+    Classify an analysis shared through analysis_flights at the detector's threshold.
+    
+    Args:
+        analysis: (thread_metadata, analyzed_comments, snapshot) as returned
+            by the flight; snapshot is None for an analysis loaded from the store
+        toxicity_detector: Detector whose threshold classifies the comments
+        
+    Returns:
+        tuple: (thread_metadata, comments, toxicity_stats)
+    """
+    thread_metadata, analyzed_comments, snapshot = analysis
+    # The comments may be shared with other requests, each classifying them at its own threshold
+    analyzed_comments = copy_comments(analyzed_comments)
+    if snapshot is None:
+        return thread_metadata, analyzed_comments, toxicity_detector.reclassify(analyzed_comments)
+    toxicity_stats = toxicity_detector.reclassify(analyzed_comments, score_stats=snapshot.stats)
+    toxicity_stats.update(snapshot.counts())
+    return thread_metadata, analyzed_comments, toxicity_stats
+
+class StreamedAnalysis:
+    """
+    Comments that are scored while the thread template iterates over them.
+    
+    Comments that are unchanged since the thread's last analysis keep their
+    stored scores. Once every comment has been yielded, the statistics are
+    available as ``stats`` and the analysis is saved to the analysis store.
+    The stream holds the thread's analysis_flights key, so other requests
+    for the thread wait for it; if the thread is already being analyzed,
+    the comments are yielded once that analysis is done instead.
+    """
+    
+    def __init__(self, thread_id, metadata, comments, toxicity_detector):
+        self.thread_id = thread_id
+        self.metadata = metadata
+        self.comments = comments
+        self.toxicity_detector = toxicity_detector
+        self.stats = None
+    
+    def __iter__(self):
+        store = current_app.extensions['analysis_store']
+        safer_value = current_app.config.get('SAFER_VALUE', 0.02)
+        with current_app.extensions['analysis_flights'].lead((self.thread_id, safer_value)) as call:
+            if call is not None:
+                snapshot = store.load_snapshot(self.thread_id, safer_value)
+                yield from self.toxicity_detector.iter_analyze_comments(self.comments, snapshot, thread_id=self.thread_id)
+                
+                self.stats = self.toxicity_detector.reclassify(self.comments, score_stats=snapshot.stats)
+                self.stats.update(snapshot.counts())
+                store.save(self.thread_id, safer_value, self.metadata, self.comments, snapshot)
+                call.result = (self.metadata, self.comments, snapshot)
+                current_app.logger.info(f"Streamed thread analysis complete. Detected {self.stats['toxic_count']} toxic comments")
+                return
+        
+        # Another request is analyzing the thread; wait for it (or the analysis it stored)
+        _, comments, self.stats = get_scored_thread(self.thread_id, self.toxicity_detector)
+        yield from comments
+
+def stream_thread_view(thread_id, toxicity_detector):
+    """
+    Fetch a thread and stream its page while the comments are being scored.
+    
+    The page shell and metadata are sent first, then each comment as soon as
+    its score is in; the stats are filled in by a script at the end.
+    """
+    thread_data = get_thread_data(thread_id=thread_id)
+    current_app.logger.info(f"Retrieved {len(thread_data['comments'])} comments from thread: {thread_data['metadata']['title']}")
+    
+    analysis = StreamedAnalysis(thread_id, thread_data['metadata'], thread_data['comments'], toxicity_detector)
+    thread_view_data = {
+        'metadata': analysis.metadata,
+        'comments': analysis,
+        'stats': None,
+        'threshold': toxicity_detector.threshold,
+        'streaming': True
+    }
+    response = Response(stream_template('thread.html', thread=thread_view_data), mimetype='text/html')
+    # Stop proxies from buffering the page until it is complete
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @main.before_request
 def before_request():
     """Initialize resources before each request."""
@@ -32,6 +188,7 @@ def analyze():
     # Get thread_url from either form or query parameters
     thread_url = request.form.get('thread_url') if request.method == 'POST' else request.args.get('thread_url')
     threshold = request.args.get('threshold')
+    refresh = request.args.get('refresh') == '1'
     
     if not thread_url:
         flash('Please enter a Reddit thread URL.')
@@ -48,13 +205,6 @@ def analyze():
         
         current_app.logger.info(f"Extracted thread ID: {thread_id}")
         
-        # Get thread data
-        thread_data = get_thread_data(thread_id=thread_id)
-        thread_metadata = thread_data['metadata']
-        comments = thread_data['comments']
-        
-        current_app.logger.info(f"Retrieved {len(comments)} comments from thread: {thread_metadata['title']}")
-        
         # Adjust toxicity threshold if specified
         toxicity_detector = get_toxicity_detector()
         if threshold:
@@ -66,22 +216,31 @@ def analyze():
             except ValueError:
                 pass
         
-        # Analyze comments for toxicity
-        analyzed_comments, toxicity_stats = toxicity_detector.analyze_comments(comments)
+        # Queue threads that aren't analyzed yet instead of scoring them in this request
+        background = request.args.get('background')
+        use_jobs = background == '1' if background is not None else current_app.config.get('ANALYSIS_JOBS', False)
+        if use_jobs:
+            store = current_app.extensions['analysis_store']
+            if refresh or store.load(thread_id, current_app.config.get('SAFER_VALUE', 0.02)) is None:
+                job, _ = current_app.extensions['job_queue'].submit(thread_id, thread_url)
+                return redirect(url_for('main.job_view', job_id=job['id'], threshold=request.args.get('threshold')))
+        
+        # Score the thread, or reuse the stored analysis if it is still fresh
+        _, _, toxicity_stats = get_scored_thread(thread_id, toxicity_detector, refresh=refresh)
         
         current_app.logger.info(f"Analysis complete. Overall toxicity: {toxicity_stats['avg_toxicity']:.2f}")
         
-        # Store data in session for the view page
+        # The full analysis lives in the analysis store; the session only remembers the thread
         session['thread_id'] = thread_id
-        session['toxicity_stats'] = toxicity_stats
         
         # Pass data directly to template
-        return render_template(
-            'results.html', 
-            stats=toxicity_stats,
-            thread_url=thread_url,
-            threshold=toxicity_detector.threshold
-        )
+        with current_metrics().span('render'):
+            return render_template(
+                'results.html', 
+                stats=toxicity_stats,
+                thread_url=thread_url,
+                threshold=toxicity_detector.threshold
+            )
     
     except Exception as e:
         flash(f'Error analyzing thread: {str(e)}')
@@ -93,6 +252,7 @@ def thread_view():
     """Display the thread with toxicity analysis."""
     thread_url = request.args.get('thread_url')
     threshold = request.args.get('threshold')
+    refresh = request.args.get('refresh') == '1'
     toxicity_detector = get_toxicity_detector()
     
     if not thread_url:
@@ -118,19 +278,96 @@ def thread_view():
             flash('Invalid Reddit URL. Please enter a URL to a Reddit thread.')
             return redirect(url_for('main.index'))
         
-        # Get thread data
-        thread_data = get_thread_data(thread_id=thread_id)
-        thread_metadata = thread_data['metadata']
-        comments = thread_data['comments']
+        if current_app.config.get('THREAD_STREAMING', True):
+            # Show a fresh stored analysis at once, otherwise stream the page while scoring
+            stored = None if refresh else get_stored_thread(thread_id, toxicity_detector)
+            if stored is None:
+                return stream_thread_view(thread_id, toxicity_detector)
+            thread_metadata, analyzed_comments, toxicity_stats = stored
+        else:
+            # Render from the stored analysis when fresh, otherwise fetch and score
+            thread_metadata, analyzed_comments, toxicity_stats = get_scored_thread(
+                thread_id, toxicity_detector, refresh=refresh
+            )
+        
+        current_app.logger.info(f"Thread view analysis complete. Detected {toxicity_stats['toxic_count']} toxic comments")
+        
+        # Prepare thread data for rendering
+        thread_view_data = {
+            'metadata': thread_metadata,
+            'comments': analyzed_comments,
+            'stats': toxicity_stats,
+            'threshold': toxicity_detector.threshold
+        }
         
-        current_app.logger.info(f"Retrieved {len(comments)} comments for viewing thread: {thread_metadata['title']}")
+        with current_metrics().span('render'):
+            return render_template('thread.html', thread=thread_view_data)
+    
+    except Exception as e:
+        flash(f'Error loading thread: {str(e)}')
+        current_app.logger.error(f"Error loading thread: {str(e)}")
+        return redirect(url_for('main.index'))
+
+async def thread_view_async():
+    """
+    Async version of thread_view, served natively by the ASGI app (asgi.py).
+    
+    Reddit is fetched with httpx and the moderation calls are awaited, so the
+    event loop can keep serving other requests while this one waits. The page
+    is rendered once every comment is scored rather than streamed, and
+    concurrent requests for a thread share one analysis.
+    """
+    thread_url = request.args.get('thread_url')
+    threshold = request.args.get('threshold')
+    refresh = request.args.get('refresh') == '1'
+    toxicity_detector = get_toxicity_detector()
+    
+    if not thread_url:
+        flash('Thread URL is required.')
+        return redirect(url_for('main.index'))
+    
+    current_app.logger.info(f"Viewing thread (async): {thread_url}")
+    
+    # Adjust toxicity threshold if specified
+    if threshold:
+        try:
+            threshold = float(threshold)
+            if 0 <= threshold <= 1:
+                toxicity_detector.threshold = threshold
+                current_app.logger.info(f"Adjusted toxicity threshold to {threshold}")
+        except ValueError:
+            pass
+    
+    try:
+        # Extract thread ID
+        thread_id = extract_thread_id(thread_url)
+        if not thread_id:
+            flash('Invalid Reddit URL. Please enter a URL to a Reddit thread.')
+            return redirect(url_for('main.index'))
         
-        # Analyze comments for toxicity
-        analyzed_comments, toxicity_stats = toxicity_detector.analyze_comments(comments)
+        stored = None if refresh else get_stored_thread(thread_id, toxicity_detector)
+        if stored is not None:
+            thread_metadata, analyzed_comments, toxicity_stats = stored
+        else:
+            store = current_app.extensions['analysis_store']
+            safer_value = current_app.config.get('SAFER_VALUE', 0.02)
+            
+            async def analyze():
+                thread_data = await get_thread_data_async(thread_id=thread_id)
+                current_app.logger.info(f"Retrieved {len(thread_data['comments'])} comments from thread: {thread_data['metadata']['title']}")
+                snapshot = store.load_snapshot(thread_id, safer_value)
+                analyzed_comments, _ = await toxicity_detector.analyze_comments_async(
+                    thread_data['comments'], snapshot, thread_id=thread_id
+                )
+                store.save(thread_id, safer_value, thread_data['metadata'], analyzed_comments, snapshot)
+                return thread_data['metadata'], analyzed_comments, snapshot
+            
+            # Concurrent requests for the thread on this event loop share one analysis
+            analysis = await current_app.extensions['analysis_flights'].do_async((thread_id, safer_value), analyze)
+            thread_metadata, analyzed_comments, toxicity_stats = classify_shared_analysis(analysis, toxicity_detector)
         
         current_app.logger.info(f"Thread view analysis complete. Detected {toxicity_stats['toxic_count']} toxic comments")
         
-        # Prepare thread data for rendering
         thread_view_data = {
             'metadata': thread_metadata,
             'comments': analyzed_comments,
@@ -138,13 +375,46 @@ def thread_view():
             'threshold': toxicity_detector.threshold
         }
         
-        return render_template('thread.html', thread=thread_view_data)
+        with current_metrics().span('render'):
+            return render_template('thread.html', thread=thread_view_data)
     
     except Exception as e:
         flash(f'Error loading thread: {str(e)}')
         current_app.logger.error(f"Error loading thread: {str(e)}")
         return redirect(url_for('main.index'))
 
+@main.route('/jobs', methods=['POST'])
+def submit_job():
+    """Queue a thread analysis; returns the job and the URL to poll for its status."""
+    payload = request.get_json(silent=True) or {}
+    thread_url = request.form.get('thread_url') or payload.get('thread_url')
+    thread_id = extract_thread_id(thread_url) if thread_url else None
+    if not thread_id:
+        return jsonify({'error': 'A valid Reddit thread URL is required'}), 400
+    
+    job, created = current_app.extensions['job_queue'].submit(thread_id, thread_url)
+    return jsonify({
+        'job': job,
+        'status_url': url_for('main.job_status', job_id=job['id']),
+        'page_url': url_for('main.job_view', job_id=job['id'])
+    }), 202 if created else 200
+
+@main.route('/jobs/<job_id>', methods=['GET'])
+def job_view(job_id):
+    """Show a job's progress; the page moves on to the results when it is done."""
+    job = current_app.extensions['job_queue'].get(job_id)
+    if job is None:
+        abort(404)
+    return render_template('job.html', job=job, threshold=request.args.get('threshold'))
+
+@main.route('/jobs/<job_id>/status', methods=['GET'])
+def job_status(job_id):
+    """Return a job's status as JSON: queued, fetching, scoring (done of total), done or failed."""
+    job = current_app.extensions['job_queue'].get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job)
+
 # Keep the old route for backward compatibility
 @main.route('/view/<thread_id>', methods=['GET'])
 def view_thread(thread_id):
@@ -155,6 +425,14 @@ def view_thread(thread_id):
         url = f"{url}&threshold={threshold}"
     return redirect(url)
 
+@main.route('/metrics', methods=['GET'])
+def metrics():
+    """Expose this process's request, span, upstream and cache metrics in the Prometheus text format."""
+    registry = current_app.extensions['metrics']
+    if not registry.enabled:
+        abort(404)
+    return Response(registry.render(current_app.extensions), mimetype='text/plain; version=0.0.4')
+
 @main.route('/about', methods=['GET'])
 def about():
     """Display information about the RedTox application."""
@@ -0,0 +1,494 @@
+"""
+Toxicity scoring backends used by ToxicityDetector.
+
+Every scorer returns the same raw result schema as the moderation API:
+``score``, ``flagged``, ``categories`` (the 11 moderation categories),
+``max_category`` and ``max_value``, plus ``source`` naming the backend.
+Classification against the threshold is left to the detector.
+
+- ``RemoteScorer`` calls the Friendly_Text_Moderation Space through the
+  client pool, optionally via the shared micro-batcher, guarded by the
+  circuit breaker and per-call timeouts from ``app.resilience``.
+- ``LocalLexiconScorer`` runs on the CPU with no network access, scoring a
+  whole batch of texts with one NumPy matrix product over n-gram weights
+  stored in ``app/data/toxicity_lexicon.json``.
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+from app.cache import score_cache_key
+from app.resilience import CircuitOpenError, ScoringTimeout
+
+logger = logging.getLogger(__name__)
+
+CATEGORIES = (
+    'harassment', 'harassment_threatening', 'hate', 'hate_threatening',
+    'self_harm', 'self_harm_instructions', 'self_harm_intent',
+    'sexual', 'sexual_minors', 'violence', 'violence_graphic',
+)
+
+DEFAULT_LEXICON_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'toxicity_lexicon.json')
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+_REPEAT_RE = re.compile(r'(.)\1{2,}')
+
+
+def _wrap_future(future):
+    """
+    Awaitable view of a concurrent Future whose errors are always retrieved.
+
+    Unlike ``asyncio.wrap_future``, cancelling the view (when the request's
+    task is cancelled, e.g. because the client went away) does not cancel
+    the Future, which the batcher or a single-flight group may share with
+    other requests.
+    """
+    loop = asyncio.get_running_loop()
+    wrapped = loop.create_future()
+    wrapped.add_done_callback(lambda done: done.cancelled() or done.exception())
+
+    def settle(source):
+        if wrapped.done():
+            return
+        if source.cancelled():
+            wrapped.cancel()
+        elif source.exception() is not None:
+            wrapped.set_exception(source.exception())
+        else:
+            wrapped.set_result(source.result())
+
+    def on_done(source):
+        try:
+            loop.call_soon_threadsafe(settle, source)
+        except RuntimeError:
+            # The event loop has been closed; nobody is waiting any more
+            pass
+
+    future.add_done_callback(on_done)
+    return wrapped
+
+
+def fetch_toxicity_json(request):
+    """
+    Score one text with the moderation API.
+
+    The outcome is recorded in the circuit breaker here, once per upstream
+    call, rather than by each request waiting for a shared call.
+
+    Args:
+        request (tuple): (pool, text, safer_value, breaker); breaker may be None
+
+    Returns:
+        str: The API's JSON result string
+    """
+    pool, text, safer_value, breaker = request
+    try:
+        _, json_result = pool.predict(text, safer_value, api_name="/fetch_toxicity_level")
+    except Exception:
+        if breaker is not None:
+            breaker.record_failure()
+        raise
+    if breaker is not None:
+        breaker.record_success()
+    return json_result
+
+
+def parse_moderation_result(json_result):
+    """
+    Convert the moderation API's JSON string into a raw result dict.
+
+    The overall score is the API's sum_value, a sum over the categories that
+    can exceed 1; it is clamped to [0, 1], the range of the threshold and of
+    the score statistics. 'flagged' keeps the API's own verdict, while
+    is_toxic is decided later against our threshold.
+    """
+    result_dict = json.loads(json_result)
+    return {
+        'score': min(1.0, max(0.0, result_dict.get('sum_value', 0))),
+        'flagged': result_dict.get('is_flagged', False) or result_dict.get('is_safer_flagged', False),
+        'categories': {category: result_dict.get(category, 0) for category in CATEGORIES},
+        'max_category': result_dict.get('max_key', 'none'),
+        'max_value': result_dict.get('max_value', 0),
+        'source': 'remote'
+    }
+
+
+class BaseScorer:
+    """Interface shared by the scoring backends."""
+
+    name = 'base'
+
+    def score_batch(self, texts, safer_value):
+        """
+        Score several texts.
+
+        Args:
+            texts (list): Non-empty texts to score
+            safer_value (float): Safer value of the moderation API
+
+        Returns:
+            list: Raw result dicts in input order
+        """
+        raise NotImplementedError
+
+    def score(self, text, safer_value):
+        """Score a single text."""
+        return self.score_batch([text], safer_value)[0]
+
+
+class RemoteScorer(BaseScorer):
+    """
+    Scores texts with the Friendly_Text_Moderation API.
+
+    Every call is made through a Future (the micro-batcher's, or the scorer's
+    own worker threads), so waiting for it can be bounded by a timeout. A call
+    that times out keeps its worker until the gradio client gives up, but the
+    caller moves on. With hedging on, a call still running after the recent
+    p95 latency gets a duplicate, and the first response wins.
+
+    The batcher already shares one call between requests scoring the same
+    text. Without it, direct calls are shared through ``flights``, a
+    SingleFlight keyed by the score cache key.
+
+    With ``metrics``, each call's time from submit to response is recorded
+    as a 'moderation' span, and failed, refused and timed out calls are
+    counted as upstream errors.
+    """
+
+    name = 'remote'
+
+    def __init__(self, pool, batcher=None, concurrency=4, breaker=None, latency=None, hedge=False, flights=None,
+                 metrics=None):
+        """
+        Initialize the scorer.
+
+        Args:
+            pool: ModerationClientPool the API clients are borrowed from
+            batcher: MicroBatcher shared by concurrent requests, None to call directly
+            concurrency: Worker threads for direct calls and hedges
+            breaker: CircuitBreaker shared by the process, None to always call
+            latency: LatencyTracker recording call latencies
+            hedge: Whether to send a duplicate request for calls slower than the p95
+            flights: SingleFlight sharing direct calls for the same text between requests
+            metrics: Metrics recording call durations and errors
+        """
+        self.pool = pool
+        self.batcher = batcher
+        self.concurrency = concurrency
+        self.breaker = breaker
+        self.latency = latency
+        self.hedge = hedge
+        self.flights = flights
+        self.metrics = metrics if metrics is not None and metrics.enabled else None
+        self.hedged = 0
+        self._executor = None
+        self._shared = []
+
+    def _call(self, text, safer_value):
+        """Start an API call on the scorer's own worker threads."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=max(1, self.concurrency), thread_name_prefix='remote-scorer')
+        return self._executor.submit(fetch_toxicity_json, (self.pool, text, safer_value, self.breaker))
+
+    def _direct(self, text, safer_value):
+        """Start an API call, or join the one another request is making for the same text."""
+        if self.flights is None:
+            return self._call(text, safer_value)
+        key = score_cache_key(text, safer_value)
+        future = self.flights.share(key, lambda: self._call(text, safer_value))
+        self._shared.append((key, future))
+        return future
+
+    def submit(self, text, safer_value):
+        """
+        Start scoring a text.
+
+        Returns:
+            Future: Resolves to the API's JSON string. It fails with
+                CircuitOpenError, without calling the API, while the circuit is open.
+        """
+        if self.breaker is not None and not self.breaker.allow():
+            if self.metrics is not None:
+                self.metrics.upstream_error('moderation', 'circuit_open')
+            future = Future()
+            future.set_exception(CircuitOpenError("Moderation API circuit is open"))
+            return future
+        if self.batcher is None:
+            future = self._direct(text, safer_value)
+        else:
+            future = self.batcher.submit(score_cache_key(text, safer_value), (self.pool, text, safer_value, self.breaker))
+        if self.metrics is not None:
+            self._time_call(future)
+        return future
+
+    def release(self, text, safer_value, future):
+        """
+        Stop waiting for a call started by submit, e.g. when the request's deadline has passed.
+
+        A call shared with other requests, through the batcher or ``flights``,
+        keeps running for them; only a call nobody else waits for is cancelled.
+        """
+        key = score_cache_key(text, safer_value)
+        if self.batcher is not None:
+            self.batcher.release(key, future)
+        elif self.flights is not None:
+            if (key, future) in self._shared:
+                self._shared.remove((key, future))
+                self.flights.release(key, future)
+        else:
+            future.cancel()
+
+    def _time_call(self, future):
+        """Record the call's duration when it completes, in this request's Server-Timing too."""
+        metrics = self.metrics
+        timings = metrics.request_timings()
+        start = time.perf_counter()
+
+        def done(future):
+            if future.cancelled():
+                return
+            metrics.record_span('moderation', time.perf_counter() - start, timings)
+            if future.exception() is not None:
+                metrics.upstream_error('moderation', 'error')
+
+        future.add_done_callback(done)
+
+    def result(self, text, safer_value, future=None, timeout=None):
+        """
+        Wait for the API call for a text and parse the response.
+
+        Args:
+            text (str): The text being scored
+            safer_value (float): Safer value sent to the API
+            future (Future): Call started by submit, None to start one now
+            timeout (float): Seconds to wait, None to wait as long as the call takes
+
+        Raises:
+            ScoringTimeout: The call did not finish in time
+            CircuitOpenError: The circuit is open
+        """
+        if future is None:
+            future = self.submit(text, safer_value)
+        start = time.monotonic()
+        try:
+            json_result = self._wait(text, safer_value, future, timeout)
+        except Exception as e:
+            self._record_failure(e)
+            raise
+        return self._record_success(start, json_result)
+
+    async def result_async(self, text, safer_value, future=None, timeout=None):
+        """Like result, but waits without blocking the event loop."""
+        if future is None:
+            future = self.submit(text, safer_value)
+        start = time.monotonic()
+        try:
+            json_result = await self._wait_async(text, safer_value, future, timeout)
+        except Exception as e:
+            self._record_failure(e)
+            raise
+        return self._record_success(start, json_result)
+
+    def _record_success(self, start, json_result):
+        if self.latency is not None:
+            self.latency.record(time.monotonic() - start)
+        return parse_moderation_result(json_result)
+
+    def _record_failure(self, error):
+        # The breaker counts failed upstream calls in fetch_toxicity_json, not failed waits
+        if self.metrics is not None and isinstance(error, ScoringTimeout):
+            self.metrics.upstream_error('moderation', 'timeout')
+
+    def _hedge_after(self, timeout):
+        """Seconds after which a call gets a hedge request, or None for no hedging."""
+        hedge_after = self.latency.percentile(0.95) if self.hedge and self.latency is not None else None
+        if hedge_after is None or (timeout is not None and hedge_after >= timeout):
+            return None
+        return hedge_after
+
+    def _wait(self, text, safer_value, future, timeout):
+        hedge_after = self._hedge_after(timeout)
+        if hedge_after is None:
+            return self._first_result([future], timeout)
+
+        done, _ = wait([future], hedge_after)
+        if done:
+            return future.result()
+        hedge = self._start_hedge(text, safer_value, hedge_after)
+        futures = [future] if hedge is None else [future, hedge]
+        return self._first_result(futures, None if timeout is None else timeout - hedge_after)
+
+    def _start_hedge(self, text, safer_value, hedge_after):
+        """Start a hedge request for a slow call, or return None while the breaker rejects calls."""
+        if self.breaker is not None and not self.breaker.allow():
+            if self.metrics is not None:
+                self.metrics.upstream_error('moderation', 'circuit_open')
+            return None
+        self.hedged += 1
+        logger.debug(f"Hedging a moderation call still running after {hedge_after * 1000:.0f}ms")
+        return self._call(text, safer_value)
+
+    @staticmethod
+    def _first_result(futures, timeout):
+        """Result of the first future to succeed, or the last error if they all fail."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        pending = set(futures)
+        error = None
+        while pending:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            done, pending = wait(pending, remaining, return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        if pending or error is None:
+            raise ScoringTimeout(f"Moderation call did not finish within {timeout:.1f}s")
+        raise error
+
+    async def _wait_async(self, text, safer_value, future, timeout):
+        waiting = [_wrap_future(future)]
+        hedge_after = self._hedge_after(timeout)
+        if hedge_after is not None:
+            done, _ = await asyncio.wait(waiting, timeout=hedge_after)
+            if not done:
+                hedge = self._start_hedge(text, safer_value, hedge_after)
+                if hedge is not None:
+                    waiting.append(_wrap_future(hedge))
+                timeout = None if timeout is None else timeout - hedge_after
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        pending = set(waiting)
+        error = None
+        while pending:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            # asyncio.wait never cancels what it waits on: a batched call may be shared
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            for waited in done:
+                if waited.exception() is None:
+                    return waited.result()
+                error = waited.exception()
+        if pending or error is None:
+            raise ScoringTimeout(f"Moderation call did not finish within {timeout:.1f}s")
+        raise error
+
+    def close(self):
+        """Cancel direct calls that have not started, e.g. when the client has gone away."""
+        if self.flights is not None:
+            # Calls that other requests joined keep running for them
+            for key, future in self._shared:
+                self.flights.release(key, future)
+            self._shared = []
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=self.flights is None)
+            self._executor = None
+
+    def score_batch(self, texts, safer_value):
+        futures = [self.submit(text, safer_value) for text in texts]
+        return [self.result(text, safer_value, future) for text, future in zip(texts, futures)]
+
+
+class LocalLexiconScorer(BaseScorer):
+    """
+    Offline scorer based on weighted word n-grams.
+
+    Each text is turned into a row of n-gram counts (capped at ``max_count``)
+    over the lexicon vocabulary. One matrix product with the term/category
+    weight matrix gives every category's logit for the whole batch, and the
+    category values are their sigmoids.
+    """
+
+    name = 'local'
+
+    def __init__(self, path=None, flag_threshold=0.5):
+        """
+        Load the lexicon.
+
+        Args:
+            path: Lexicon JSON file, defaults to the one shipped in app/data
+            flag_threshold: Category value at which a text counts as flagged
+        """
+        import numpy as np
+        self._np = np
+        self.path = path or DEFAULT_LEXICON_PATH
+        self.flag_threshold = flag_threshold
+
+        with open(self.path, encoding='utf-8') as f:
+            model = json.load(f)
+        self.categories = tuple(model.get('categories', CATEGORIES))
+        self.max_count = model.get('max_count', 3)
+        terms = model['terms']
+
+        self.vocabulary = {term: index for index, term in enumerate(terms)}
+        self.max_ngram = max(len(term.split()) for term in terms) if terms else 1
+        self.weights = np.zeros((len(terms), len(self.categories)), dtype=np.float32)
+        for term, index in self.vocabulary.items():
+            for category, weight in terms[term].items():
+                self.weights[index, self.categories.index(category)] = weight
+        self.bias = np.array([model['bias'].get(c, 0.0) for c in self.categories], dtype=np.float32)
+        logger.info(f"Loaded local toxicity lexicon with {len(terms)} terms from {self.path}")
+
+    @classmethod
+    def from_config(cls, config):
+        """Create a scorer from a Flask config mapping."""
+        return cls(path=config.get('LOCAL_SCORER_LEXICON'))
+
+    def tokenize(self, text):
+        """Lower-case word tokens, with long character runs ("sooooo") shortened."""
+        return _TOKEN_RE.findall(_REPEAT_RE.sub(r'\1\1', text.lower()))
+
+    def _term_indexes(self, text):
+        """Vocabulary indexes of every n-gram of the text found in the lexicon."""
+        tokens = self.tokenize(text)
+        vocabulary = self.vocabulary
+        indexes = []
+        for n in range(1, self.max_ngram + 1):
+            for start in range(len(tokens) - n + 1):
+                index = vocabulary.get(' '.join(tokens[start:start + n]))
+                if index is not None:
+                    indexes.append(index)
+        return indexes
+
+    def category_matrix(self, texts):
+        """Return an (n_texts, n_categories) array of category values."""
+        np = self._np
+        counts = np.zeros((len(texts), len(self.vocabulary)), dtype=np.float32)
+        rows = []
+        cols = []
+        for row, text in enumerate(texts):
+            indexes = self._term_indexes(text)
+            rows.extend([row] * len(indexes))
+            cols.extend(indexes)
+        if rows:
+            np.add.at(counts, (np.array(rows), np.array(cols)), 1.0)
+            np.minimum(counts, self.max_count, out=counts)
+        logits = counts @ self.weights + self.bias
+        return 1.0 / (1.0 + np.exp(-logits))
+
+    def score_batch(self, texts, safer_value=None):
+        if not texts:
+            return []
+        np = self._np
+        values = self.category_matrix(texts)
+        scores = np.minimum(values.sum(axis=1), 1.0)
+        top = values.argmax(axis=1)
+
+        results = []
+        for row in range(len(texts)):
+            max_value = float(values[row, top[row]])
+            results.append({
+                'score': float(scores[row]),
+                'flagged': max_value >= self.flag_threshold,
+                'categories': {category: float(values[row, i]) for i, category in enumerate(self.categories)},
+                'max_category': self.categories[top[row]],
+                'max_value': max_value,
+                'source': 'local'
+            })
+        return results
@@ -0,0 +1,294 @@
+"""
+Single-flight coalescing of identical concurrent work.
+
+When many requests want the same thing at once (a trending thread, the same
+comment text), the first caller for a key does the work and the others wait
+for its result, or its error, instead of repeating the upstream call.
+
+``SingleFlight.do`` coalesces blocking calls between threads of a process and
+``do_async`` coroutines on an event loop; ``share`` hands out the same
+``Future`` for work that is already running, and ``lead`` lets a caller hold a
+key while it does the work itself (a page streamed as it is computed). With ``lock_dir`` set, ``do``
+also takes an exclusive lock file per key, so that a caller in another worker
+process waits for the running call and can then pick its result up from a
+shared store (the ``recheck`` callable) instead of calling upstream again.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locks
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """A call in progress and the outcome its waiters receive."""
+
+    __slots__ = ('done', 'result', 'error', 'waiters', 'abandoned')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+        self.abandoned = False
+
+
+class SingleFlight:
+    """Shares the result of an in-flight call between every caller of the same key."""
+
+    def __init__(self, name='flight', lock_dir=None, lock_timeout=60.0):
+        """
+        Initialize the group.
+
+        Args:
+            name: Name used in log messages and lock file names
+            lock_dir: Directory for per-key lock files shared by worker
+                processes, None to coalesce within this process only
+            lock_timeout: Seconds to wait for another process's lock before
+                doing the work anyway
+        """
+        self.name = name
+        self.lock_dir = lock_dir if fcntl is not None else None
+        self.lock_timeout = lock_timeout
+        if lock_dir and fcntl is None:
+            logger.warning(f"File locks are not available on this platform, '{name}' coalesces within each process only")
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+        self._reset()
+
+    @classmethod
+    def from_config(cls, config, name):
+        """Create a group from the SINGLE_FLIGHT_* settings."""
+        return cls(
+            name=name,
+            lock_dir=config.get('SINGLE_FLIGHT_LOCK_DIR') or None,
+            lock_timeout=config.get('SINGLE_FLIGHT_LOCK_TIMEOUT', 60),
+        )
+
+    def _reset(self):
+        """(Re)initialize in-flight state for the current process."""
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._tasks = {}
+        self._futures = {}
+        self._counters = {'leaders': 0, 'coalesced': 0, 'rechecked': 0, 'lock_waits': 0}
+
+    def _check_pid(self):
+        # In-flight calls belong to the parent's threads, which a forked worker doesn't have
+        if self._pid != os.getpid():
+            self._reset()
+
+    def _count(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def do(self, key, fn, recheck=None):
+        """
+        Call fn once for all concurrent callers with the same key.
+
+        Args:
+            key: Hashable identity of the work
+            fn: Callable doing the work; its result (or exception) goes to every waiter
+            recheck: Callable run after waiting for another process's lock file,
+                returning the result that process stored, or None to call fn
+
+        Returns:
+            The value fn (or recheck) returned; callers share the same object
+        """
+        self._check_pid()
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._counters['leaders'] += 1
+            else:
+                call.waiters += 1
+                self._counters['coalesced'] += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            if call.abandoned:
+                # The leader went away without a result; take over
+                return self.do(key, fn, recheck=recheck)
+            return call.result
+
+        try:
+            with self._file_lock(key) as waited:
+                result = recheck() if waited and recheck is not None else None
+                if result is not None:
+                    self._count('rechecked')
+                else:
+                    result = fn()
+            call.result = result
+            return result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            if call.waiters:
+                logger.debug(f"Single-flight '{self.name}' shared one call with {call.waiters} waiters")
+            call.done.set()
+
+    @contextmanager
+    def lead(self, key):
+        """
+        Hold key's flight while the caller does the work itself.
+
+        For work that can't be wrapped in one callable, such as a page that
+        is streamed while it is computed. ``do`` callers for the key wait
+        until the block is left and receive the ``result`` set on the
+        yielded call, or the exception that ended the block. Leaving without
+        a result (a streamed response closed early) lets a waiter take over.
+        Lock files are not taken, so this coalesces within the process only.
+
+        Yields:
+            _Call: The call to set ``result`` on, or None if the key's work is
+                already running, in which case ``do`` waits for it
+        """
+        self._check_pid()
+        with self._lock:
+            if key in self._calls:
+                call = None
+            else:
+                call = self._calls[key] = _Call()
+                self._counters['leaders'] += 1
+        if call is None:
+            yield None
+            return
+
+        try:
+            yield call
+        except Exception as e:
+            call.error = e
+            raise
+        except BaseException:
+            call.abandoned = True
+            raise
+        finally:
+            if call.error is None and call.result is None:
+                call.abandoned = True
+            with self._lock:
+                self._calls.pop(key, None)
+            if call.waiters:
+                logger.debug(f"Single-flight '{self.name}' shared one call with {call.waiters} waiters")
+            call.done.set()
+
+    async def do_async(self, key, coro_fn):
+        """
+        Await coro_fn() once for all concurrent callers with the same key on this event loop.
+
+        Waiters are shielded from each other: a caller that is cancelled does
+        not cancel the shared call.
+        """
+        self._check_pid()
+        loop = asyncio.get_running_loop()
+        task_key = (id(loop), key)
+        with self._lock:
+            task = self._tasks.get(task_key)
+            if task is not None:
+                self._counters['coalesced'] += 1
+            else:
+                task = self._tasks[task_key] = loop.create_task(coro_fn())
+                self._counters['leaders'] += 1
+                task.add_done_callback(lambda _: self._forget(self._tasks, task_key, task))
+        return await asyncio.shield(task)
+
+    def share(self, key, start):
+        """
+        Return the running Future for key, or start one with start().
+
+        The Future is shared until it finishes, so later callers start a new
+        call. Each caller should ``release`` it when it no longer needs it.
+        """
+        self._check_pid()
+        with self._lock:
+            entry = self._futures.get(key)
+            if entry is not None:
+                entry[1] += 1
+                self._counters['coalesced'] += 1
+                return entry[0]
+            future = start()
+            self._futures[key] = [future, 1]
+            self._counters['leaders'] += 1
+        future.add_done_callback(lambda _: self._forget_future(key, future))
+        return future
+
+    def release(self, key, future):
+        """Drop one caller's interest in a shared Future, cancelling it if nobody else is waiting."""
+        with self._lock:
+            entry = self._futures.get(key)
+            if entry is not None and entry[0] is future:
+                entry[1] -= 1
+                if entry[1] > 0:
+                    return
+                del self._futures[key]
+        future.cancel()
+
+    def _forget(self, calls, key, value):
+        with self._lock:
+            if calls.get(key) is value:
+                del calls[key]
+
+    def _forget_future(self, key, future):
+        with self._lock:
+            entry = self._futures.get(key)
+            if entry is not None and entry[0] is future:
+                del self._futures[key]
+
+    @contextmanager
+    def _file_lock(self, key):
+        """
+        Hold this key's lock file while the work runs.
+
+        Yields:
+            bool: Whether another process held the lock first, in which case
+                its result may already be in a shared store
+        """
+        if not self.lock_dir:
+            yield False
+            return
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()[:20]
+        path = os.path.join(self.lock_dir, f"{self.name}-{digest}.lock")
+        with open(path, 'a') as f:
+            waited = False
+            deadline = time.monotonic() + self.lock_timeout
+            locked = True
+            while True:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if not waited:
+                        waited = True
+                        self._count('lock_waits')
+                    if time.monotonic() >= deadline:
+                        logger.warning(f"Single-flight '{self.name}' lock still held after {self.lock_timeout}s, proceeding")
+                        locked = False
+                        break
+                    time.sleep(0.05)
+            try:
+                yield waited
+            finally:
+                if locked:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def stats(self):
+        """Return coalescing counters for this process."""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['in_flight'] = len(self._calls) + len(self._tasks) + len(self._futures)
+        return stats
@@ -0,0 +1,108 @@
+"""
+Snapshots of analyzed threads for incremental re-analysis.
+
+The analysis store keeps every scored comment with the hash of the body that
+was scored, plus its ScoreStats (app.stats). When a stale thread is
+analyzed again, ``ThreadSnapshot.reuse`` copies the stored scores onto
+comments whose ID and body hash are unchanged, so only new and edited
+comments are scored. The stats are adjusted for the comments that were
+added, edited or deleted instead of being recomputed over the whole thread.
+"""
+import hashlib
+
+from app.stats import ScoreStats
+
+
+def body_hash(body):
+    """Short hash identifying the text a comment was scored on."""
+    return hashlib.sha1(body.encode('utf-8')).hexdigest()[:16]
+
+
+def stored_stats(entry, comments=None):
+    """
+    ScoreStats of an analysis store entry.
+
+    Entries saved without stats (or in an older format) are recomputed from
+    their comments, straight from the columns when they are a ScoredThread.
+    """
+    try:
+        return ScoreStats.from_dict(entry['score_stats'])
+    except (KeyError, TypeError):
+        from app.records import ScoredThread
+        comments = entry['comments'] if comments is None else comments
+        if isinstance(comments, ScoredThread):
+            return comments.score_stats()
+        return ScoreStats.from_comments(comments)
+
+
+class ThreadSnapshot:
+    """A thread's previous scores by comment ID, and the stats over them."""
+
+    def __init__(self, previous=None, stats=None):
+        """
+        Initialize the snapshot.
+
+        Args:
+            previous: Comment ID -> (body hash, toxicity) from the last analysis
+            stats: ScoreStats over those comments
+        """
+        self.previous = previous or {}
+        self.stats = stats or ScoreStats()
+        self.reused = 0
+        self.rescored = 0
+        self.removed = 0
+        self._pending = []
+
+    @classmethod
+    def from_entry(cls, entry):
+        """Build a snapshot from an analysis store entry."""
+        comments = entry['comments']
+        previous = {
+            c['id']: (c.get('body_hash') or body_hash(c['body']), c['toxicity'])
+            for c in comments
+        }
+        return cls(previous, stored_stats(entry))
+
+    def reuse(self, comments):
+        """
+        Copy the previous scores onto comments that have not changed.
+
+        Edited and deleted comments are taken out of the stats; call
+        ``add_scored`` once the returned comments have been scored.
+
+        Returns:
+            list: The new and edited comments, which still need scoring
+        """
+        previous = self.previous
+        self.previous = {}
+        pending = []
+        for comment in comments:
+            digest = comment['body_hash'] = body_hash(comment['body'])
+            before = previous.pop(comment['id'], None)
+            if before is not None and before[0] == digest and before[1].get('status', 'ok') == 'ok':
+                comment['toxicity'] = dict(before[1])
+                self.reused += 1
+                continue
+            if before is not None:
+                self.stats.remove(before[1])
+            pending.append(comment)
+
+        # Whatever is left has been deleted from the thread
+        for _, toxicity in previous.values():
+            self.stats.remove(toxicity)
+            self.removed += 1
+        self._pending = pending
+        return pending
+
+    def add_scored(self, comments):
+        """Add the freshly scored comments to the stats; comments is the whole thread."""
+        for comment in self._pending:
+            self.stats.add(comment['toxicity'])
+        self.rescored += len(self._pending)
+        self._pending = []
+        if self.stats.top_stale:
+            self.stats.refresh_top(comments)
+
+    def counts(self):
+        """How the last re-analysis went, for the statistics shown to the user."""
+        return {'reused_count': self.reused, 'rescored_count': self.rescored, 'removed_count': self.removed}
@@ -46,13 +46,16 @@ document.addEventListener('DOMContentLoaded', function() {
         threadThresholdSlider.addEventListener('input', function() {
             const value = parseFloat(this.value).toFixed(2);
             threadThresholdValue.textContent = value;
+            reclassifyComments(parseFloat(value));
         });
         
         applyThresholdButton.addEventListener('click', function() {
-            const value = threadThresholdSlider.value;
+            // Scores are already on the page, so only the URL needs to remember the threshold
+            const value = parseFloat(threadThresholdSlider.value).toFixed(2);
+            reclassifyComments(parseFloat(value));
             const currentUrl = new URL(window.location.href);
             currentUrl.searchParams.set('threshold', value);
-            window.location.href = currentUrl.toString();
+            window.history.replaceState(null, '', currentUrl.toString());
         });
     }
 
@@ -257,6 +260,89 @@ function initToxicToggles() {
     }
 }
 
+/**
+ * Reclassify the comments on the thread page against a new threshold.
+ * Uses the scores rendered into each comment's data attributes, so no
+ * request is made to the server.
+ * @param {number} threshold - The new toxicity threshold (0-1).
+ */
+function reclassifyComments(threshold) {
+    const comments = document.querySelectorAll('#comments-container .comment');
+    let toxicCount = 0;
+    let scoredCount = 0;
+    
+    comments.forEach(commentDiv => {
+        const scored = commentDiv.dataset.scored === '1';
+        const isToxic = scored && parseFloat(commentDiv.dataset.score) >= threshold;
+        const display = (el, show) => { if (el) el.style.display = show ? '' : 'none'; };
+        
+        commentDiv.classList.toggle('toxic-comment', isToxic);
+        display(commentDiv.querySelector('.toxic-badge'), isToxic);
+        display(commentDiv.querySelector('.toxic-warning'), isToxic);
+        display(commentDiv.querySelector('.toxic-details'), isToxic);
+        display(commentDiv.querySelector('.toxic-content'), !isToxic);
+        
+        const button = commentDiv.querySelector('.toxic-warning button');
+        if (button) {
+            button.textContent = 'Show Content';
+            button.classList.remove('btn-danger');
+            button.classList.add('btn-outline-danger');
+        }
+        if (isToxic) {
+            toxicCount++;
+        }
+        // Comments the API could not score don't count towards the rate
+        if (commentDiv.dataset.status !== 'unscored' && commentDiv.dataset.status !== 'timeout') {
+            scoredCount++;
+        }
+    });
+    
+    showThreadStats({
+        toxic_count: toxicCount,
+        toxic_percentage: scoredCount ? (toxicCount / scoredCount) * 100 : 0,
+        unscored_count: comments.length - scoredCount
+    }, threshold);
+}
+
+/**
+ * Show toxicity statistics in the thread page's stat cards.
+ * @param {Object} stats - Object with toxic_count, toxic_percentage and unscored_count, plus
+ *     reused_count, rescored_count and removed_count after an incremental re-analysis.
+ * @param {number} threshold - The toxicity threshold the stats were computed at.
+ */
+function showThreadStats(stats, threshold) {
+    const setStat = (id, text, level) => {
+        const el = document.getElementById(id);
+        if (!el) return;
+        el.textContent = text;
+        if (level !== undefined) {
+            el.classList.remove('danger', 'warning', 'success');
+            el.classList.add(level);
+        }
+    };
+    const percentage = stats.toxic_percentage;
+    const toxicCount = stats.toxic_count;
+    
+    setStat('statToxicRate', percentage.toFixed(1) + '%',
+        percentage > 50 ? 'danger' : percentage > 25 ? 'warning' : 'success');
+    setStat('statToxicCount', String(toxicCount),
+        toxicCount > 10 ? 'danger' : toxicCount > 5 ? 'warning' : 'success');
+    setStat('statThreshold', threshold.toFixed(2));
+    
+    const unscored = document.getElementById('statUnscored');
+    if (unscored) {
+        unscored.textContent = stats.unscored_count
+            ? stats.unscored_count + ' comment(s) could not be scored and are not counted.'
+            : '';
+    }
+    
+    const reanalysis = document.getElementById('statReanalysis');
+    if (reanalysis && stats.reused_count) {
+        reanalysis.textContent = `Re-analyzed: ${stats.reused_count} unchanged comment(s) reused, ` +
+            `${stats.rescored_count} new or edited scored, ${stats.removed_count} deleted.`;
+    }
+}
+
 /**
  * Update URL with new threshold value
  */
@@ -0,0 +1,250 @@
+"""
+Online, mergeable statistics over toxicity scores.
+
+``ScoreStats`` accumulates a thread's results in one pass: counts, the mean
+and variance of the scores, per-category means, the top category and a
+fixed-bin histogram of the scores. The histogram doubles as the percentile
+sketch: scores lie in [0, 1] (the moderation API's sum_value is clamped to
+that range when it is parsed, see ``parse_moderation_result``), so with
+``HISTOGRAM_BINS`` bins any percentile is within 1/HISTOGRAM_BINS of the exact
+value, in constant memory.
+
+Every part can be added to, removed from (for incremental re-analysis) and
+merged, so the statistics of batches, threads or worker processes combine
+without revisiting the comments. ``to_dict``/``from_dict`` give a JSON form
+for the cache.
+"""
+import math
+
+HISTOGRAM_BINS = 100
+
+
+class RunningStats:
+    """Count, mean and variance of a stream of values (Welford's algorithm)."""
+
+    __slots__ = ('count', 'mean', 'm2')
+
+    def __init__(self, count=0, mean=0.0, m2=0.0):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def remove(self, value):
+        """Undo add(value)."""
+        if self.count <= 1:
+            self.count, self.mean, self.m2 = 0, 0.0, 0.0
+            return
+        delta = value - self.mean
+        self.count -= 1
+        self.mean -= delta / self.count
+        self.m2 = max(0.0, self.m2 - delta * (value - self.mean))
+
+    def merge(self, other):
+        """Combine with the stats of another stream (Chan et al.)."""
+        if not other.count:
+            return self
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / total
+        self.m2 += other.m2 + delta * delta * self.count * other.count / total
+        self.count = total
+        return self
+
+    @property
+    def variance(self):
+        """Population variance, 0 for fewer than two values."""
+        return self.m2 / self.count if self.count > 1 else 0.0
+
+    @property
+    def stddev(self):
+        return math.sqrt(self.variance)
+
+    def to_dict(self):
+        return {'count': self.count, 'mean': self.mean, 'm2': self.m2}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['count'], data['mean'], data['m2'])
+
+
+class Histogram:
+    """Counts of values in [0, 1] over equal-width bins."""
+
+    __slots__ = ('counts',)
+
+    def __init__(self, counts=None, bins=HISTOGRAM_BINS):
+        self.counts = list(counts) if counts is not None else [0] * bins
+
+    def _bin(self, value):
+        return min(len(self.counts) - 1, max(0, int(value * len(self.counts))))
+
+    def add(self, value, count=1):
+        self.counts[self._bin(value)] += count
+
+    def remove(self, value):
+        self.add(value, -1)
+
+    def merge(self, other):
+        if len(other.counts) != len(self.counts):
+            raise ValueError("Cannot merge histograms with different bins")
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        return self
+
+    @property
+    def total(self):
+        return sum(self.counts)
+
+    def quantile(self, q):
+        """Approximate q-th quantile (0-1), interpolating within the bin; None when empty."""
+        total = self.total
+        if not total:
+            return None
+        width = 1.0 / len(self.counts)
+        target = q * total
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= target:
+                return (index + (target - seen) / count) * width
+            seen += count
+        return 1.0
+
+    def coarse(self, bins=10):
+        """Counts regrouped into fewer bins, e.g. for a chart."""
+        step = max(1, len(self.counts) // bins)
+        return [sum(self.counts[i:i + step]) for i in range(0, len(self.counts), step)]
+
+
+def _is_ok(toxicity):
+    return toxicity.get('status', 'ok') == 'ok'
+
+
+class ScoreStats:
+    """
+    Threshold-independent statistics of a set of scored comments.
+
+    Only the top category cannot be kept up to date when a result is
+    removed: removing the one holding it marks it stale, and ``refresh_top``
+    scans the comments again.
+    """
+
+    __slots__ = ('unscored', 'scores', 'histogram', 'categories', 'top_category', 'top_category_value', 'top_stale')
+
+    def __init__(self):
+        self.unscored = 0
+        self.scores = RunningStats()
+        self.histogram = Histogram()
+        # Category -> [sum of values, number of comments with the category]
+        self.categories = {}
+        self.top_category = None
+        self.top_category_value = 0
+        self.top_stale = False
+
+    @classmethod
+    def from_comments(cls, comments):
+        stats = cls()
+        for comment in comments:
+            stats.add(comment['toxicity'])
+        return stats
+
+    @classmethod
+    def combine(cls, parts):
+        """Merge the stats of several batches, threads or workers into new stats."""
+        stats = cls()
+        for part in parts:
+            stats.merge(part)
+        return stats
+
+    @property
+    def scored(self):
+        return self.scores.count
+
+    def add(self, toxicity, sign=1):
+        """Count a comment's result, or take it out again with sign=-1."""
+        if not _is_ok(toxicity):
+            self.unscored += sign
+            return
+        score = toxicity['score']
+        if sign > 0:
+            self.scores.add(score)
+            self.histogram.add(score)
+        else:
+            self.scores.remove(score)
+            self.histogram.remove(score)
+        for category, value in toxicity.get('categories', {}).items():
+            running = self.categories.setdefault(category, [0.0, 0])
+            running[0] += sign * value
+            running[1] += sign
+            if not running[1]:
+                del self.categories[category]
+        max_value = toxicity.get('max_value', 0)
+        if sign > 0 and 'categories' in toxicity and max_value > self.top_category_value:
+            self.top_category = toxicity.get('max_category')
+            self.top_category_value = max_value
+        elif sign < 0 and self.top_category is not None and max_value >= self.top_category_value:
+            self.top_stale = True
+
+    def remove(self, toxicity):
+        self.add(toxicity, -1)
+
+    def merge(self, other):
+        self.unscored += other.unscored
+        self.scores.merge(other.scores)
+        self.histogram.merge(other.histogram)
+        for category, (total, count) in other.categories.items():
+            running = self.categories.setdefault(category, [0.0, 0])
+            running[0] += total
+            running[1] += count
+        if other.top_category_value > self.top_category_value:
+            self.top_category = other.top_category
+            self.top_category_value = other.top_category_value
+        self.top_stale = self.top_stale or other.top_stale
+        return self
+
+    def refresh_top(self, comments):
+        """Find the top category again after the comment holding it was removed."""
+        self.top_category = None
+        self.top_category_value = 0
+        for comment in comments:
+            toxicity = comment['toxicity']
+            if _is_ok(toxicity) and 'categories' in toxicity and toxicity.get('max_value', 0) > self.top_category_value:
+                self.top_category = toxicity.get('max_category')
+                self.top_category_value = toxicity['max_value']
+        self.top_stale = False
+
+    def category_means(self):
+        return {category: total / count for category, (total, count) in self.categories.items()}
+
+    def percentiles(self, quantiles=(0.5, 0.9, 0.99)):
+        """Approximate score percentiles, e.g. {'p50': 0.12, 'p90': 0.71, 'p99': 0.95}."""
+        return {f"p{round(q * 100):d}": self.histogram.quantile(q) or 0.0 for q in quantiles}
+
+    def to_dict(self):
+        return {
+            'unscored': self.unscored,
+            'scores': self.scores.to_dict(),
+            'histogram': self.histogram.counts,
+            'categories': self.categories,
+            'top_category': self.top_category,
+            'top_category_value': self.top_category_value,
+            'top_stale': self.top_stale,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild stats saved with to_dict; raises KeyError for other shapes."""
+        stats = cls()
+        stats.unscored = data['unscored']
+        stats.scores = RunningStats.from_dict(data['scores'])
+        stats.histogram = Histogram(data['histogram'])
+        # The stored lists may be shared with other readers of the entry
+        stats.categories = {category: list(running) for category, running in data['categories'].items()}
+        stats.top_category = data['top_category']
+        stats.top_category_value = data['top_category_value']
+        stats.top_stale = data['top_stale']
+        return stats
@@ -0,0 +1,551 @@
+"""
+Fast extractors for Reddit thread pages and JSON listings.
+
+Instead of building a full BeautifulSoup tree and running CSS selects per
+comment, the HTML page is fed chunk by chunk into an lxml pull parser. Thread
+metadata and comments are collected in a single pass, finished elements are
+freed as the parse goes, and parsing stops as soon as the comment limit is
+reached. The JSON listing is walked lazily in the same document order.
+Both produce the same dicts as get_thread_metadata,
+extract_comments_from_html and extract_more_stubs in reddit_client.
+
+Comments keep their place in the reply tree through 'parent_id' (the parent
+comment's ID, None for top-level comments) and 'depth'. "load more comments"
+stubs are returned as dicts with 'parent_id', 'depth' and the 'children' IDs
+still to fetch.
+"""
+import json
+import re
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from lxml import etree
+from lxml.html import fragment_fromstring
+
+_COMMENT_ID_RE = re.compile(r'id-t1_([a-z0-9]+)')
+_NUMBER_RE = re.compile(r'(\d+)')
+_SIGNED_NUMBER_RE = re.compile(r'(-?\d+)')
+_MORE_CHILDREN_RE = re.compile(r"morechildren\(this,\s*'[^']*',\s*'[^']*',\s*'([^']*)'")
+
+# Placeholder for a text field whose element has not been closed yet
+_PENDING = object()
+
+# Elements whose text BeautifulSoup's get_text() leaves out
+_NON_TEXT_TAGS = frozenset(['script', 'style', 'template'])
+
+# Metadata fields: (tag, required classes, value taken from)
+_METADATA_SELECTORS = {
+    'title': ('a', ('title',), 'text'),
+    'subreddit': ('a', ('subreddit',), 'text'),
+    'author': ('a', ('author',), 'text'),
+    'score': ('div', ('score', 'unvoted'), 'title'),
+    'num_comments': ('a', ('comments',), 'text'),
+    'time': ('time', (), 'datetime'),
+}
+
+# Comment fields, matched like select_one() inside each comment div
+_COMMENT_SELECTORS = {
+    'author': ('a', ('author',), 'text'),
+    'body': ('div', ('md',), 'strings'),
+    'score': ('span', ('score', 'unvoted'), 'strings'),
+    'permalink': ('a', ('bylink',), 'href'),
+    'time': ('time', (), 'datetime'),
+}
+
+
+def _classes(element):
+    return element.get('class', '').split()
+
+
+def _matches(element, classes, tag, required):
+    return element.tag == tag and all(c in classes for c in required)
+
+
+def _strings(element):
+    """Yield the text nodes of an element the way BeautifulSoup does."""
+    if element.tag not in _NON_TEXT_TAGS and element.text:
+        yield element.text
+    for child in element:
+        if isinstance(child.tag, str):
+            yield from _strings(child)
+        if child.tail:
+            yield child.tail
+
+
+def _text(element):
+    """Equivalent of BeautifulSoup's ``element.text.strip()``."""
+    return ''.join(_strings(element)).strip()
+
+
+def _stripped_text(element):
+    """Equivalent of BeautifulSoup's ``element.get_text(strip=True)``."""
+    return ''.join(s.strip() for s in _strings(element))
+
+
+def comment_id_from_class(class_attr):
+    """Comment ID from a comment div's class attribute, or None."""
+    match = _COMMENT_ID_RE.search(class_attr or '')
+    return match.group(1) if match else None
+
+
+def more_stub_from_onclick(onclick, parent_id, depth):
+    """Build a "load more comments" stub from the link's onclick handler, or None."""
+    match = _MORE_CHILDREN_RE.search(onclick or '')
+    if not match or not match.group(1):
+        return None
+    return {'parent_id': parent_id, 'depth': depth, 'children': match.group(1).split(',')}
+
+
+def _parse_datetime(value, default):
+    if value:
+        try:
+            return int(datetime.strptime(value, '%Y-%m-%dT%H:%M:%S+00:00').replace(tzinfo=timezone.utc).timestamp())
+        except (ValueError, TypeError):
+            pass
+    return default
+
+
+class _PendingComment:
+    """A comment div whose fields are still being collected."""
+
+    __slots__ = ('classes', 'fields', 'closed', 'comment_id', 'parent_id', 'depth')
+
+    def __init__(self, classes, comment_id, parent_id, depth):
+        self.classes = classes
+        self.fields = {}
+        self.closed = False
+        self.comment_id = comment_id
+        self.parent_id = parent_id
+        self.depth = depth
+
+    def resolved(self):
+        # Deleted comments are skipped without looking at their fields
+        if 'deleted' in self.classes:
+            return True
+        if any(value is _PENDING for value in self.fields.values()):
+            return False
+        return self.closed or len(self.fields) == len(_COMMENT_SELECTORS)
+
+
+class ThreadPageParser:
+    """
+    Incremental parser for an old.reddit.com thread page.
+
+    Feed the page with ``feed`` until it returns True (the comment limit and
+    all metadata have been found) or the data runs out, then call ``close``.
+    """
+
+    def __init__(self, thread_id, limit=20, encoding='utf-8', max_depth=None):
+        self.thread_id = thread_id
+        self.limit = limit
+        self.max_depth = max_depth
+        self.metadata_fields = {}
+        self.comments = []
+        self.more = []
+        self.done = False
+        self._parser = etree.HTMLPullParser(events=('start', 'end'), encoding=encoding)
+        self._open_comments = []
+        self._queue = deque()
+        self._captures = {}
+
+    def feed(self, data):
+        """
+        Feed a chunk of the page.
+
+        Returns:
+            bool: True once nothing more needs to be parsed
+        """
+        if not self.done:
+            self._parser.feed(data)
+            self._process_events()
+        return self.done
+
+    def close(self):
+        """Finish parsing and flush comments that were still pending."""
+        if not self.done:
+            try:
+                self._parser.close()
+            except etree.XMLSyntaxError:
+                pass
+            self._process_events()
+            for pending in self._open_comments:
+                pending.closed = True
+            self._emit()
+        return self
+
+    def result(self):
+        """Thread data dict with 'metadata', 'comments' and 'more'; call after close."""
+        return {
+            'metadata': self.metadata(),
+            'comments': self.comments,
+            # Stubs only matter while there is room for more comments
+            'more': self.more if len(self.comments) < self.limit else []
+        }
+
+    def _process_events(self):
+        for event, element in self._parser.read_events():
+            if event == 'start':
+                self._start(element)
+            else:
+                self._end(element)
+            if self.done:
+                break
+
+    def _start(self, element):
+        if not isinstance(element.tag, str):
+            return
+        classes = _classes(element)
+
+        for name, (tag, required, source) in _METADATA_SELECTORS.items():
+            if name not in self.metadata_fields and _matches(element, classes, tag, required):
+                self._take(element, source, self.metadata_fields, name)
+
+        for pending in self._open_comments:
+            for name, (tag, required, source) in _COMMENT_SELECTORS.items():
+                if name not in pending.fields and _matches(element, classes, tag, required):
+                    self._take(element, source, pending.fields, name)
+
+        if element.tag == 'div' and 'comment' in classes:
+            parent = self._open_comments[-1] if self._open_comments else None
+            pending = _PendingComment(
+                classes,
+                comment_id_from_class(element.get('class')),
+                parent.comment_id if parent else None,
+                len(self._open_comments)
+            )
+            self._open_comments.append(pending)
+            self._queue.append((pending, element.get('class', '')))
+        elif element.tag == 'a' and 'onclick' in element.attrib:
+            parent = self._open_comments[-1] if self._open_comments else None
+            depth = len(self._open_comments)
+            stub = more_stub_from_onclick(element.get('onclick'), parent.comment_id if parent else None, depth)
+            if stub and (self.max_depth is None or depth <= self.max_depth):
+                self.more.append(stub)
+
+    def _take(self, element, source, fields, name):
+        """Record a field now, or once the element's text is complete."""
+        if source in ('text', 'strings'):
+            # Reserve the field so later matches inside the element are ignored
+            fields[name] = _PENDING
+            self._captures.setdefault(element, []).append((fields, name, source))
+        else:
+            fields[name] = element.get(source)
+
+    def _end(self, element):
+        captures = self._captures.pop(element, None)
+        if captures:
+            text = _text(element)
+            stripped = _stripped_text(element) if any(c[2] == 'strings' for c in captures) else None
+            for fields, name, source in captures:
+                fields[name] = text if source == 'text' else stripped
+
+        if self._open_comments and element.tag == 'div' and 'comment' in _classes(element):
+            self._open_comments.pop().closed = True
+
+        self._emit()
+
+        # Free finished elements unless an enclosing element still needs its text
+        if not self._captures:
+            element.clear(keep_tail=True)
+            parent = element.getparent()
+            if parent is not None:
+                while element.getprevious() is not None:
+                    del parent[0]
+
+    def _emit(self):
+        """Turn resolved comments at the head of the queue into comment dicts."""
+        while self._queue and len(self.comments) < self.limit:
+            pending, class_attr = self._queue[0]
+            if not pending.resolved():
+                break
+            self._queue.popleft()
+            comment = self._build_comment(pending, class_attr)
+            if comment is not None:
+                self.comments.append(comment)
+
+        if len(self.comments) >= self.limit and len(self.metadata_fields) == len(_METADATA_SELECTORS) \
+                and all(v is not _PENDING for v in self.metadata_fields.values()):
+            self.done = True
+
+    def _build_comment(self, pending, class_attr):
+        if 'deleted' in pending.classes:
+            return None
+        if self.max_depth is not None and pending.depth > self.max_depth:
+            return None
+        fields = pending.fields
+
+        author = fields['author'] if 'author' in fields else "[deleted]"
+        body = fields['body'] if 'body' in fields else ""
+        if not body or body in ['[deleted]', '[removed]']:
+            return None
+
+        score_text = fields['score'] if 'score' in fields else "0 points"
+        score_match = _SIGNED_NUMBER_RE.search(score_text)
+
+        return {
+            'id': pending.comment_id or f"unknown_{len(self.comments)}",
+            'author': author,
+            'body': body,
+            'score': int(score_match.group(1)) if score_match else 0,
+            'created_utc': _parse_datetime(fields.get('time'), int(time.time())),
+            'permalink': fields.get('permalink') or "",
+            'parent_id': pending.parent_id,
+            'depth': pending.depth
+        }
+
+    def metadata(self):
+        """Build the thread metadata dict from the collected fields."""
+        fields = self.metadata_fields
+        title = fields['title'] if 'title' in fields else "[Unknown Title]"
+        subreddit = fields['subreddit'] if 'subreddit' in fields else "[Unknown Subreddit]"
+        if subreddit.startswith('r/'):
+            subreddit = subreddit[2:]
+        author = fields['author'] if 'author' in fields else "[deleted]"
+
+        try:
+            score = int(fields['score'] if fields.get('score') is not None else '0')
+        except ValueError:
+            score = 0
+
+        num_comments_text = fields['num_comments'] if 'num_comments' in fields else "0 comments"
+        num_match = _NUMBER_RE.search(num_comments_text)
+
+        return {
+            'id': self.thread_id,
+            'title': title,
+            'author': author,
+            'score': score,
+            'created_utc': _parse_datetime(fields.get('time'), int(time.time())),
+            'permalink': f"/r/{subreddit}/comments/{self.thread_id}/",
+            'num_comments': int(num_match.group(1)) if num_match else 0,
+            'subreddit': subreddit
+        }
+
+
+def parse_thread_page(chunks, thread_id, limit=20, encoding='utf-8', max_depth=None):
+    """
+    Extract thread metadata and comments from an old.reddit.com page.
+
+    Args:
+        chunks: Iterable of byte strings making up the page (or a single bytes object)
+        thread_id: The Reddit thread ID
+        limit: Maximum number of comments to extract
+        encoding: Character encoding of the page
+        max_depth: Deepest reply level to keep (0 is top-level), None for all
+
+    Returns:
+        Dict with 'metadata', 'comments' and 'more' stubs, as built by reddit_client
+    """
+    if isinstance(chunks, (bytes, str)):
+        chunks = [chunks.encode(encoding) if isinstance(chunks, str) else chunks]
+    parser = ThreadPageParser(thread_id, limit, encoding, max_depth)
+    for chunk in chunks:
+        if parser.feed(chunk):
+            break
+    return parser.close().result()
+
+
+def iter_listing(children, depth=0):
+    """
+    Walk a JSON comment listing depth-first, in the order the HTML page shows it.
+
+    Args:
+        children: The 'children' list of a comment listing
+        depth: Reply depth of the listing's top-level items
+
+    Yields:
+        tuple: (kind, data, depth) for each comment ('t1') and "load more" stub ('more')
+    """
+    stack = [iter(children)]
+    while stack:
+        for child in stack[-1]:
+            kind = child.get('kind')
+            if kind not in ('t1', 'more'):
+                continue
+            data = child['data']
+            yield kind, data, depth + len(stack) - 1
+            replies = data.get('replies') if kind == 't1' else None
+            if replies:
+                stack.append(iter(replies['data']['children']))
+                break
+        else:
+            stack.pop()
+
+
+def _parent_comment_id(fullname):
+    """Parent comment ID from a 'parent_id' fullname, None for the thread itself."""
+    if fullname and fullname.startswith('t1_'):
+        return fullname[3:]
+    return None
+
+
+def _json_body_text(data):
+    """Comment text as the HTML page's get_text(strip=True) would give it."""
+    body_html = data.get('body_html')
+    if body_html:
+        return _stripped_text(fragment_fromstring(body_html, create_parent='div'))
+    return ''.join(line.strip() for line in (data.get('body') or '').splitlines())
+
+
+def _json_comment(data, depth, index, base_url):
+    """Build a comment dict from listing data, or None for deleted/empty comments."""
+    body = _json_body_text(data)
+    if not body or body in ['[deleted]', '[removed]']:
+        return None
+    permalink = data.get('permalink') or ""
+    return {
+        'id': data.get('id') or f"unknown_{index}",
+        'author': data.get('author') or "[deleted]",
+        'body': body,
+        'score': 0 if data.get('score_hidden') else int(data.get('score') or 0),
+        'created_utc': int(data.get('created_utc') or time.time()),
+        'permalink': base_url + permalink if permalink.startswith('/') else permalink,
+        'parent_id': _parent_comment_id(data.get('parent_id')),
+        'depth': depth
+    }
+
+
+def _json_more_stub(data, depth):
+    """Build a "load more" stub from listing data, or None for "continue this thread" links."""
+    children = data.get('children') or []
+    if not children:
+        return None
+    return {'parent_id': _parent_comment_id(data.get('parent_id')), 'depth': depth, 'children': list(children)}
+
+
+def _collect(items, limit, max_depth, base_url, comments, more):
+    """Append comments and stubs from (kind, data, depth) items until the limit is reached."""
+    for kind, data, depth in items:
+        if len(comments) >= limit:
+            break
+        if max_depth is not None and depth > max_depth:
+            continue
+        if kind == 'more':
+            stub = _json_more_stub(data, depth)
+            if stub:
+                more.append(stub)
+            continue
+        comment = _json_comment(data, depth, len(comments), base_url)
+        if comment is not None:
+            comments.append(comment)
+
+
+def parse_thread_json(payload, thread_id, limit=20, base_url='https://old.reddit.com', max_depth=None):
+    """
+    Extract thread metadata and comments from a /comments/<id>.json listing.
+
+    Args:
+        payload: Response body (bytes or str) or the already decoded listing
+        thread_id: The Reddit thread ID
+        limit: Maximum number of comments to extract
+        base_url: Prefix for comment permalinks, matching the HTML page's links
+        max_depth: Deepest reply level to keep (0 is top-level), None for all
+
+    Returns:
+        Dict with 'metadata', 'comments' and 'more' stubs, identical to the HTML extractors
+    """
+    listing = json.loads(payload) if isinstance(payload, (bytes, str)) else payload
+    post = listing[0]['data']['children'][0]['data']
+
+    subreddit = post.get('subreddit') or "[Unknown Subreddit]"
+    metadata = {
+        'id': thread_id,
+        'title': post.get('title', "[Unknown Title]"),
+        'author': post.get('author', "[deleted]"),
+        'score': int(post.get('score') or 0),
+        'created_utc': int(post.get('created_utc') or time.time()),
+        'permalink': f"/r/{subreddit}/comments/{thread_id}/",
+        'num_comments': int(post.get('num_comments') or 0),
+        'subreddit': subreddit
+    }
+
+    comments = []
+    more = []
+    _collect(iter_listing(listing[1]['data']['children']), limit, max_depth, base_url, comments, more)
+
+    return {
+        'metadata': metadata,
+        'comments': comments,
+        'more': more if len(comments) < limit else []
+    }
+
+
+def _tree_order(things, root_fullname):
+    """
+    Order a flat list of listing things depth-first under root_fullname.
+
+    The morechildren API returns replies as one flat list; this puts every
+    thing right after its parent, keeping siblings in the order received.
+    """
+    names = {thing['data'].get('name') for thing in things}
+    children = {}
+    for thing in things:
+        parent = thing['data'].get('parent_id')
+        children.setdefault(parent if parent in names else root_fullname, []).append(thing)
+
+    stack = [iter(children.get(root_fullname, []))]
+    while stack:
+        for thing in stack[-1]:
+            yield thing
+            name = thing['data'].get('name')
+            if name in children:
+                stack.append(iter(children.pop(name)))
+                break
+        else:
+            stack.pop()
+
+
+def parse_more_children(payload, stub, limit, base_url='https://old.reddit.com', max_depth=None):
+    """
+    Extract the comments returned by /api/morechildren for one stub.
+
+    Args:
+        payload: Response body (bytes or str) or the already decoded response
+        stub: The "load more" stub the children were requested for
+        limit: Maximum number of comments to extract
+        base_url: Prefix for comment permalinks
+        max_depth: Deepest reply level to keep (0 is top-level), None for all
+
+    Returns:
+        tuple: (comments, more) in tree order, ready for insert_replies
+    """
+    response = json.loads(payload) if isinstance(payload, (bytes, str)) else payload
+    errors = response['json'].get('errors')
+    if errors:
+        raise ValueError(f"morechildren failed: {errors}")
+    things = response['json']['data']['things']
+
+    root = f"t1_{stub['parent_id']}" if stub['parent_id'] else None
+    items = []
+    for thing in _tree_order(things, root):
+        if thing.get('kind') in ('t1', 'more'):
+            data = thing['data']
+            depth = data.get('depth')
+            items.append((thing['kind'], data, stub['depth'] if depth is None else depth))
+
+    comments = []
+    more = []
+    _collect(items, limit, max_depth, base_url, comments, more)
+    return comments, (more if len(comments) < limit else [])
+
+
+def insert_replies(comments, parent_id, replies):
+    """
+    Insert fetched replies into a depth-first comment list, after the parent's subtree.
+
+    Args:
+        comments: Comment dicts in page order, modified in place
+        parent_id: ID of the comment the replies belong to, None for top-level
+        replies: New comment dicts in tree order
+    """
+    position = len(comments)
+    if parent_id is not None:
+        for index, comment in enumerate(comments):
+            if comment['id'] == parent_id:
+                depth = comment.get('depth', 0)
+                position = index + 1
+                while position < len(comments) and comments[position].get('depth', 0) > depth:
+                    position += 1
+                break
+    comments[position:position] = replies
@@ -1,41 +1,59 @@
 """
 Toxicity detection component using Friendly_Text_Moderation API.
+
+Scores come from the backend selected by TOXICITY_SCORER: 'remote' (the
+moderation API), 'local' (the offline lexicon scorer) or 'tiered' (the
+in-process prefilter, with only uncertain comments sent to the API;
+'local_first' is accepted as an alias).
+
+Every result has a 'status': 'ok' when it was scored, 'unscored' when the
+API failed or its circuit breaker is open, and 'timeout' when the call or
+the request ran out of time. Only 'ok' results count in the statistics.
 """
-import json
+import asyncio
 import logging
-import sys
+import time
 from flask import current_app, has_app_context
-from gradio_client import Client
+from app.cache import score_cache_key
+from app.logs import sample_comment
+from app.metrics import current_metrics
+from app.moderation_pool import ModerationClientPool
+from app.prefilter import Prefilter, UNCERTAIN
+from app.resilience import CircuitOpenError, Deadline, ScoringTimeout
+from app.scorers import LocalLexiconScorer, RemoteScorer
+from app.stats import ScoreStats
 
-# Simple console logger for when no app context is available
-console_logger = logging.getLogger('toxicity_detector')
-console_handler = logging.StreamHandler(sys.stdout)
-console_handler.setFormatter(logging.Formatter('TOXICITY-DETECTOR: %(message)s'))
-console_logger.addHandler(console_handler)
-console_logger.setLevel(logging.INFO)
+logger = logging.getLogger(__name__)
+
+def _rejected(future):
+    """Whether a call was refused by the open circuit breaker."""
+    return future.done() and not future.cancelled() and isinstance(future.exception(), CircuitOpenError)
 
 class ToxicityDetector:
-    def __init__(self, threshold=None):
+    def __init__(self, threshold=None, pool=None, cache=None, batcher=None, scorer=None):
         """
         Initialize the toxicity detector.
         
         Args:
             threshold: Toxicity threshold (0-1), defaults to config value if None
+            pool: ModerationClientPool to borrow API clients from, defaults to
+                the application's shared pool
+            cache: Score cache backend, defaults to the application's score cache
+            batcher: MicroBatcher shared by concurrent requests, defaults to
+                the application's batcher (None calls the API directly)
+            scorer: 'remote', 'local' or 'tiered', defaults to TOXICITY_SCORER
         """
         self._threshold = None
         self.threshold = threshold
-        self._client = None
-        self._log("======== ToxicityDetector initialized ========")
-        
-    def _log(self, message, level='info'):
-        """Log messages safely with or without app context."""
-        if has_app_context():
-            logger = current_app.logger
-            log_method = getattr(logger, level)
-            log_method(message)
-        else:
-            log_method = getattr(console_logger, level)
-            log_method(message)
+        self._pool = pool
+        self._cache = cache
+        self._batcher = batcher
+        self._scorer = scorer
+        self._remote = None
+        self._local = None
+        self._prefilter = None
+        # Fraction of scored comments that get a debug record
+        self._sample_rate = current_app.config.get('LOG_COMMENT_SAMPLE_RATE', 0.01) if has_app_context() else 0
     
     @property
     def threshold(self):
@@ -53,114 +71,264 @@ class ToxicityDetector:
         self._threshold = value
     
     @property
-    def client(self):
-        """Lazy-load and cache the Friendly_Text_Moderation client."""
-        if self._client is None:
-            self._log("======== INITIALIZING API CLIENT ========")
-            self._client = Client("duchaba/Friendly_Text_Moderation")
-            self._log("Client initialization complete")
-        return self._client
+    def pool(self):
+        """Get the moderation client pool, creating a private one outside the app."""
+        if self._pool is None:
+            if has_app_context() and 'moderation_pool' in current_app.extensions:
+                self._pool = current_app.extensions['moderation_pool']
+            else:
+                logger.debug("Creating a private moderation client pool")
+                self._pool = ModerationClientPool("duchaba/Friendly_Text_Moderation", size=1)
+        return self._pool
+        
+    @property
+    def cache(self):
+        """Get the score cache, or None when running outside the app."""
+        if self._cache is None and has_app_context():
+            self._cache = current_app.extensions.get('score_cache')
+        return self._cache
+    
+    @property
+    def batcher(self):
+        """Get the shared micro-batcher, or None when batching is off."""
+        if self._batcher is None and has_app_context():
+            self._batcher = current_app.extensions.get('moderation_batcher')
+        return self._batcher
+    
+    @property
+    def scorer(self):
+        """Name of the scoring mode: 'remote', 'local' or 'tiered'."""
+        mode = self._scorer
+        if mode is None:
+            mode = current_app.config.get('TOXICITY_SCORER', 'remote') if has_app_context() else 'remote'
+        return 'tiered' if mode == 'local_first' else mode
+    
+    @property
+    def remote(self):
+        """Get the moderation API scorer."""
+        if self._remote is None:
+            extensions = current_app.extensions if has_app_context() else {}
+            self._remote = RemoteScorer(
+                self.pool, self.batcher, self.concurrency,
+                breaker=extensions.get('moderation_breaker'),
+                latency=extensions.get('moderation_latency'),
+                hedge=current_app.config.get('MODERATION_HEDGE', False) if has_app_context() else False,
+                flights=extensions.get('moderation_flights'),
+                metrics=extensions.get('metrics')
+            )
+        return self._remote
+    
+    @property
+    def local(self):
+        """Get the offline lexicon scorer, shared by the app when it has one."""
+        if self._local is None:
+            if has_app_context() and 'local_scorer' in current_app.extensions:
+                self._local = current_app.extensions['local_scorer']
+            else:
+                self._local = LocalLexiconScorer()
+        return self._local
+    
+    @property
+    def prefilter(self):
+        """Get the tiered mode's prefilter, shared by the app when it has one."""
+        if self._prefilter is None:
+            if has_app_context() and 'prefilter' in current_app.extensions:
+                self._prefilter = current_app.extensions['prefilter']
+            elif has_app_context():
+                self._prefilter = Prefilter.from_config(current_app.config, self.local)
+            else:
+                self._prefilter = Prefilter(self.local)
+        return self._prefilter
+    
+    @property
+    def concurrency(self):
+        """Maximum number of moderation calls in flight for one analysis."""
+        if has_app_context():
+            return max(1, int(current_app.config.get('MODERATION_CONCURRENCY', 4)))
+        return 4
+    
+    def _deadlines(self):
+        """(per-call timeout, per-request deadline) in seconds; None means no limit."""
+        if has_app_context():
+            return (current_app.config.get('MODERATION_CALL_TIMEOUT', 20),
+                    current_app.config.get('MODERATION_REQUEST_DEADLINE', 60))
+        return 20, 60
+    
+    def _safer_value(self):
+        """Get the configured safer value."""
+        if has_app_context():
+            return current_app.config.get('SAFER_VALUE', 0.02)
+        return 0.02
         
-    def analyze_text(self, text):
+    def analyze_text(self, text, safer_value=None):
         """
-        Analyze a text string for toxicity using Friendly_Text_Moderation API.
+        Analyze a text string for toxicity.
         
         Args:
             text (str): The text to analyze
+            safer_value (float): Safer value sent to the API, defaults to config
             
         Returns:
             dict: Dictionary containing:
                 - score (float): Toxicity score (0-1)
-                - is_toxic (bool): Whether the text is classified as toxic
+                - is_toxic (bool): Whether the score reaches the threshold
+                - flagged (bool): Whether the scorer flagged the text
                 - categories (dict): Breakdown of toxicity categories
         """
+        return next(self._iter_scores([text], safer_value))
+    
+    def _cached_result(self, text, safer_value):
+        """Result that needs no scoring (empty text or a cache hit), or None."""
         if not text or len(text.strip()) == 0:
-            return {'score': 0, 'is_toxic': False, 'categories': {}}
+            return {'score': 0, 'is_toxic': False, 'categories': {}, 'status': 'ok'}
         
-        safer_value = 0.02
-        if has_app_context():
-            safer_value = current_app.config.get('SAFER_VALUE', 0.02)
+        cache = self.cache
+        if cache is not None:
+            cached = cache.get(score_cache_key(text, safer_value))
+            if cached is not None:
+                return self.classify(dict(cached))
+        return None
+    
+    def _unscored(self, status, error, fallback=None):
+        """Result for a text the API did not score: the local fallback, or a marked placeholder."""
+        if fallback is not None:
+            return self.classify(dict(fallback))
+        return {'score': 0, 'is_toxic': False, 'categories': {}, 'status': status, 'error': error}
+    
+    def _call_timeout(self, deadline=None):
+        """Seconds a call may take: the per-call timeout, capped by the request deadline."""
+        call_timeout, _ = self._deadlines()
+        return deadline.timeout(call_timeout) if deadline is not None else call_timeout
+    
+    def _resolve(self, text, safer_value, future=None, fallback=None, deadline=None):
+        """
+        Get the API's result for a text and classify it.
         
-        # Log API request details
-        self._log("\n======== API REQUEST ========")
-        self._log(f"Text: {text[:50]}...")
-        self._log(f"Safer value: {safer_value}")
-        self._log(f"API endpoint: /fetch_toxicity_level")
+        Args:
+            text (str): The text being scored
+            safer_value (float): Safer value sent to the API
+            future (Future): Pending response from RemoteScorer.submit, None to call the API now
+            fallback (dict): Local result to use if the API call fails
+            deadline (Deadline): Deadline of the whole request
+        """
+        timeout = self._call_timeout(deadline)
+        if timeout is not None and timeout <= 0:
+            self._release(text, safer_value, future)
+            return self._unscored('timeout', 'Request deadline exceeded', fallback)
         
         try:
-            # Call the API using positional arguments
-            self._log("Calling API with positional arguments")
-            _, json_result = self.client.predict(
-                text,
-                safer_value,
-                api_name="/fetch_toxicity_level"
-            )
-            
-            self._log("Response received from API")
-            self._log(f"Response (first 100 chars): {json_result[:100]}...")
-            
-            # Parse the JSON string result
-            result_dict = json.loads(json_result)
-            
-            # Extract the overall toxicity score - use sum_value as the overall score
-            toxicity_score = result_dict.get('sum_value', 0)
-            
-            # Determine if the text is toxic based on the is_flagged or is_safer_flagged fields
-            is_toxic = result_dict.get('is_flagged', False) or result_dict.get('is_safer_flagged', False)
-            
-            # Extract individual toxicity categories
-            categories = {
-                'harassment': result_dict.get('harassment', 0),
-                'harassment_threatening': result_dict.get('harassment_threatening', 0),
-                'hate': result_dict.get('hate', 0),
-                'hate_threatening': result_dict.get('hate_threatening', 0),
-                'self_harm': result_dict.get('self_harm', 0),
-                'self_harm_instructions': result_dict.get('self_harm_instructions', 0),
-                'self_harm_intent': result_dict.get('self_harm_intent', 0),
-                'sexual': result_dict.get('sexual', 0),
-                'sexual_minors': result_dict.get('sexual_minors', 0),
-                'violence': result_dict.get('violence', 0),
-                'violence_graphic': result_dict.get('violence_graphic', 0)
-            }
-            
-            # Log the max category
-            max_key = result_dict.get('max_key', 'none')
-            max_value = result_dict.get('max_value', 0)
-            self._log(f"Highest toxicity category: {max_key} ({max_value:.4f})")
-            
-            self._log(f"Toxicity analysis complete: score={toxicity_score}, is_toxic={is_toxic}")
-            self._log("======== END API REQUEST ========\n")
-            
-            return {
-                'score': toxicity_score,
-                'is_toxic': is_toxic,
-                'categories': categories,
-                'max_category': max_key,
-                'max_value': max_value
-            }
-            
+            result = self.remote.result(text, safer_value, future, timeout)
+        except Exception as e:
+            if isinstance(e, ScoringTimeout):
+                self._release(text, safer_value, future)
+            return self._failed(text, safer_value, e, fallback)
+        return self._scored(text, safer_value, result)
+    
+    async def _resolve_async(self, text, safer_value, future=None, fallback=None, deadline=None):
+        """Async version of _resolve; waits for the API without blocking the event loop."""
+        timeout = self._call_timeout(deadline)
+        if timeout is not None and timeout <= 0:
+            self._release(text, safer_value, future)
+            return self._unscored('timeout', 'Request deadline exceeded', fallback)
+        
+        try:
+            result = await self.remote.result_async(text, safer_value, future, timeout)
         except Exception as e:
-            error_msg = str(e)
-            self._log(f"\n======== API ERROR ========", 'error')
-            self._log(f"Error: {error_msg}", 'error')
-            self._log(f"API call details:", 'error')
-            self._log(f"  - Endpoint: /fetch_toxicity_level", 'error')
-            self._log(f"  - Text: {text[:50]}...", 'error')
-            self._log(f"  - Safer value: {safer_value}", 'error')
+            if isinstance(e, ScoringTimeout):
+                self._release(text, safer_value, future)
+            return self._failed(text, safer_value, e, fallback)
+        return self._scored(text, safer_value, result)
+    
+    def _release(self, text, safer_value, future):
+        """Stop waiting for a call that timed out; a call shared with other requests keeps running for them."""
+        if future is not None:
+            self.remote.release(text, safer_value, future)
+    
+    def _scored(self, text, safer_value, result):
+        """Cache and classify a result from the API."""
+        if sample_comment(logger, self._sample_rate):
+            logger.debug("Scored %.50r (safer %s): score=%.4f flagged=%s top=%s (%.4f)", text, safer_value,
+                         result['score'], result['flagged'], result['max_category'], result['max_value'])
+        
+        cache = self.cache
+        if cache is not None:
+            cache.set(score_cache_key(text, safer_value), dict(result))
+        if self._prefilter is not None:
+            self._prefilter.remember(text, result, safer_value)
+        return self.classify(result)
+    
+    def _failed(self, text, safer_value, error, fallback=None):
+        """Result for a text whose API call raised error."""
+        if isinstance(error, CircuitOpenError):
+            # Logged once by the breaker, not once per comment
+            return self._unscored('unscored', 'Moderation API unavailable', fallback)
+        
+        if isinstance(error, ScoringTimeout):
+            # Counted in the thread summary and the upstream error metrics
+            logger.debug("Moderation call timed out: %s", error)
+            return self._unscored('timeout', str(error), fallback)
+        
+        # The stack trace only at DEBUG; it is the same for every comment of a failing batch
+        logger.error("Moderation call failed: %s: %s", type(error).__name__, error,
+                     exc_info=error if logger.isEnabledFor(logging.DEBUG) else None)
+        return self._unscored('unscored', str(error), fallback)
+        
+    def classify(self, toxicity, threshold=None):
+        """
+        Decide whether a scored text is toxic at the given threshold.
+        
+        Args:
+            toxicity (dict): Result of analyze_text
+            threshold (float): Cutoff for the score, defaults to self.threshold
             
-            import traceback
-            self._log(f"Stack trace: {traceback.format_exc()}", 'error')
-            self._log(f"======== END API ERROR ========\n", 'error')
+        Returns:
+            dict: The same dict with 'is_toxic' updated
+        """
+        if threshold is None:
+            threshold = self.threshold
+        # Results without categories were never scored (empty text or API error)
+        status = toxicity.setdefault('status', 'ok')
+        toxicity['is_toxic'] = status == 'ok' and bool(toxicity.get('categories')) and toxicity.get('score', 0) >= threshold
+        return toxicity
+    
+    def reclassify(self, comments, threshold=None, score_stats=None):
+        """
+        Re-apply a threshold to already scored comments without calling the API.
+        
+        A ScoredThread (app.records) is classified in bulk on its columns.
+        
+        Args:
+            comments (list): Comment dictionaries with a 'toxicity' field, or a ScoredThread
+            threshold (float): Cutoff for the score, defaults to self.threshold
+            score_stats (ScoreStats): Statistics of the comments' scores, if known
             
-            # Return a safe default value in case of error
-            return {'score': 0, 'is_toxic': False, 'categories': {}}
+        Returns:
+            dict: Recomputed toxicity statistics
+        """
+        if not comments:
+            return {'toxic_count': 0, 'toxic_percentage': 0, 'avg_toxicity': 0, 'total_comments': 0, 'unscored_count': 0, 'categories': {}}
+        from app.records import ScoredThread
+        with current_metrics().span('aggregate'):
+            if isinstance(comments, ScoredThread):
+                toxic_count = comments.classify(self.threshold if threshold is None else threshold)
+                if score_stats is None:
+                    score_stats = comments.score_stats()
+                return self._compute_stats(comments, score_stats, toxic_count)
+            toxic_count = 0
+            for comment in comments:
+                toxic_count += self.classify(comment['toxicity'], threshold)['is_toxic']
+            return self._compute_stats(comments, score_stats, toxic_count)
         
-    def analyze_comments(self, comments):
+    def analyze_comments(self, comments, snapshot=None, thread_id=None):
         """
         Analyze a list of comment dictionaries.
         
         Args:
             comments (list): List of comment dictionaries with 'body' field
+            snapshot (ThreadSnapshot): Previous analysis of the thread; only
+                comments that are new or edited since then are scored, and
+                the statistics report how many were reused and rescored
+            thread_id (str): Thread the comments belong to, for the log summary
             
         Returns:
             tuple: (augmented_comments, toxicity_stats)
@@ -169,64 +337,265 @@ class ToxicityDetector:
         """
         total_comments = len(comments)
         if total_comments == 0:
-            return [], {'toxic_count': 0, 'toxic_percentage': 0, 'avg_toxicity': 0, 'total_comments': 0, 'categories': {}}
+            self._reuse_snapshot(comments, snapshot)
+            return [], {'toxic_count': 0, 'toxic_percentage': 0, 'avg_toxicity': 0, 'total_comments': 0, 'unscored_count': 0, 'categories': {}}
+        
+        started = time.perf_counter()
+        pending = self._reuse_snapshot(comments, snapshot)
+        with current_metrics().span('score'):
+            scored = self._score_all([c['body'] for c in pending])
+        for comment, toxicity in zip(pending, scored):
+            comment['toxicity'] = toxicity
+        
+        stats = self._finish_snapshot(comments, snapshot)
+        self._log_summary(thread_id, comments, len(pending), started, stats)
+        return comments, stats
+    
+    async def analyze_comments_async(self, comments, snapshot=None, thread_id=None):
+        """
+        Async version of analyze_comments.
+        
+        The API calls run on the batcher's (or the scorer's) worker threads as
+        before, but waiting for them does not block the event loop, so one
+        worker can keep many analyses in flight.
+        """
+        total_comments = len(comments)
+        if total_comments == 0:
+            self._reuse_snapshot(comments, snapshot)
+            return [], {'toxic_count': 0, 'toxic_percentage': 0, 'avg_toxicity': 0, 'total_comments': 0, 'unscored_count': 0, 'categories': {}}
+        
+        started = time.perf_counter()
+        pending = self._reuse_snapshot(comments, snapshot)
+        with current_metrics().span('score'):
+            scored = await self._score_all_async([c['body'] for c in pending])
+        for comment, toxicity in zip(pending, scored):
+            comment['toxicity'] = toxicity
+        
+        stats = self._finish_snapshot(comments, snapshot)
+        self._log_summary(thread_id, comments, len(pending), started, stats)
+        return comments, stats
+    
+    def iter_analyze_comments(self, comments, snapshot=None, thread_id=None):
+        """
+        Score comments one by one, yielding each as soon as its score is in.
+        
+        Comments are yielded in input order with the 'toxicity' field set,
+        so a streamed page can render them while later ones are still being
+        scored. Call reclassify on the list afterwards for the statistics.
         
-        self._log(f"\n======== ANALYZING {total_comments} COMMENTS ========")
+        Args:
+            comments (list): List of comment dictionaries with 'body' field
+            snapshot (ThreadSnapshot): Previous analysis of the thread, whose
+                scores are reused for unchanged comments
+            thread_id (str): Thread the comments belong to, for the log summary
             
+        Yields:
+            dict: Each comment, augmented with its 'toxicity' field
+        """
+        started = time.perf_counter()
+        pending = self._reuse_snapshot(comments, snapshot)
+        scores = self._iter_scores([c['body'] for c in pending])
+        waiting = {id(c) for c in pending}
         for comment in comments:
-            comment['toxicity'] = self.analyze_text(comment['body'])
-            
-        # Calculate statistics
-        toxic_comments = [c for c in comments if c['toxicity']['is_toxic']]
-        toxic_count = len(toxic_comments)
-        toxic_percentage = (toxic_count / total_comments) * 100 if total_comments else 0
+            if id(comment) in waiting:
+                comment['toxicity'] = next(scores)
+            yield comment
+        if snapshot is not None:
+            snapshot.add_scored(comments)
+        if comments:
+            self._log_summary(thread_id, comments, len(pending), started)
+    
+    def _reuse_snapshot(self, comments, snapshot):
+        """
+        Take the scores of unchanged comments from a snapshot.
         
-        scores = [c['toxicity']['score'] for c in comments]
-        avg_toxicity = sum(scores) / total_comments if total_comments else 0
+        Returns:
+            list: The comments that still need scoring (all of them without a snapshot)
+        """
+        if snapshot is None:
+            return comments
+        pending = snapshot.reuse(comments)
+        waiting = {id(c) for c in pending}
+        for comment in comments:
+            if id(comment) not in waiting:
+                self.classify(comment['toxicity'])
+        return pending
+    
+    def _finish_snapshot(self, comments, snapshot):
+        """Statistics for analyzed comments, from the snapshot's running stats when there is one."""
+        with current_metrics().span('aggregate'):
+            if snapshot is None:
+                return self._compute_stats(comments)
+            snapshot.add_scored(comments)
+            stats = self._compute_stats(comments, snapshot.stats)
+            stats.update(snapshot.counts())
+            return stats
+    
+    def _score_all(self, texts):
+        """
+        Score texts concurrently, returning results in input order.
+        
+        Each text is scored independently: scoring never raises, so a slow
+        or failed call only affects its own result.
+        """
+        return list(self._iter_scores(texts))
+    
+    def _iter_scores(self, texts, safer_value=None):
+        """
+        Score texts with the configured scorer, yielding results in input order.
+        
+        Cached and locally scored results are available at once; texts that
+        need the API are sent together and yielded as their responses arrive.
+        """
+        if safer_value is None:
+            safer_value = self._safer_value()
+        deadline = Deadline(self._deadlines()[1])
+        results, missing, fallbacks = self._score_locally(texts, safer_value)
+        remote = self._iter_remote([texts[i] for i in missing], safer_value, [fallbacks.get(i) for i in missing], deadline)
+        for result in results:
+            yield result if result is not None else next(remote)
+    
+    async def _score_all_async(self, texts, safer_value=None):
+        """Async version of _score_all."""
+        if safer_value is None:
+            safer_value = self._safer_value()
+        deadline = Deadline(self._deadlines()[1])
+        results, missing, fallbacks = self._score_locally(texts, safer_value)
+        if missing:
+            scored = await self._remote_async([texts[i] for i in missing], safer_value,
+                                              [fallbacks.get(i) for i in missing], deadline)
+            for i, result in zip(missing, scored):
+                results[i] = result
+        return results
+    
+    def _score_locally(self, texts, safer_value):
+        """
+        Resolve everything that needs no API call: empty texts, cache hits and
+        local or prefilter decisions.
+        
+        Returns:
+            tuple: (results with None for texts needing the API, their indexes,
+                local fallback results by index)
+        """
+        results = [self._cached_result(text, safer_value) for text in texts]
+        missing = [i for i, result in enumerate(results) if result is None]
+        fallbacks = {}
+        
+        mode = self.scorer
+        if mode == 'local' and missing:
+            # One vectorized pass over every uncached text
+            local_results = self.local.score_batch([texts[i] for i in missing], safer_value)
+            for i, result in zip(missing, local_results):
+                results[i] = self.classify(result)
+            missing = []
+        elif mode == 'tiered' and missing:
+            decisions = self.prefilter.assess_batch([texts[i] for i in missing], safer_value, self.threshold)
+            uncertain = []
+            for i, decision in zip(missing, decisions):
+                if decision.verdict == UNCERTAIN:
+                    uncertain.append(i)
+                    fallbacks[i] = decision.result
+                else:
+                    results[i] = self.classify(decision.result)
+            logger.debug("Prefilter: %d decided locally, %d sent to the API", len(missing) - len(uncertain), len(uncertain))
+            missing = uncertain
+        elif mode not in ('remote', 'local', 'tiered'):
+            logger.warning("Unknown TOXICITY_SCORER '%s', using the remote scorer", mode)
+        return results, missing, fallbacks
+    
+    def _iter_remote(self, texts, safer_value, fallbacks, deadline=None):
+        """Score texts with the API concurrently, yielding results in input order as they complete."""
+        if not texts:
+            return
+        # Start every call at once: queued on the batcher with other requests'
+        # texts, or spread over the scorer's worker threads
+        remote = self.remote
+        futures = [remote.submit(text, safer_value) for text in texts]
+        try:
+            for index, (text, fallback) in enumerate(zip(texts, fallbacks)):
+                if _rejected(futures[index]) and remote.breaker.state == remote.breaker.CLOSED:
+                    # A probe succeeded while these texts waited; send them now
+                    for later in range(index, len(texts)):
+                        if _rejected(futures[later]):
+                            futures[later] = remote.submit(texts[later], safer_value)
+                yield self._resolve(text, safer_value, futures[index], fallback, deadline)
+        finally:
+            # Don't keep scoring for a client that has gone away
+            remote.close()
+    
+    async def _remote_async(self, texts, safer_value, fallbacks, deadline=None):
+        """Score texts with the API concurrently, without blocking the event loop."""
+        remote = self.remote
+        futures = [remote.submit(text, safer_value) for text in texts]
+        try:
+            results = list(await asyncio.gather(*(
+                self._resolve_async(text, safer_value, future, fallback, deadline)
+                for text, future, fallback in zip(texts, futures, fallbacks)
+            )))
+            # A probe may have closed the circuit after these texts were refused
+            refused = [i for i, future in enumerate(futures) if _rejected(future)]
+            if refused and remote.breaker.state == remote.breaker.CLOSED:
+                retried = await asyncio.gather(*(
+                    self._resolve_async(texts[i], safer_value, remote.submit(texts[i], safer_value), fallbacks[i], deadline)
+                    for i in refused
+                ))
+                for i, result in zip(refused, retried):
+                    results[i] = result
+            return results
+        finally:
+            remote.close()
+    
+    def _compute_stats(self, comments, score_stats=None, toxic_count=None):
+        """
+        Calculate aggregate toxicity statistics for scored comments.
+        
+        Comments the API could not score (status 'unscored' or 'timeout') are
+        counted in unscored_count and left out of every other figure, so
+        they are not mistaken for clean comments.
+        
+        Everything is gathered in one pass over the comments by a ScoreStats
+        accumulator, or taken from score_stats when the caller keeps one up to
+        date (see app.snapshots), with toxic_count counted while classifying.
+        """
+        total_comments = len(comments)
+        if score_stats is None or toxic_count is None:
+            accumulate = score_stats is None
+            if accumulate:
+                score_stats = ScoreStats()
+            toxic_count = 0
+            for comment in comments:
+                toxicity = comment['toxicity']
+                if accumulate:
+                    score_stats.add(toxicity)
+                toxic_count += bool(toxicity.get('is_toxic'))
+        unscored_count = score_stats.unscored
+        scored_count = score_stats.scored
+        
+        # Calculate statistics
+        toxic_percentage = (toxic_count / scored_count) * 100 if scored_count else 0
+        avg_toxicity = score_stats.scores.mean if scored_count else 0
         
         # Track the max category across all comments
-        top_category = None
-        top_category_value = 0
+        top_category = score_stats.top_category
+        top_category_value = score_stats.top_category_value
         
-        # For API results, gather category stats if available
-        categories = {}
-        for comment in comments:
-            # Ensure 'categories' key exists in toxicity
-            if 'toxicity' in comment and 'categories' in comment['toxicity']:
-                # Check if this comment has the highest category value so far
-                if 'max_category' in comment['toxicity'] and 'max_value' in comment['toxicity']:
-                    max_cat = comment['toxicity']['max_category']
-                    max_val = comment['toxicity']['max_value']
-                    if max_val > top_category_value:
-                        top_category = max_cat
-                        top_category_value = max_val
-                
-                for category, score in comment['toxicity']['categories'].items():
-                    if category not in categories:
-                        categories[category] = []
-                    categories[category].append(score)
+        category_averages = score_stats.category_means()
         
         # Ensure categories is not empty
-        if not categories:
-            categories = {
-                'harassment': [0],
-                'hate': [0],
-                'self_harm': [0],
-                'sexual': [0],
-                'violence': [0]
-            }
-        
-        category_averages = {
-            category: sum(scores) / len(scores) 
-            for category, scores in categories.items()
-        }
+        if not category_averages:
+            category_averages = {'harassment': 0.0, 'hate': 0.0, 'self_harm': 0.0, 'sexual': 0.0, 'violence': 0.0}
         
         stats = {
             'toxic_count': toxic_count,
             'toxic_percentage': toxic_percentage,
             'avg_toxicity': avg_toxicity,
             'total_comments': total_comments,
-            'categories': category_averages  # Always include categories
+            'unscored_count': unscored_count,
+            'categories': category_averages,  # Always include categories
+            'score_stddev': score_stats.scores.stddev,
+            'score_percentiles': score_stats.percentiles(),
+            # Comments per 0.1-wide score band, for the results page
+            'histogram': score_stats.histogram.coarse(10)
         }
         
         # Add the top category information if available
@@ -236,13 +605,42 @@ class ToxicityDetector:
         else:
             stats['top_category'] = 'none'
             stats['top_category_value'] = 0
+        return stats
+    
+    def _log_summary(self, thread_id, comments, scored_count, started, stats=None):
+        """
+        Log one record for an analyzed thread, with its figures as structured fields.
         
-        self._log(f"Comment analysis complete:")
-        self._log(f"  - Total comments: {total_comments}")
-        self._log(f"  - Toxic comments: {toxic_count} ({toxic_percentage:.1f}%)")
-        self._log(f"  - Average toxicity score: {avg_toxicity:.3f}")
-        if top_category:
-            self._log(f"  - Most severe category: {top_category} ({top_category_value:.4f})")
-        self._log(f"======== ANALYSIS COMPLETE ========\n")
-            
-        return comments, stats 
\ No newline at end of file
+        Args:
+            thread_id (str): The thread, None if the caller did not say
+            comments (list): All of the thread's comments, scored
+            scored_count (int): How many were sent for scoring (the rest were reused)
+            started (float): perf_counter() when the analysis started
+            stats (dict): The thread's statistics, counted from the comments if None
+        """
+        if not logger.isEnabledFor(logging.INFO):
+            return
+        if stats is None:
+            toxic_count = unscored_count = 0
+            for comment in comments:
+                toxicity = comment['toxicity']
+                toxic_count += bool(toxicity.get('is_toxic'))
+                unscored_count += toxicity.get('status', 'ok') != 'ok'
+            stats = {'toxic_count': toxic_count, 'unscored_count': unscored_count}
+        fields = {
+            'event': 'thread_analyzed',
+            'thread_id': thread_id,
+            'comments': len(comments),
+            'scored': scored_count,
+            'reused': len(comments) - scored_count,
+            'toxic': stats['toxic_count'],
+            'unscored': stats['unscored_count'],
+            'scorer': self.scorer,
+            'duration_ms': round((time.perf_counter() - started) * 1000, 1),
+        }
+        if 'avg_toxicity' in stats:
+            fields.update(avg_toxicity=round(stats['avg_toxicity'], 4),
+                          p90=stats['score_percentiles']['p90'], top_category=stats['top_category'])
+        logger.info("Analyzed thread %s: %d comments (%d scored, %d reused), %d toxic, %d unscored in %.0fms",
+                    thread_id or '-', fields['comments'], fields['scored'], fields['reused'], fields['toxic'],
+                    fields['unscored'], fields['duration_ms'], extra={'fields': fields})
@@ -0,0 +1,106 @@
+"""
+Pre-warming a worker process before it takes traffic.
+
+Modules only some requests need (numpy through app.records, BeautifulSoup)
+are imported on first use, and templates are compiled and moderation clients
+built on the first request that needs them. ``prewarm`` does all of that up
+front. gunicorn.conf.py runs the process-independent part once in the master
+when the app is preloaded, so forked workers inherit it, and builds the
+moderation clients and Reddit session in each worker after the fork.
+"""
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Templates rendered by the routes
+TEMPLATES = ('index.html', 'results.html', 'thread.html', 'job.html', 'about.html')
+
+# A one-comment old.reddit.com page for the parser to chew on
+SAMPLE_PAGE = (
+    b'<html><body><div class="content"><div class="thing link" id="thing_t3_warmup">'
+    b'<a class="title" href="#">Warm-up</a><p class="tagline">submitted '
+    b'<time datetime="2024-01-01T00:00:00+00:00">x</time> by <a class="author">op</a> to '
+    b'<a class="subreddit">r/warmup</a></p></div><div class="commentarea"><div class="sitetable nestedlisting">'
+    b'<div class="thing id-t1_c1 comment" id="thing_t1_c1" data-fullname="t1_c1"><div class="entry">'
+    b'<p class="tagline"><a class="author">user</a> <span class="score unvoted">1 point</span> '
+    b'<time datetime="2024-01-01T00:00:00+00:00">x</time></p><form class="usertext"><div class="usertext-body">'
+    b'<div class="md"><p>Warm-up comment</p></div></div></form></div><div class="child"></div></div>'
+    b'</div></div></body></html>'
+)
+
+
+def prewarm(app, local=True, clients=True):
+    """
+    Do the one-off work of a worker's first requests now.
+
+    Every step is best effort: a failure is logged and the worker starts anyway.
+
+    Args:
+        app: The Flask application
+        local: Import the lazily loaded modules, run the parser and the
+            columnar format once and compile the templates; this part
+            survives a fork
+        clients: Build the moderation clients and the Reddit HTTP session,
+            which belong to the process that will use them
+
+    Returns:
+        dict: Seconds taken by each step
+    """
+    steps = []
+    if local:
+        steps += [('imports', _import_lazy_modules), ('parser', _run_parser),
+                  ('records', _run_records), ('templates', _compile_templates)]
+        if 'local_scorer' in app.extensions:
+            steps.append(('local_scorer', _run_local_scorer))
+    if clients:
+        steps += [('moderation_clients', _build_moderation_clients), ('reddit_session', _open_reddit_session)]
+
+    timings = {}
+    with app.app_context():
+        for name, step in steps:
+            start = time.perf_counter()
+            try:
+                step(app)
+            except Exception as e:
+                logger.warning(f"Pre-warm step '{name}' failed: {str(e)}")
+            timings[name] = round(time.perf_counter() - start, 4)
+    logger.info(f"Pre-warmed in {sum(timings.values()):.2f}s: " +
+                ', '.join(f"{name} {seconds:.2f}s" for name, seconds in timings.items()))
+    return timings
+
+
+def _import_lazy_modules(app):
+    from app import records  # noqa: F401 (numpy)
+    if app.config.get('REDDIT_HTML_PARSER', 'stream') != 'stream':
+        import bs4  # noqa: F401
+
+
+def _run_parser(app):
+    from app.thread_parser import parse_thread_page
+    parse_thread_page([SAMPLE_PAGE], 'warmup', limit=1)
+
+
+def _run_records(app):
+    from app.records import ScoredThread
+    comment = {'id': 'c1', 'body': 'Warm-up comment', 'toxicity': {'score': 0.0, 'categories': {}, 'status': 'ok'}}
+    thread, _ = ScoredThread.from_bytes(ScoredThread.from_comments([comment]).to_bytes({}))
+    thread.score_stats()
+
+
+def _compile_templates(app):
+    for name in TEMPLATES:
+        app.jinja_env.get_template(name)
+
+
+def _run_local_scorer(app):
+    app.extensions['local_scorer'].score_batch(['Warm-up comment'], app.config.get('SAFER_VALUE', 0.02))
+
+
+def _build_moderation_clients(app):
+    app.extensions['moderation_pool'].warm()
+
+
+def _open_reddit_session(app):
+    from app.reddit_client import get_session
+    get_session()
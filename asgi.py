@@ -0,0 +1,13 @@
+"""
+RedTox - Reddit Proxy with Toxicity Detection
+ASGI entry point (async /thread, everything else through the Flask app)
+
+Run with an ASGI server, e.g.:
+    WEB_CONCURRENCY=2 uvicorn asgi:app
+"""
+from app import create_app
+from app.asgi import create_asgi_app
+from config import get_config
+
+flask_app = create_app(get_config())
+app = create_asgi_app(flask_app)
@@ -0,0 +1,138 @@
+"""
+Measure how closely tiered scoring agrees with scoring every comment remotely.
+
+The corpus is the comment bodies of a fixture thread (or a file with one text
+per line). Reference results come from the moderation API: record them once
+with --record, then replay them with --reference so that tuning the
+prefilter bands needs no network access. In tiered mode the API is only
+consulted for uncertain texts, so disagreements can only come from texts the
+prefilter decided locally.
+
+Usage:
+    python -m benchmarks.bench_agreement --record remote.jsonl [--size 500]
+    python -m benchmarks.bench_agreement --reference remote.jsonl [--low 0.2] [--high 0.9] [--output results.json]
+"""
+import argparse
+import json
+import sys
+import time
+
+from app import create_app
+from app.prefilter import UNCERTAIN, Prefilter
+from app.scorers import LocalLexiconScorer, RemoteScorer
+from app.thread_parser import parse_thread_json
+from benchmarks.fixtures import load_fixture
+
+
+def load_corpus(size, path=None):
+    """Return the texts to score: lines of a file, or the bodies of a fixture thread."""
+    if path:
+        with open(path, encoding='utf-8') as f:
+            return [line.strip() for line in f if line.strip()]
+    thread = parse_thread_json(load_fixture(size, 'json'), f"fx{size}", limit=size)
+    return [comment['body'] for comment in thread['comments']]
+
+
+def record_reference(texts, path, safer_value):
+    """Score every distinct text with the moderation API and save the results as JSON lines."""
+    app = create_app()
+    with app.app_context():
+        scorer = RemoteScorer(app.extensions['moderation_pool'], app.extensions.get('moderation_batcher'),
+                              app.config.get('MODERATION_CONCURRENCY', 4))
+        distinct = list(dict.fromkeys(texts))
+        start = time.perf_counter()
+        results = scorer.score_batch(distinct, safer_value)
+        print(f"Scored {len(distinct)} texts remotely in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    with open(path, 'w', encoding='utf-8') as f:
+        for text, result in zip(distinct, results):
+            f.write(json.dumps({'text': text, 'result': result}) + '\n')
+
+
+def load_reference(path):
+    with open(path, encoding='utf-8') as f:
+        return {row['text']: row['result'] for row in map(json.loads, f)}
+
+
+def compare(texts, reference, prefilter, threshold):
+    """Score texts in tiered mode and compare the verdicts with the reference."""
+    start = time.perf_counter()
+    decisions = prefilter.assess_batch(texts, threshold=threshold)
+    prefilter_seconds = time.perf_counter() - start
+
+    counts = {'tp': 0, 'fp': 0, 'fn': 0, 'tn': 0}
+    disagreements = []
+    score_error = 0.0
+    for text, decision in zip(texts, decisions):
+        expected = reference[text]
+        actual = expected if decision.verdict == UNCERTAIN else decision.result
+        expected_toxic = expected['score'] >= threshold
+        actual_toxic = actual['score'] >= threshold
+        counts[('t' if expected_toxic == actual_toxic else 'f') + ('p' if actual_toxic else 'n')] += 1
+        score_error += abs(actual['score'] - expected['score'])
+        if expected_toxic != actual_toxic:
+            disagreements.append({'text': text[:80], 'reason': decision.reason,
+                                  'local_score': round(decision.result['score'], 4),
+                                  'remote_score': round(expected['score'], 4)})
+
+    stats = prefilter.stats()
+    total = len(texts)
+    return {
+        'benchmark': 'agreement',
+        'texts': total,
+        'threshold': threshold,
+        'clean_below': prefilter.clean_below,
+        'toxic_above': prefilter.toxic_above,
+        'agreement': (counts['tp'] + counts['tn']) / total if total else 1.0,
+        'confusion': counts,
+        'mean_abs_score_error': score_error / total if total else 0.0,
+        'remote_calls': stats[UNCERTAIN],
+        'remote_avoided': stats['remote_avoided'],
+        'avoided_rate': stats['avoided_rate'],
+        'reasons': stats['reasons'],
+        'prefilter_ms': round(prefilter_seconds * 1000, 3),
+        'disagreements': disagreements,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--size', type=int, default=500, help="Fixture thread size used as the corpus")
+    parser.add_argument('--corpus', help="File with one text per line, instead of a fixture thread")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--record', help="Score the corpus with the moderation API and save the results here")
+    group.add_argument('--reference', help="Saved moderation API results to compare against")
+    parser.add_argument('--low', type=float, default=0.2, help="Local scores below this are clean")
+    parser.add_argument('--high', type=float, default=0.9, help="Local scores above this are toxic")
+    parser.add_argument('--short-words', type=int, default=2)
+    parser.add_argument('--threshold', type=float, default=0.7)
+    parser.add_argument('--safer-value', type=float, default=0.02)
+    parser.add_argument('--lexicon', help="Lexicon JSON file for the local scorer")
+    parser.add_argument('--output', help="Write JSON results to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    texts = load_corpus(args.size, args.corpus)
+    if args.record:
+        record_reference(texts, args.record, args.safer_value)
+        return
+
+    reference = load_reference(args.reference)
+    missing = [text for text in texts if text not in reference]
+    if missing:
+        parser.error(f"{len(missing)} corpus texts have no reference result; record them first")
+
+    prefilter = Prefilter(LocalLexiconScorer(args.lexicon), clean_below=args.low, toxic_above=args.high,
+                          short_words=args.short_words)
+    result = compare(texts, reference, prefilter, args.threshold)
+    print(f"agreement={result['agreement']:.2%} avoided={result['remote_avoided']}/{result['texts']} "
+          f"({result['avoided_rate']:.1%}) confusion={result['confusion']}", file=sys.stderr)
+
+    output = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
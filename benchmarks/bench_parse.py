@@ -0,0 +1,124 @@
+"""
+Compare the BeautifulSoup, streaming lxml and JSON listing extractors on fixtures.
+
+Reports parse time and peak traced memory for each fixture size and comment
+limit. That every path produces identical metadata and comments is checked by
+the unit tests in test_thread_parser.py.
+
+Usage:
+    python -m benchmarks.bench_parse [--sizes 20 500 5000] [--repeat 5] [--output results.json]
+"""
+import argparse
+import gc
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+
+from bs4 import BeautifulSoup
+from flask import Flask
+
+from app.reddit_client import extract_comments_from_html, extract_more_stubs, get_thread_metadata
+from app.thread_parser import parse_thread_json, parse_thread_page
+from benchmarks.fixtures import FIXTURE_SIZES, load_fixture
+
+CHUNK_SIZE = 64 * 1024
+
+
+def parse_soup(page, thread_id, limit):
+    soup = BeautifulSoup(page.decode('utf-8'), 'lxml')
+    comments = extract_comments_from_html(soup, limit=limit)
+    return {
+        'metadata': get_thread_metadata(soup, thread_id),
+        'comments': comments,
+        'more': extract_more_stubs(soup) if len(comments) < limit else []
+    }
+
+
+def parse_stream(page, thread_id, limit):
+    chunks = (page[i:i + CHUNK_SIZE] for i in range(0, len(page), CHUNK_SIZE))
+    return parse_thread_page(chunks, thread_id, limit=limit)
+
+
+def parse_json(page, thread_id, limit):
+    return parse_thread_json(page, thread_id, limit=limit)
+
+
+# Parser name -> (fixture format, parse function)
+PARSERS = {'soup': ('html', parse_soup), 'stream': ('html', parse_stream), 'json': ('json', parse_json)}
+
+
+def measure(parser, page, thread_id, limit, repeat):
+    """Return (result, median seconds, peak traced bytes) for one parser."""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        # Like timeit, keep the collector from billing earlier runs' garbage to this one
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            result = parser(page, thread_id, limit)
+            timings.append(time.perf_counter() - start)
+        finally:
+            gc.enable()
+
+    gc.collect()
+    tracemalloc.start()
+    parser(page, thread_id, limit)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, statistics.median(timings), peak
+
+
+def run(sizes, limits, repeat):
+    results = []
+    for size in sizes:
+        pages = {extension: load_fixture(size, extension) for extension in ('html', 'json')}
+        thread_id = f"fx{size}"
+        for limit in limits:
+            limit = limit or size
+            for name, (extension, parser) in PARSERS.items():
+                page = pages[extension]
+                output, seconds, peak = measure(parser, page, thread_id, limit, repeat)
+                results.append({
+                    'benchmark': 'parse',
+                    'parser': name,
+                    'comments_in_page': size,
+                    'limit': limit,
+                    'page_bytes': len(page),
+                    'comments_extracted': len(output['comments']),
+                    'median_seconds': round(seconds, 6),
+                    'peak_bytes': peak,
+                })
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(FIXTURE_SIZES))
+    parser.add_argument('--limits', type=int, nargs='+', default=[20, 0],
+                        help="Comment limits to test, 0 means all comments")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help="Write JSON results to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    with Flask(__name__).app_context():
+        results = run(args.sizes, args.limits, args.repeat)
+
+    for row in results:
+        print(f"{row['parser']:>6} size={row['comments_in_page']:>5} limit={row['limit']:>5} "
+              f"time={row['median_seconds'] * 1000:9.2f}ms peak={row['peak_bytes'] / 1024:9.0f}KiB",
+              file=sys.stderr)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
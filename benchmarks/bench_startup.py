@@ -0,0 +1,199 @@
+"""
+Report how fast a worker starts: the import profile and time to the first /thread.
+
+The import profile comes from ``python -X importtime -c "import run"``: the
+slowest modules by cumulative time, and which heavy modules are left for
+first use. Then gunicorn (gunicorn.conf.py, one worker) is started for each
+mode against the local stand-ins (benchmarks.standins), timing how long it
+takes to accept connections and to serve its first and second /thread:
+
+    cold      no preloading, no pre-warming
+    preload   app imported in the master (GUNICORN_PRELOAD=1)
+    prewarm   preload, plus the pre-warming of app.warmup (STARTUP_PREWARM=1)
+
+Building a client for the moderation stand-in costs next to nothing, unlike
+the real Space's handshake, so the modes differ here by imports, parser and
+template warm-up only.
+
+Usage:
+    python -m benchmarks.bench_startup [--modes cold preload prewarm] [--repeat 3] [--size 500]
+        [--output results.json]
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import requests
+
+from benchmarks.bench_thread import git_commit
+from benchmarks.fixtures import load_fixture
+from benchmarks.standins import start_moderation, start_reddit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules worth keeping out of start-up; reported when they are imported anyway
+HEAVY_MODULES = ('numpy', 'bs4', 'gradio_client', 'httpx', 'huggingface_hub')
+
+MODES = {
+    'cold': {'GUNICORN_PRELOAD': '0', 'STARTUP_PREWARM': '0'},
+    'preload': {'GUNICORN_PRELOAD': '1', 'STARTUP_PREWARM': '0'},
+    'prewarm': {'GUNICORN_PRELOAD': '1', 'STARTUP_PREWARM': '1'},
+}
+
+
+def import_profile(env, top):
+    """Cumulative import times of ``import run``, slowest first."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import run'], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True)
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = (field.strip() for field in line[len('import time:'):].split('|'))
+        modules[name] = int(cumulative) / 1e6
+    slowest = sorted(((name, seconds) for name, seconds in modules.items() if name != 'run'),
+                     key=lambda item: item[1], reverse=True)[:top]
+    return {
+        'benchmark': 'import',
+        'module': 'run',
+        'import_seconds': round(modules.get('run', 0.0), 6),
+        'slowest': [{'module': name, 'seconds': round(seconds, 6)} for name, seconds in slowest],
+        'heavy_imported': [name for name in HEAVY_MODULES if name in modules],
+        'heavy_deferred': [name for name in HEAVY_MODULES if name not in modules],
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, process, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with status {process.returncode}")
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.01)
+    raise RuntimeError(f"gunicorn did not accept connections within {timeout}s")
+
+
+def start_once(env, mode, size, run_number, timeout):
+    """Start gunicorn in one mode and time it up to its second /thread."""
+    port = free_port()
+    env = dict(env, GUNICORN_BIND=f"127.0.0.1:{port}", **MODES[mode])
+    url = f"http://127.0.0.1:{port}/thread"
+    timings = {}
+    launched = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'run:app'], cwd=ROOT,
+                               env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port, process, timeout)
+        timings['ready_seconds'] = time.perf_counter() - launched
+        statuses = []
+        for name in ('first_thread_seconds', 'second_thread_seconds'):
+            thread_url = f"https://www.reddit.com/r/fixtures/comments/fx{size}s{mode}{run_number}{name[0]}/bench/"
+            start = time.perf_counter()
+            response = requests.get(url, params={'thread_url': thread_url}, timeout=timeout)
+            timings[name] = time.perf_counter() - start
+            statuses.append(response.status_code)
+        timings['launch_to_first_thread_seconds'] = timings['ready_seconds'] + timings['first_thread_seconds']
+        return timings, sum(status != 200 for status in statuses)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def run(args):
+    load_fixture(args.size, 'html')
+    reddit = start_reddit(latency=args.reddit_latency)
+    moderation = start_moderation(latency=args.latency)
+    env = dict(
+        os.environ,
+        REDDIT_BASE_URL=reddit.url,
+        MODERATION_BACKEND='http',
+        MODERATION_SPACE=moderation.url,
+        REDDIT_COMMENT_LIMIT=str(args.size),
+        REDDIT_MAX_CALLS='1',
+        CACHE_TYPE='null',
+        LOG_LEVEL='WARNING',
+        GUNICORN_WORKERS='1',
+    )
+    results = [import_profile(env, args.top)]
+    try:
+        for mode in args.modes:
+            runs = [start_once(env, mode, args.size, number, args.timeout) for number in range(args.repeat)]
+            results.append({
+                'benchmark': 'startup',
+                'mode': mode,
+                'comments_in_page': args.size,
+                'runs': args.repeat,
+                **{name: round(statistics.median(timings[name] for timings, _ in runs), 6) for name in runs[0][0]},
+                'errors': sum(errors for _, errors in runs),
+            })
+    finally:
+        reddit.stop()
+        moderation.stop()
+
+    commit, dirty = git_commit()
+    return {
+        'meta': {
+            'commit': commit,
+            'dirty': dirty,
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'moderation_latency': args.latency,
+            'reddit_latency': args.reddit_latency,
+        },
+        'results': results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--modes', nargs='+', choices=list(MODES), default=list(MODES))
+    parser.add_argument('--repeat', type=int, default=3, help="Starts per mode; the median is reported")
+    parser.add_argument('--size', type=int, default=500, help="Fixture size of the /thread requests")
+    parser.add_argument('--latency', type=float, default=0.05, help="Seconds per moderation call")
+    parser.add_argument('--reddit-latency', type=float, default=0.05, help="Seconds per Reddit response")
+    parser.add_argument('--top', type=int, default=15, help="Slowest imports to list")
+    parser.add_argument('--timeout', type=float, default=120, help="Seconds to wait for a worker or a response")
+    parser.add_argument('--output', help="Write JSON results to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = run(args)
+
+    profile = report['results'][0]
+    print(f"import run: {profile['import_seconds'] * 1000:.0f}ms, deferred: {', '.join(profile['heavy_deferred'])}",
+          file=sys.stderr)
+    for row in profile['slowest'][:5]:
+        print(f"  {row['module']:<40} {row['seconds'] * 1000:8.1f}ms", file=sys.stderr)
+    for row in report['results'][1:]:
+        print(f"{row['mode']:>8}: ready {row['ready_seconds'] * 1000:7.0f}ms, first /thread "
+              f"{row['first_thread_seconds'] * 1000:7.0f}ms, second {row['second_thread_seconds'] * 1000:7.0f}ms, "
+              f"launch to first /thread {row['launch_to_first_thread_seconds'] * 1000:7.0f}ms, errors={row['errors']}",
+              file=sys.stderr)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
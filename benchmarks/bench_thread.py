@@ -0,0 +1,283 @@
+"""
+Measure end-to-end /thread latency, throughput and memory against local stand-ins.
+
+The app is served over HTTP on a local port, fetching the fixture threads
+from the Reddit stand-in and scoring them with the moderation stand-in
+(benchmarks.standins), so nothing goes over the network. Every request asks
+for a thread ID that has not been seen before, and CACHE_TYPE defaults to
+'null', so each request fetches, parses and scores the whole thread; pass
+--cache simple to measure with the caches instead.
+
+Latency is measured one request at a time for each fixture size, with the
+mean time spent in each step (Reddit fetch, parse, moderation, scoring,
+render) taken from the span totals the app reports on /metrics. Throughput is
+measured with several clients requesting the --load-size thread at once.
+With --memory, one more request per size runs under tracemalloc for its peak
+allocation. The JSON results carry the commit and settings they were taken
+with, for benchmarks.compare.
+
+Usage:
+    python -m benchmarks.bench_thread [--sizes 20 500 5000] [--requests 5] [--concurrency 1 8 32]
+        [--latency 0.05] [--error-rate 0] [--memory] [--set NAME=VALUE ...] [--output results.json]
+"""
+import argparse
+import itertools
+import json
+import math
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import requests
+from werkzeug.serving import make_server
+
+from app import create_app
+from benchmarks.fixtures import FIXTURE_SIZES, load_fixture
+from benchmarks.standins import start_moderation, start_reddit
+from config import ProductionConfig
+
+_thread_numbers = itertools.count(1)
+_sessions = threading.local()
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def span_totals(base_url):
+    """Seconds spent in each span so far, from the app's /metrics."""
+    totals = {}
+    for line in requests.get(f"{base_url}/metrics", timeout=60).text.splitlines():
+        if line.startswith('redtox_span_seconds_sum{span="'):
+            labels, value = line.rsplit(' ', 1)
+            totals[labels[len('redtox_span_seconds_sum{span="'):-2]] = float(value)
+    return totals
+
+
+def max_rss_bytes():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def git_commit():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=root, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=root,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+
+def parse_setting(text):
+    """NAME=VALUE from --set; the value is read as JSON when it is valid JSON."""
+    name, _, value = text.partition('=')
+    try:
+        return name, json.loads(value)
+    except ValueError:
+        return name, value
+
+
+class AppServer:
+    """The app on a local port, configured to use the stand-ins."""
+
+    def __init__(self, settings):
+        config = type('BenchmarkConfig', (ProductionConfig,), settings)
+        self.app = create_app(config)
+        self._server = make_server('127.0.0.1', 0, self.app, threaded=True)
+        self.url = f"http://127.0.0.1:{self._server.server_port}"
+        self._thread = threading.Thread(target=self._server.serve_forever, name='bench-app', daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+
+
+def get_thread(base_url, size):
+    """
+    Request /thread for a new copy of a fixture thread.
+
+    Returns:
+        tuple: (seconds, HTTP status or None on a connection error)
+    """
+    session = getattr(_sessions, 'session', None)
+    if session is None:
+        session = _sessions.session = requests.Session()
+    thread_url = f"https://www.reddit.com/r/fixtures/comments/fx{size}r{next(_thread_numbers)}/bench/"
+    start = time.perf_counter()
+    try:
+        response = session.get(f"{base_url}/thread", params={'thread_url': thread_url}, timeout=600)
+        response.content
+    except requests.RequestException:
+        return time.perf_counter() - start, None
+    return time.perf_counter() - start, response.status_code
+
+
+def summarize(timings):
+    return {
+        'median_seconds': round(statistics.median(timings), 6),
+        'p95_seconds': round(percentile(timings, 0.95), 6),
+        'min_seconds': round(min(timings), 6),
+        'max_seconds': round(max(timings), 6),
+    }
+
+
+def measure_latency(server, moderation, size, count, memory):
+    calls_before = moderation.stats()['requests']
+    spans_before = span_totals(server.url)
+    results = [get_thread(server.url, size) for _ in range(count)]
+    spans_after = span_totals(server.url)
+    timings = [seconds for seconds, _ in results]
+    row = {
+        'benchmark': 'thread_latency',
+        'comments_in_page': size,
+        'requests': count,
+        **summarize(timings),
+        'errors': sum(status != 200 for _, status in results),
+        'moderation_calls': moderation.stats()['requests'] - calls_before,
+        # Mean milliseconds per request in each step; moderation calls overlap,
+        # so their total can exceed the request's duration
+        'spans_ms': {
+            name: round((total - spans_before.get(name, 0.0)) * 1000 / count, 3)
+            for name, total in sorted(spans_after.items())
+        },
+    }
+    if memory:
+        tracemalloc.start()
+        get_thread(server.url, size)
+        row['peak_traced_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    row['max_rss_bytes'] = max_rss_bytes()
+    return row
+
+
+def measure_throughput(server, moderation, size, concurrency, per_client):
+    total = concurrency * per_client
+    calls_before = moderation.stats()['requests']
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda _: get_thread(server.url, size), range(total)))
+    seconds = time.perf_counter() - start
+    return {
+        'benchmark': 'thread_throughput',
+        'comments_in_page': size,
+        'concurrency': concurrency,
+        'requests': total,
+        'seconds': round(seconds, 6),
+        'requests_per_second': round(total / seconds, 3),
+        **summarize([elapsed for elapsed, _ in results]),
+        'errors': sum(status != 200 for _, status in results),
+        'moderation_calls': moderation.stats()['requests'] - calls_before,
+        'max_rss_bytes': max_rss_bytes(),
+    }
+
+
+def run(args):
+    # Generate any missing fixture before the clock starts
+    for size in set(args.sizes) | {args.load_size}:
+        load_fixture(size, 'html')
+        load_fixture(size, 'json')
+
+    reddit = start_reddit(latency=args.reddit_latency)
+    moderation = start_moderation(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate)
+    settings = {
+        'REDDIT_BASE_URL': reddit.url,
+        'MODERATION_BACKEND': 'http',
+        'MODERATION_SPACE': moderation.url,
+        'MODERATION_POOL_SIZE': args.pool_size,
+        'MODERATION_MAX_IN_FLIGHT': args.pool_size,
+        'REDDIT_COMMENT_LIMIT': max(set(args.sizes) | {args.load_size}),
+        # Only the thread page: the stand-in has no "load more" children to return
+        'REDDIT_MAX_CALLS': 1,
+        'CACHE_TYPE': args.cache,
+        'METRICS_ENABLED': True,
+        'LOG_LEVEL': 'WARNING',
+    }
+    settings.update(args.settings)
+
+    results = []
+    try:
+        with AppServer(settings) as server:
+            # The first request builds the client pools and sessions
+            get_thread(server.url, min(args.sizes))
+            for size in args.sizes:
+                results.append(measure_latency(server, moderation, size, args.requests, args.memory))
+            for concurrency in args.concurrency:
+                results.append(measure_throughput(server, moderation, args.load_size, concurrency, args.per_client))
+    finally:
+        reddit.stop()
+        moderation.stop()
+
+    commit, dirty = git_commit()
+    return {
+        'meta': {
+            'commit': commit,
+            'dirty': dirty,
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'moderation_latency': args.latency,
+            'moderation_jitter': args.jitter,
+            'moderation_error_rate': args.error_rate,
+            'reddit_latency': args.reddit_latency,
+            'settings': {name: value for name, value in settings.items() if not name.endswith(('_URL', '_SPACE'))},
+        },
+        'results': results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(FIXTURE_SIZES))
+    parser.add_argument('--requests', type=int, default=5, help="Sequential requests per size for latency")
+    parser.add_argument('--load-size', type=int, default=500, help="Fixture size used for the throughput runs")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--per-client', type=int, default=4, help="Requests per client in a throughput run")
+    parser.add_argument('--latency', type=float, default=0.05, help="Seconds per moderation call")
+    parser.add_argument('--jitter', type=float, default=0.02, help="Up to this many more seconds per moderation call")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of moderation calls that fail")
+    parser.add_argument('--reddit-latency', type=float, default=0.05, help="Seconds per Reddit response")
+    parser.add_argument('--pool-size', type=int, default=16, help="MODERATION_POOL_SIZE and MODERATION_MAX_IN_FLIGHT")
+    parser.add_argument('--cache', default='null', help="CACHE_TYPE of the app")
+    parser.add_argument('--memory', action='store_true', help="Trace the peak allocation of one request per size")
+    parser.add_argument('--set', dest='settings', type=parse_setting, action='append', default=[],
+                        metavar='NAME=VALUE', help="Override an app setting, e.g. --set MODERATION_BATCHING=false")
+    parser.add_argument('--output', help="Write JSON results to this file instead of stdout")
+    args = parser.parse_args(argv)
+    args.settings = dict(args.settings)
+
+    report = run(args)
+
+    for row in report['results']:
+        label = (f"latency size={row['comments_in_page']:>5}" if row['benchmark'] == 'thread_latency'
+                 else f"load c={row['concurrency']:>3} {row['requests_per_second']:8.2f} req/s")
+        print(f"{label} median={row['median_seconds'] * 1000:9.1f}ms p95={row['p95_seconds'] * 1000:9.1f}ms "
+              f"errors={row['errors']} calls={row['moderation_calls']} rss={row['max_rss_bytes'] / 2 ** 20:.0f}MiB",
+              file=sys.stderr)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
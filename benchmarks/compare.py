@@ -0,0 +1,98 @@
+"""
+Compare two benchmark result files, e.g. from the commits before and after a change.
+
+Rows of bench_parse, bench_thread and bench_startup output are matched on
+what they measure (benchmark, parser, mode, fixture size, limit, concurrency)
+and each timing, throughput and memory figure is printed with its change.
+
+Usage:
+    python -m benchmarks.compare before.json after.json [--output diff.json]
+"""
+import argparse
+import json
+import sys
+
+# Fields that say what a row measures, as opposed to what was measured
+KEY_FIELDS = ('benchmark', 'parser', 'mode', 'comments_in_page', 'limit', 'concurrency')
+
+# Measured figures and whether a lower value is better
+FIGURES = {
+    'import_seconds': True,
+    'launch_to_first_thread_seconds': True,
+    'first_thread_seconds': True,
+    'median_seconds': True,
+    'p95_seconds': True,
+    'requests_per_second': False,
+    'peak_bytes': True,
+    'peak_traced_bytes': True,
+    'max_rss_bytes': True,
+    'errors': True,
+    'moderation_calls': True,
+}
+
+
+def load_rows(path):
+    """Rows of a result file: a bare list (bench_parse) or {'meta', 'results'} (bench_thread, bench_startup)."""
+    with open(path) as f:
+        data = json.load(f)
+    return data['results'] if isinstance(data, dict) else data
+
+
+def row_key(row):
+    return tuple((field, row[field]) for field in KEY_FIELDS if field in row)
+
+
+def compare(before_rows, after_rows):
+    """
+    Match rows and compute the change of every figure they share.
+
+    Returns:
+        list: One dict per matched row with its key fields and, per figure,
+            before, after and the relative change (None when before is 0)
+    """
+    before = {row_key(row): row for row in before_rows}
+    changes = []
+    for row in after_rows:
+        previous = before.get(row_key(row))
+        if previous is None:
+            continue
+        figures = {}
+        for name in FIGURES:
+            if name in row and name in previous:
+                old, new = previous[name], row[name]
+                figures[name] = {'before': old, 'after': new, 'change': (new - old) / old if old else None}
+        changes.append({**dict(row_key(row)), 'figures': figures})
+    return changes
+
+
+def describe(change):
+    label = ' '.join(f"{field}={change[field]}" for field in KEY_FIELDS if field in change)
+    parts = []
+    for name, figure in change['figures'].items():
+        if figure['change'] is None:
+            parts.append(f"{name} {figure['before']} -> {figure['after']}")
+            continue
+        better = (figure['change'] < 0) == FIGURES[name] and figure['change'] != 0
+        parts.append(f"{name} {figure['change']:+.1%}{' (better)' if better else ''}")
+    return f"{label}: " + ', '.join(parts)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--output', help="Also write the comparison as JSON to this file")
+    args = parser.parse_args(argv)
+
+    changes = compare(load_rows(args.before), load_rows(args.after))
+    if not changes:
+        print("No benchmark in common", file=sys.stderr)
+    for change in changes:
+        print(describe(change))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(changes, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,301 @@
+"""
+Deterministic old.reddit.com thread fixtures for benchmarks.
+
+Each fixture exists as an HTML thread page and as the matching
+/comments/<id>.json listing, both rendered from the same seeded comment tree.
+Fixtures are generated rather than committed, so large ones do not bloat the
+repository. Run this module to write them to benchmarks/fixtures/.
+"""
+import html
+import json
+import os
+import random
+import sys
+from datetime import datetime, timezone
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+FIXTURE_SIZES = (20, 500, 5000)
+
+WORDS = (
+    "the a this that thread post comment reddit people think really good bad "
+    "idea agree disagree source link read article because never always maybe "
+    "love hate stupid idiot great terrible honestly literally why how what"
+).split()
+
+
+def _sentence(rng, length):
+    return ' '.join(rng.choice(WORDS) for _ in range(length)).capitalize() + '.'
+
+
+def _isoformat(timestamp):
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime('%Y-%m-%dT%H:%M:%S+00:00')
+
+
+def _body_html(paragraphs):
+    return '<div class="md">' + ''.join(f'<p>{html.escape(p)}</p>\n' for p in paragraphs) + '</div>'
+
+
+def _comment_html(node, thread_id, subreddit, children_html):
+    comment_id = node['id']
+    score = node['score']
+    author = node['author']
+    deleted = node['deleted']
+    classes = f" thing id-t1_{comment_id} noncollapsed comment {'deleted' if deleted else ''}"
+    if deleted:
+        tagline = '<span>[deleted]</span>'
+        body = '<div class="md"><p>[deleted]</p></div>'
+    else:
+        tagline = (
+            f'<a href="https://old.reddit.com/user/{author}" class="author may-blank id-t2_{comment_id}">{author}</a>'
+            f'<span class="userattrs"></span> '
+            f'<span class="score dislikes" title="{score - 1}">{score - 1} points</span>'
+            f'<span class="score unvoted" title="{score}">{score} points</span>'
+            f'<span class="score likes" title="{score + 1}">{score + 1} points</span> '
+            f'<time title="x" datetime="{_isoformat(node["created_utc"])}" class="live-timestamp">3 hours ago</time>'
+        )
+        body = _body_html(node['paragraphs'])
+    return (
+        f'<div class="{classes}" id="thing_t1_{comment_id}" onclick="click_thing(this)" '
+        f'data-fullname="t1_{comment_id}" data-type="comment" data-subreddit="{subreddit}">'
+        f'<p class="parent"><a name="{comment_id}"></a></p>'
+        f'<div class="midcol unvoted"><div class="arrow up login-required" role="button"></div></div>'
+        f'<div class="entry unvoted"><p class="tagline"><a href="javascript:void(0)" class="expand">[&ndash;]</a>{tagline}</p>'
+        f'<form action="#" class="usertext warn-on-unload" id="form-t1_{comment_id}">'
+        f'<input type="hidden" name="thing_id" value="t1_{comment_id}"/>'
+        f'<div class="usertext-body may-blank-within md-container ">{body}</div></form>'
+        f'<ul class="flat-list buttons"><li class="first">'
+        f'<a href="https://old.reddit.com/r/{subreddit}/comments/{thread_id}/fixture_thread/{comment_id}/" '
+        f'data-event-action="permalink" class="bylink" rel="nofollow">permalink</a></li>'
+        f'<li><a href="javascript:void(0)" class="embed-comment">embed</a></li></ul></div>'
+        f'<div class="child">{children_html}</div><div class="clearleft"></div></div>'
+        f'<div class="clearleft"></div>'
+    )
+
+
+def _more_html(thread_id, parent_id, child_ids):
+    ids = ','.join(child_ids)
+    return (
+        f'<div class=" thing id-t1_more{parent_id} morechildren" id="more_t1_{parent_id}" data-type="morechildren">'
+        f'<div class="entry unvoted"><span class="morecomments">'
+        f'<a class="button" id="more_{parent_id}" href="javascript:void(0)" '
+        f'onclick="return morechildren(this, \'t3_{thread_id}\', \'confidence\', \'{ids}\', \'False\')">'
+        f'load more comments<span class="gray">&nbsp;({len(child_ids)} replies)</span></a></span></div></div>'
+    )
+
+
+def generate_comment_tree(n_comments, seed=0, max_depth=8):
+    """
+    Build a random comment tree.
+
+    Returns:
+        list: Pre-order list of dicts with id, parent (index or None), depth,
+            author, score, created_utc, paragraphs and deleted flag
+    """
+    rng = random.Random(seed)
+    nodes = []
+    for index in range(n_comments):
+        parent = None
+        if nodes and rng.random() < 0.6:
+            candidate = rng.randrange(max(0, len(nodes) - 10), len(nodes))
+            if nodes[candidate]['depth'] < max_depth:
+                parent = candidate
+        nodes.append({
+            'id': f"c{index:x}{rng.randint(0, 0xfff):03x}",
+            'parent': parent,
+            'depth': 0 if parent is None else nodes[parent]['depth'] + 1,
+            'author': f"user_{rng.randint(1, 5000)}",
+            'score': rng.randint(-20, 2000),
+            'created_utc': 1700000000 + rng.randint(0, 86400 * 3),
+            'paragraphs': [_sentence(rng, rng.randint(3, 40)) for _ in range(rng.randint(1, 3))],
+            'deleted': rng.random() < 0.03,
+        })
+    return nodes
+
+
+def _nested_more_ids(node, index):
+    """IDs of the "load more" stub under a comment, empty for most comments."""
+    return [f"{node['id']}m{i}" for i in range(3)] if index % 7 == 0 else []
+
+
+def _children_map(nodes):
+    """Split a pre-order node list into root indexes and a parent -> children map."""
+    children = {}
+    roots = []
+    for index, node in enumerate(nodes):
+        (roots if node['parent'] is None else children.setdefault(node['parent'], [])).append(index)
+    return roots, children
+
+
+def _post(n_comments, seed):
+    rng = random.Random(-seed - 1)
+    return {
+        'title': f"Fixture thread with {n_comments} comments",
+        'author': 'fixture_op',
+        'score': 4321,
+        'created_utc': 1700000000 - rng.randint(0, 86400),
+        'selftext': _sentence(rng, 60),
+    }
+
+
+def thread_html(n_comments, thread_id='fx0001', subreddit='fixtures', seed=0):
+    """
+    Render an old.reddit.com style thread page with n_comments comments.
+
+    Args:
+        n_comments: Number of comments in the page
+        thread_id: Thread ID used in links and IDs
+        subreddit: Subreddit name
+        seed: Random seed, the same seed always gives the same page
+
+    Returns:
+        str: The page HTML
+    """
+    nodes = generate_comment_tree(n_comments, seed)
+    post = _post(n_comments, seed)
+    roots, children = _children_map(nodes)
+
+    def render(index):
+        node = nodes[index]
+        child_html = ''
+        if index in children:
+            more_ids = _nested_more_ids(node, index)
+            child_html = '<div id="siteTable_t1_{0}" class="sitetable listing">{1}{2}</div>'.format(
+                node['id'],
+                ''.join(render(child) for child in children[index]),
+                _more_html(thread_id, node['id'], more_ids) if more_ids else ''
+            )
+        return _comment_html(node, thread_id, subreddit, child_html)
+
+    sidebar = (
+        '<div class="side"><div class="spacer"><div class="titlebox">'
+        f'<h1 class="hover redditname"><a href="https://old.reddit.com/r/{subreddit}/" class="hover">{subreddit}</a></h1>'
+        '<div class="usertext-body"><div class="md"><p>Sidebar rules and links.</p></div></div>'
+        '</div></div></div>'
+    )
+    link = (
+        f'<div class=" thing id-t3_{thread_id} linkflair odd link self" id="thing_t3_{thread_id}" data-fullname="t3_{thread_id}">'
+        f'<div class="midcol unvoted"><div class="score unvoted" title="{post["score"]}">{post["score"]}</div></div>'
+        f'<div class="entry unvoted"><div class="top-matter"><p class="title">'
+        f'<a class="title may-blank" href="/r/{subreddit}/comments/{thread_id}/fixture_thread/">{html.escape(post["title"])}</a></p>'
+        f'<p class="tagline">submitted <time title="x" datetime="{_isoformat(post["created_utc"])}" class="live-timestamp">4 hours ago</time> by '
+        f'<a href="https://old.reddit.com/user/{post["author"]}" class="author may-blank">{post["author"]}</a> to '
+        f'<a href="https://old.reddit.com/r/{subreddit}/" class="subreddit hover may-blank">r/{subreddit}</a></p>'
+        f'<ul class="flat-list buttons"><li class="first"><a href="#" class="bylink comments may-blank">{n_comments} comments</a></li></ul>'
+        f'</div><div class="expando"><form class="usertext"><div class="usertext-body"><div class="md">'
+        f'<p>{post["selftext"]}</p></div></div></form></div></div></div>'
+    )
+    more = _more_html(thread_id, nodes[-1]['id'] if nodes else 'root', [f"m{i:x}" for i in range(25)])
+    comments = ''.join(render(root) for root in roots)
+    return (
+        '<!doctype html><html xmlns="http://www.w3.org/1999/xhtml" lang="en"><head>'
+        f'<meta charset="UTF-8"/><title>Fixture thread : {subreddit}</title>'
+        '<script type="text/javascript">var r = {"config": {}};</script></head><body>'
+        f'{sidebar}<div class="content" role="main"><div class="sitetable linklisting" id="siteTable">{link}</div>'
+        f'<div class="commentarea"><div class="sitetable nestedlisting" id="siteTable_t3_{thread_id}">{comments}{more}</div></div>'
+        '</div><div class="footer-parent"><p>footer</p></div></body></html>'
+    )
+
+
+def thread_json(n_comments, thread_id='fx0001', subreddit='fixtures', seed=0):
+    """
+    Render the /comments/<id>.json?raw_json=1 listing matching thread_html.
+
+    Args:
+        n_comments: Number of comments in the listing
+        thread_id: Thread ID used in links and IDs
+        subreddit: Subreddit name
+        seed: Random seed, the same seed gives the same comments as thread_html
+
+    Returns:
+        str: The listing JSON
+    """
+    nodes = generate_comment_tree(n_comments, seed)
+    post = _post(n_comments, seed)
+    roots, children = _children_map(nodes)
+
+    def listing(items):
+        return {'kind': 'Listing', 'data': {'after': None, 'before': None, 'children': items}}
+
+    def render(index):
+        node = nodes[index]
+        parent = f"t3_{thread_id}" if node['parent'] is None else f"t1_{nodes[node['parent']]['id']}"
+        replies = [render(child) for child in children.get(index, [])]
+        more_ids = _nested_more_ids(node, index)
+        if replies and more_ids:
+            replies.append({'kind': 'more', 'data': {
+                'count': len(more_ids),
+                'name': f"t1_{more_ids[0]}",
+                'id': more_ids[0],
+                'parent_id': f"t1_{node['id']}",
+                'depth': node['depth'] + 1,
+                'children': more_ids,
+            }})
+        return {'kind': 't1', 'data': {
+            'id': node['id'],
+            'name': f"t1_{node['id']}",
+            'parent_id': parent,
+            'link_id': f"t3_{thread_id}",
+            'author': '[deleted]' if node['deleted'] else node['author'],
+            'body': '[deleted]' if node['deleted'] else '\n\n'.join(node['paragraphs']),
+            'body_html': _body_html(['[deleted]'] if node['deleted'] else node['paragraphs']),
+            'score': node['score'],
+            'score_hidden': False,
+            'created_utc': float(node['created_utc']),
+            'depth': node['depth'],
+            'permalink': f"/r/{subreddit}/comments/{thread_id}/fixture_thread/{node['id']}/",
+            'replies': listing(replies) if replies else '',
+        }}
+
+    more_ids = [f"m{i:x}" for i in range(25)]
+    more = {'kind': 'more', 'data': {
+        'count': len(more_ids),
+        'name': f"t1_{more_ids[0]}",
+        'id': more_ids[0],
+        'parent_id': f"t3_{thread_id}",
+        'depth': 0,
+        'children': more_ids,
+    }}
+    link = {'kind': 't3', 'data': {
+        'id': thread_id,
+        'name': f"t3_{thread_id}",
+        'title': post['title'],
+        'author': post['author'],
+        'score': post['score'],
+        'created_utc': float(post['created_utc']),
+        'num_comments': n_comments,
+        'subreddit': subreddit,
+        'selftext': post['selftext'],
+        'permalink': f"/r/{subreddit}/comments/{thread_id}/fixture_thread/",
+    }}
+    return json.dumps([listing([link]), listing([render(root) for root in roots] + [more])])
+
+
+def fixture_path(n_comments, extension='html'):
+    """Path of the saved fixture for a given size."""
+    return os.path.join(FIXTURE_DIR, f"thread_{n_comments}.{extension}")
+
+
+def load_fixture(n_comments, extension='html'):
+    """Return the fixture bytes ('html' or 'json'), generating and saving them on first use."""
+    path = fixture_path(n_comments, extension)
+    if not os.path.exists(path):
+        write_fixtures([n_comments])
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def write_fixtures(sizes=FIXTURE_SIZES):
+    """Write the HTML and JSON fixtures for the given sizes to FIXTURE_DIR."""
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    for size in sizes:
+        for extension, render in (('html', thread_html), ('json', thread_json)):
+            path = fixture_path(size, extension)
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                f.write(render(size, thread_id=f"fx{size}", seed=size))
+            os.replace(path + '.tmp', path)
+
+
+if __name__ == '__main__':
+    sizes = [int(arg) for arg in sys.argv[1:]] or FIXTURE_SIZES
+    write_fixtures(sizes)
+    print(f"Wrote {len(sizes)} fixtures to {FIXTURE_DIR}")
@@ -0,0 +1,246 @@
+"""
+Local stand-ins for Reddit and the moderation API, so benchmarks need no network.
+
+The Reddit stand-in serves the fixtures (benchmarks.fixtures) the way
+old.reddit.com serves a thread: /r/<sub>/comments/<id>/ returns the HTML
+page and /comments/<id>.json the JSON listing of the fixture whose size is in
+the thread ID, so fx500 and fx500r7 both get the 500-comment thread (a
+suffix makes each request a different thread for the app's caches).
+/api/morechildren.json answers with no comments. /r/<sub>/<sort>.json lists
+LISTING_THREADS threads, alternating between the small and medium fixtures,
+for scan.py.
+
+The moderation stand-in answers POST /fetch_toxicity_level {"msg", "safer"}
+with the moderation API's JSON result, after a configurable latency, and
+fails a configurable fraction of calls with HTTP 503. Its scores come from
+the local lexicon scorer, so the same text always gets the same result.
+
+Usage:
+    python -m benchmarks.standins [--reddit-port 8081] [--moderation-port 8082] [--latency 0.05]
+        [--jitter 0.02] [--error-rate 0.01]
+
+then start the app with REDDIT_BASE_URL=http://127.0.0.1:8081 MODERATION_BACKEND=http
+MODERATION_SPACE=http://127.0.0.1:8082.
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from app.scorers import CATEGORIES, LocalLexiconScorer
+from benchmarks.fixtures import load_fixture
+
+THREAD_PAGE = re.compile(r'^/r/[^/]+/comments/fx(\d+)[a-z0-9]*/')
+THREAD_JSON = re.compile(r'^/comments/fx(\d+)[a-z0-9]*\.json')
+LISTING = re.compile(r'^/r/([^/]+)/(hot|new|top|rising|controversial)\.json')
+
+# Threads in every subreddit listing, and the fixture sizes they take turns with
+LISTING_THREADS = 1000
+LISTING_SIZES = (20, 500)
+
+# Fixture bytes by (size, format), read from disk once
+fixture = lru_cache(maxsize=None)(load_fixture)
+
+
+class StandInServer(ThreadingHTTPServer):
+    """Threaded HTTP server with its request counters, run on a background thread."""
+
+    daemon_threads = True
+
+    def __init__(self, handler, port=0, latency=0.0, jitter=0.0, error_rate=0.0, seed=0):
+        """
+        Initialize the server.
+
+        Args:
+            handler: BaseHTTPRequestHandler subclass answering the requests
+            port: Port to listen on, 0 picks a free one
+            latency: Seconds every response is delayed by
+            jitter: Up to this many more seconds, at random
+            error_rate: Fraction of requests answered with HTTP 503
+            seed: Seed of the jitter and error draws
+        """
+        super().__init__(('127.0.0.1', port), handler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def delay(self):
+        """Sleep for the configured latency; return True if this request should fail."""
+        with self._lock:
+            self.requests += 1
+            extra = self._random.uniform(0, self.jitter) if self.jitter else 0.0
+            failed = self.error_rate > 0 and self._random.random() < self.error_rate
+            self.errors += failed
+        if self.latency or extra:
+            time.sleep(self.latency + extra)
+        return failed
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name=f"standin-{self.server_address[1]}",
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def stats(self):
+        with self._lock:
+            return {'requests': self.requests, 'errors': self.errors}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_HEAD(self):
+        # Health probe of the moderation client pool
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+
+class RedditHandler(_Handler):
+    """Serves fixture threads like old.reddit.com."""
+
+    def do_GET(self):
+        failed = self.server.delay()
+        path = self.path
+        if failed:
+            self.send_body(503, b'Service Unavailable', 'text/plain')
+        elif path.startswith('/api/morechildren.json'):
+            body = json.dumps({'json': {'errors': [], 'data': {'things': []}}}).encode()
+            self.send_body(200, body, 'application/json')
+        elif LISTING.match(path):
+            self.send_body(200, listing_page(LISTING.match(path).group(1), parse_qs(urlsplit(path).query)),
+                           'application/json')
+        elif THREAD_JSON.match(path):
+            self.send_body(200, fixture(int(THREAD_JSON.match(path).group(1)), 'json'), 'application/json')
+        elif THREAD_PAGE.match(path):
+            self.send_body(200, fixture(int(THREAD_PAGE.match(path).group(1)), 'html'),
+                           'text/html; charset=UTF-8')
+        else:
+            self.send_body(404, b'Not Found', 'text/plain')
+
+
+class ModerationHandler(_Handler):
+    """Answers /fetch_toxicity_level like the moderation API."""
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.path != '/fetch_toxicity_level':
+            self.send_body(404, b'Not Found', 'text/plain')
+            return
+        failed = self.server.delay()
+        if failed:
+            self.send_body(503, b'Service Unavailable', 'text/plain')
+            return
+        request = json.loads(body)
+        self.send_body(200, moderation_result(request['msg'], request.get('safer', 0.02)).encode(),
+                       'application/json')
+
+
+def listing_page(subreddit, query):
+    """One page of a subreddit listing, paged with 'limit' and 'after' like Reddit's."""
+    limit = min(100, int(query.get('limit', ['25'])[0]))
+    after = query.get('after', [''])[0]
+    cursor = re.match(r't3_fx\d+l(\d+)$', after)
+    start = int(cursor.group(1)) + 1 if cursor else 0
+    children = []
+    for number in range(start, min(start + limit, LISTING_THREADS)):
+        size = LISTING_SIZES[number % len(LISTING_SIZES)]
+        thread_id = f"fx{size}l{number}"
+        children.append({'kind': 't3', 'data': {
+            'id': thread_id, 'name': f"t3_{thread_id}", 'title': f"Fixture thread {number}", 'author': 'fixture',
+            'score': LISTING_THREADS - number, 'num_comments': size, 'created_utc': 1700000000 + number,
+            'permalink': f"/r/{subreddit}/comments/{thread_id}/fixture_thread/", 'subreddit': subreddit,
+        }})
+    next_after = children[-1]['data']['name'] if children and start + len(children) < LISTING_THREADS else None
+    return json.dumps({'kind': 'Listing', 'data': {'after': next_after, 'children': children}}).encode()
+
+
+_scorer = None
+_scorer_lock = threading.Lock()
+
+
+def moderation_result(text, safer_value):
+    """The moderation API's JSON result for a text, scored by the local lexicon scorer."""
+    global _scorer
+    if _scorer is None:
+        with _scorer_lock:
+            if _scorer is None:
+                _scorer = LocalLexiconScorer()
+    result = _scorer.score(text, safer_value)
+    categories = {category: result['categories'].get(category, 0.0) for category in CATEGORIES}
+    max_key = max(categories, key=categories.get)
+    return json.dumps(dict(
+        categories,
+        sum_value=result['score'],
+        max_key=max_key,
+        max_value=categories[max_key],
+        is_flagged=result['flagged'],
+        is_safer_flagged=categories[max_key] > safer_value,
+    ))
+
+
+def start_reddit(port=0, latency=0.0, jitter=0.0, error_rate=0.0):
+    """Start the Reddit stand-in on a background thread."""
+    return StandInServer(RedditHandler, port, latency, jitter, error_rate).start()
+
+
+def start_moderation(port=0, latency=0.0, jitter=0.0, error_rate=0.0):
+    """Start the moderation stand-in on a background thread."""
+    return StandInServer(ModerationHandler, port, latency, jitter, error_rate, seed=1).start()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--reddit-port', type=int, default=8081)
+    parser.add_argument('--moderation-port', type=int, default=8082)
+    parser.add_argument('--reddit-latency', type=float, default=0.0, help="Seconds per Reddit response")
+    parser.add_argument('--latency', type=float, default=0.05, help="Seconds per moderation call")
+    parser.add_argument('--jitter', type=float, default=0.02, help="Up to this many more seconds per moderation call")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of moderation calls that fail")
+    args = parser.parse_args(argv)
+
+    reddit = start_reddit(args.reddit_port, args.reddit_latency)
+    moderation = start_moderation(args.moderation_port, args.latency, args.jitter, args.error_rate)
+    print(f"REDDIT_BASE_URL={reddit.url} MODERATION_BACKEND=http MODERATION_SPACE={moderation.url}", file=sys.stderr)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        reddit.stop()
+        moderation.stop()
+
+
+if __name__ == '__main__':
+    main()
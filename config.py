@@ -12,19 +12,120 @@ class Config:
     DEBUG = FLASK_DEBUG
     
     # Reddit scraping settings
+    # Where thread pages are fetched from, e.g. a local stand-in for benchmarks
+    REDDIT_BASE_URL = os.environ.get('REDDIT_BASE_URL', 'https://old.reddit.com')
     REDDIT_USER_AGENT = os.environ.get('REDDIT_USER_AGENT', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36')
     REDDIT_REQUEST_TIMEOUT = int(os.environ.get('REDDIT_REQUEST_TIMEOUT', 10))
+    REDDIT_POOL_SIZE = int(os.environ.get('REDDIT_POOL_SIZE', 10))
+    REDDIT_MAX_RETRIES = int(os.environ.get('REDDIT_MAX_RETRIES', 3))
+    REDDIT_RETRY_BACKOFF = float(os.environ.get('REDDIT_RETRY_BACKOFF', 0.5))
+    REDDIT_MAX_RETRY_AFTER = float(os.environ.get('REDDIT_MAX_RETRY_AFTER', 30))
+    REDDIT_REVALIDATE_TIMEOUT = int(os.environ.get('REDDIT_REVALIDATE_TIMEOUT', 3600))
+    # Most requests per second this process sends to Reddit (0 for no limit),
+    # and how many may go back to back after an idle spell
+    REDDIT_RATE_LIMIT = float(os.environ.get('REDDIT_RATE_LIMIT', 0))
+    REDDIT_RATE_BURST = int(os.environ.get('REDDIT_RATE_BURST', 1))
+    # Per-thread fetch budget: comments kept, reply depth, requests to Reddit
+    # (the page plus "load more" calls) and seconds before no new request starts
+    REDDIT_COMMENT_LIMIT = int(os.environ.get('REDDIT_COMMENT_LIMIT', 20))
+    REDDIT_MAX_DEPTH = int(os.environ.get('REDDIT_MAX_DEPTH', 10))
+    REDDIT_MAX_CALLS = int(os.environ.get('REDDIT_MAX_CALLS', 6))
+    REDDIT_FETCH_DEADLINE = float(os.environ.get('REDDIT_FETCH_DEADLINE', 30))
+    # 'html' scrapes the thread page, 'json' reads the JSON listing (falls back to HTML)
+    REDDIT_BACKEND = os.environ.get('REDDIT_BACKEND', 'html')
+    # 'stream' parses with the incremental lxml extractor, 'soup' with BeautifulSoup
+    REDDIT_HTML_PARSER = os.environ.get('REDDIT_HTML_PARSER', 'stream')
     
     # Toxicity detection (Friendly_Text_Moderation API)
     TOXICITY_THRESHOLD = float(os.environ.get('TOXICITY_THRESHOLD', 0.7))
     SAFER_VALUE = float(os.environ.get('SAFER_VALUE', 0.02))
+    # Scoring backend: 'remote' (moderation API), 'local' (offline lexicon
+    # scorer) or 'tiered' (in-process prefilter, with only uncertain comments
+    # sent to the API; 'local_first' is an alias)
+    TOXICITY_SCORER = os.environ.get('TOXICITY_SCORER', 'remote')
+    # Prefilter confidence band: local scores below LOW are clean, above HIGH toxic
+    LOCAL_CONFIRM_LOW = float(os.environ.get('LOCAL_CONFIRM_LOW', 0.2))
+    LOCAL_CONFIRM_HIGH = float(os.environ.get('LOCAL_CONFIRM_HIGH', 0.9))
+    LOCAL_SCORER_LEXICON = os.environ.get('LOCAL_SCORER_LEXICON')
+    # Comments with at most this many words and no keyword are clean
+    PREFILTER_SHORT_WORDS = int(os.environ.get('PREFILTER_SHORT_WORDS', 2))
+    # How long texts the API scored as clean skip the API
+    KNOWN_SAFE_TIMEOUT = int(os.environ.get('KNOWN_SAFE_TIMEOUT', 7 * 86400))
+    
+    # Moderation client pool (one pool per worker process)
+    MODERATION_SPACE = os.environ.get('MODERATION_SPACE', 'duchaba/Friendly_Text_Moderation')
+    # 'gradio' for the Space, or 'http' for a plain HTTP endpoint at MODERATION_SPACE
+    # answering POST /fetch_toxicity_level (such as benchmarks.standins)
+    MODERATION_BACKEND = os.environ.get('MODERATION_BACKEND', 'gradio')
+    MODERATION_POOL_SIZE = int(os.environ.get('MODERATION_POOL_SIZE', 4))
+    MODERATION_POOL_TIMEOUT = float(os.environ.get('MODERATION_POOL_TIMEOUT', 30))
+    MODERATION_CLIENT_MAX_IDLE = float(os.environ.get('MODERATION_CLIENT_MAX_IDLE', 300))
+    MODERATION_POOL_WARM = os.environ.get('MODERATION_POOL_WARM', '0') == '1'
+    MODERATION_CONCURRENCY = int(os.environ.get('MODERATION_CONCURRENCY', 4))
+    # Seconds to wait for one moderation call, and for all of a request's calls
+    MODERATION_CALL_TIMEOUT = float(os.environ.get('MODERATION_CALL_TIMEOUT', 20))
+    MODERATION_REQUEST_DEADLINE = float(os.environ.get('MODERATION_REQUEST_DEADLINE', 60))
+    # Consecutive failures that open the circuit, and seconds before it is probed again
+    MODERATION_BREAKER_FAILURES = int(os.environ.get('MODERATION_BREAKER_FAILURES', 5))
+    MODERATION_BREAKER_RESET = float(os.environ.get('MODERATION_BREAKER_RESET', 30))
+    # Send a duplicate request when a call runs longer than the recent p95 latency
+    MODERATION_HEDGE = os.environ.get('MODERATION_HEDGE', '0') == '1'
+    
+    # Micro-batching of moderation calls across concurrent requests: wait up to
+    # MODERATION_BATCH_WINDOW seconds to fill a batch, with at most
+    # MODERATION_MAX_IN_FLIGHT upstream calls running at once
+    MODERATION_BATCHING = os.environ.get('MODERATION_BATCHING', '1') == '1'
+    MODERATION_BATCH_WINDOW = float(os.environ.get('MODERATION_BATCH_WINDOW', 0.005))
+    MODERATION_BATCH_MAX_SIZE = int(os.environ.get('MODERATION_BATCH_MAX_SIZE', 32))
+    MODERATION_MAX_IN_FLIGHT = int(os.environ.get('MODERATION_MAX_IN_FLIGHT', MODERATION_POOL_SIZE))
+    
+    # Stream the thread page while comments are scored instead of rendering it at the end
+    THREAD_STREAMING = os.environ.get('THREAD_STREAMING', '1') == '1'
+    
+    # Prometheus-text /metrics endpoint and hot-path timing; SERVER_TIMING adds
+    # a Server-Timing header with each request's spans
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+    SERVER_TIMING = os.environ.get('SERVER_TIMING', '0') == '1'
     
     # Logging settings
     LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    # 'text' or 'json' (one object per record, with structured fields)
+    LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text')
+    # Write records from a background thread instead of the request thread
+    LOG_QUEUE = os.environ.get('LOG_QUEUE', '1') == '1'
+    # Fraction of scored comments logged at DEBUG (the per-thread summary is always at INFO)
+    LOG_COMMENT_SAMPLE_RATE = float(os.environ.get('LOG_COMMENT_SAMPLE_RATE', 0.01))
     
     # Cache settings
     CACHE_TYPE = os.environ.get('CACHE_TYPE', 'simple')
     CACHE_DEFAULT_TIMEOUT = int(os.environ.get('CACHE_DEFAULT_TIMEOUT', 300))
+    # Total for the in-memory caches, split between them by app.cache.MEMORY_CACHE_SHARES
+    CACHE_MAX_BYTES = int(os.environ.get('CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 100000))
+    CACHE_SQLITE_PATH = os.environ.get('CACHE_SQLITE_PATH')
+    SCORE_CACHE_TIMEOUT = int(os.environ.get('SCORE_CACHE_TIMEOUT', 86400))
+    ANALYSIS_MAX_AGE = int(os.environ.get('ANALYSIS_MAX_AGE', 300))
+    # Stale analyses are kept this long so a revisit only scores new and edited comments
+    ANALYSIS_SNAPSHOT_MAX_AGE = int(os.environ.get('ANALYSIS_SNAPSHOT_MAX_AGE', 86400))
+    # Directory for lock files that let worker processes wait for each other's
+    # analysis of the same thread (with CACHE_TYPE=sqlite); empty for in-process only
+    SINGLE_FLIGHT_LOCK_DIR = os.environ.get('SINGLE_FLIGHT_LOCK_DIR', '')
+    SINGLE_FLIGHT_LOCK_TIMEOUT = float(os.environ.get('SINGLE_FLIGHT_LOCK_TIMEOUT', 60))
+    
+    # Background analysis jobs: /analyze queues threads that aren't analyzed yet
+    # and shows a progress page ('background=1' in the URL does this per request)
+    ANALYSIS_JOBS = os.environ.get('ANALYSIS_JOBS', '0') == '1'
+    # 'memory' (one process) or 'sqlite' (jobs shared by all workers on the host);
+    # by default 'sqlite' when the server runs more than one worker process
+    JOB_BACKEND = os.environ.get('JOB_BACKEND', '')
+    # Worker processes serving the app: gunicorn.conf.py exports GUNICORN_WORKERS,
+    # and uvicorn takes its worker count from WEB_CONCURRENCY
+    WORKER_PROCESSES = int(os.environ.get('GUNICORN_WORKERS') or os.environ.get('WEB_CONCURRENCY') or 1)
+    JOB_SQLITE_PATH = os.environ.get('JOB_SQLITE_PATH')
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+    # Active jobs without progress for this long are run again; finished ones are kept JOB_RESULT_TTL
+    JOB_STALE_AFTER = int(os.environ.get('JOB_STALE_AFTER', 300))
+    JOB_RESULT_TTL = int(os.environ.get('JOB_RESULT_TTL', 3600))
 
 class DevelopmentConfig(Config):
     """Development configuration."""
@@ -0,0 +1,41 @@
+"""
+Gunicorn settings for RedTox:
+
+    gunicorn -c gunicorn.conf.py run:app
+
+The app is loaded once in the master (GUNICORN_PRELOAD=1), which also
+imports the lazily loaded modules, runs the parser and compiles the
+templates, so every worker forks with that done. Each worker then builds its
+moderation clients before it accepts requests, so its first /thread does not
+pay for the client handshakes. STARTUP_PREWARM=0 turns the pre-warming off.
+
+The server itself is set with GUNICORN_BIND, GUNICORN_WORKERS, GUNICORN_THREADS,
+GUNICORN_PRELOAD and GUNICORN_TIMEOUT.
+"""
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('GUNICORN_WORKERS', 2))
+# The app picks a job store that all workers share when there is more than one
+os.environ['GUNICORN_WORKERS'] = str(workers)
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+# Room for a worker to build its moderation clients before the first heartbeat
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+
+prewarm = os.environ.get('STARTUP_PREWARM', '1') == '1'
+
+
+def when_ready(server):
+    # Runs in the master once the preloaded app is imported, before the workers fork
+    if prewarm and preload_app:
+        from app.warmup import prewarm as prewarm_app
+        from run import app
+        prewarm_app(app, clients=False)
+
+
+def post_fork(server, worker):
+    if prewarm:
+        from app.warmup import prewarm as prewarm_app
+        from run import app
+        prewarm_app(app, local=not preload_app)
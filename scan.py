@@ -0,0 +1,340 @@
+"""
+RedTox - Subreddit toxicity scan
+Command-line entry point
+
+Scores the top threads of a subreddit and writes one report row per thread:
+
+    python scan.py AskReddit --limit 500 --time week --output askreddit.jsonl
+
+The listing is fetched once and saved, with the scan's settings, to a
+checkpoint file next to the output (<output>.checkpoint.json). Threads are
+then fetched and scored by --workers threads at a time, through the same
+analysis store, score cache, moderation batcher and single-flight groups as
+the web app, with every request to Reddit paced by --rate. Each row is
+appended to the output (JSON lines, or CSV for a .csv output) as soon as its
+thread is done, so an interrupted scan keeps its finished threads: run the
+same command with --resume to carry on with the threads that have no row yet
+(or only a 'failed' one, which is retried; the last row for a thread counts).
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from app import create_app
+from app.reddit_client import LISTING_SORTS, LISTING_TIME_FILTERS, fetch_subreddit_listing
+from app.routes import get_scored_thread
+from app.scorers import CATEGORIES
+from app.toxicity_detector import ToxicityDetector
+from config import get_config
+
+CHECKPOINT_VERSION = 1
+
+# Report columns; JSON lines also carry the per-category averages as 'categories'
+ROW_FIELDS = (
+    'thread_id', 'subreddit', 'title', 'author', 'score', 'num_comments', 'created_utc', 'permalink',
+    'status', 'error', 'comments', 'scored', 'unscored', 'toxic_count', 'toxic_percentage', 'avg_toxicity',
+    'p50', 'p90', 'p99', 'top_category', 'top_category_value', 'seconds',
+)
+CSV_FIELDS = ROW_FIELDS + tuple(f"category_{category}" for category in CATEGORIES)
+
+
+class JsonLinesReport:
+    """Report rows as one JSON object per line."""
+
+    def __init__(self, path):
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def write(self, row):
+        self._file.write(json.dumps(row, ensure_ascii=False) + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    @staticmethod
+    def read(path):
+        with open(path, encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+
+class CsvReport:
+    """Report rows as CSV, the category averages flattened into category_<name> columns."""
+
+    def __init__(self, path):
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, 'a', encoding='utf-8', newline='')
+        self._writer = csv.DictWriter(self._file, fieldnames=CSV_FIELDS, lineterminator='\n')
+        if new:
+            self._writer.writeheader()
+            self._file.flush()
+
+    def write(self, row):
+        flat = {name: row.get(name) for name in ROW_FIELDS}
+        # One physical line per row, so a torn last row can be cut off on resume
+        flat['title'] = ' '.join(str(row.get('title') or '').split())
+        for category, value in (row.get('categories') or {}).items():
+            if category in CATEGORIES:
+                flat[f"category_{category}"] = value
+        self._writer.writerow(flat)
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    @staticmethod
+    def read(path):
+        with open(path, encoding='utf-8', newline='') as f:
+            return list(csv.DictReader(f))
+
+
+REPORT_FORMATS = {'jsonl': JsonLinesReport, 'csv': CsvReport}
+
+
+def report_format(path, requested=None):
+    """The report format asked for, or the one the output's extension implies."""
+    if requested:
+        return requested
+    return 'csv' if path.lower().endswith('.csv') else 'jsonl'
+
+
+def drop_torn_row(path):
+    """Cut a row left half-written by an interrupted scan off the end of the output."""
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb+') as f:
+        data = f.read()
+        end = data.rfind(b'\n') + 1
+        if end < len(data):
+            f.truncate(end)
+
+
+def finished_threads(path, fmt):
+    """IDs of the threads the output already has a successful row for."""
+    if not os.path.exists(path):
+        return set()
+    status = {}
+    for row in REPORT_FORMATS[fmt].read(path):
+        status[row['thread_id']] = row.get('status')
+    return {thread_id for thread_id, last in status.items() if last == 'ok'}
+
+
+def save_checkpoint(path, checkpoint):
+    """Write the checkpoint atomically, so an interruption never leaves half of one."""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f)
+    os.replace(temp_path, path)
+
+
+def load_checkpoint(path):
+    with open(path, encoding='utf-8') as f:
+        checkpoint = json.load(f)
+    if checkpoint.get('version') != CHECKPOINT_VERSION:
+        raise ValueError(f"Unsupported checkpoint version in {path}")
+    return checkpoint
+
+
+def report_row(thread, stats=None, error=None):
+    """
+    Report row for one thread.
+
+    Args:
+        thread: Thread metadata from the subreddit listing
+        stats: Toxicity statistics of the scored thread
+        error: Why the thread could not be scored
+
+    Returns:
+        dict: The row, with the fields of ROW_FIELDS plus 'categories'
+    """
+    row = {
+        'thread_id': thread['id'],
+        'subreddit': thread.get('subreddit'),
+        'title': thread.get('title'),
+        'author': thread.get('author'),
+        'score': thread.get('score'),
+        'num_comments': thread.get('num_comments'),
+        'created_utc': thread.get('created_utc'),
+        'permalink': thread.get('permalink'),
+        'status': 'failed' if error else 'ok',
+        'error': error,
+    }
+    if stats is not None:
+        percentiles = stats.get('score_percentiles') or {}
+        row.update({
+            'comments': stats['total_comments'],
+            'scored': stats['total_comments'] - stats['unscored_count'],
+            'unscored': stats['unscored_count'],
+            'toxic_count': stats['toxic_count'],
+            'toxic_percentage': round(stats['toxic_percentage'], 2),
+            'avg_toxicity': round(stats['avg_toxicity'], 4),
+            'p50': round(percentiles.get('p50', 0.0), 4),
+            'p90': round(percentiles.get('p90', 0.0), 4),
+            'p99': round(percentiles.get('p99', 0.0), 4),
+            'top_category': stats.get('top_category'),
+            'top_category_value': stats.get('top_category_value'),
+            'categories': {name: round(value, 4) for name, value in stats['categories'].items()},
+        })
+    return row
+
+
+def scan_thread(app, thread, threshold=None, refresh=False):
+    """Fetch and score one thread in its own application context; never raises."""
+    started = time.perf_counter()
+    with app.app_context():
+        try:
+            detector = ToxicityDetector(threshold=threshold)
+            _, _, stats = get_scored_thread(thread['id'], detector, refresh=refresh)
+            row = report_row(thread, stats)
+        except Exception as e:
+            row = report_row(thread, error=str(e))
+    row['seconds'] = round(time.perf_counter() - started, 3)
+    return row
+
+
+def prepare_scan(app, args, checkpoint_path):
+    """
+    Load the checkpoint of a resumed scan, or list the subreddit and save a new one.
+
+    Returns:
+        dict: The checkpoint, with the scan's settings and listed threads
+    """
+    if args.resume and os.path.exists(checkpoint_path):
+        checkpoint = load_checkpoint(checkpoint_path)
+        print(f"Resuming the scan of r/{checkpoint['subreddit']} ({checkpoint['sort']}, "
+              f"{checkpoint['time_filter']}) from {checkpoint_path}", file=sys.stderr)
+        return checkpoint
+    if not args.resume and (os.path.exists(args.output) or os.path.exists(checkpoint_path)):
+        raise SystemExit(f"{args.output} or its checkpoint already exists: pass --resume to carry on with "
+                         f"that scan, or choose another --output")
+
+    with app.app_context():
+        try:
+            threads = fetch_subreddit_listing(args.subreddit, args.sort, args.time, args.limit)
+        except ValueError as e:
+            raise SystemExit(str(e))
+    checkpoint = {
+        'version': CHECKPOINT_VERSION,
+        'subreddit': args.subreddit,
+        'sort': args.sort,
+        'time_filter': args.time,
+        'limit': args.limit,
+        'created': int(time.time()),
+        'threads': threads,
+    }
+    save_checkpoint(checkpoint_path, checkpoint)
+    return checkpoint
+
+
+def run(args):
+    settings = {
+        'REDDIT_RATE_LIMIT': args.rate,
+        'LOG_LEVEL': 'INFO' if args.verbose else 'WARNING',
+    }
+    if args.comments:
+        settings['REDDIT_COMMENT_LIMIT'] = args.comments
+    app = create_app(type('ScanConfig', (get_config(),), settings))
+
+    fmt = report_format(args.output, args.format)
+    checkpoint_path = args.checkpoint or f"{args.output}.checkpoint.json"
+    checkpoint = prepare_scan(app, args, checkpoint_path)
+
+    drop_torn_row(args.output)
+    finished = finished_threads(args.output, fmt)
+    pending = [thread for thread in checkpoint['threads'] if thread['id'] not in finished]
+    total = len(checkpoint['threads'])
+    print(f"{total} threads listed, {total - len(pending)} already in {args.output}, {len(pending)} to scan",
+          file=sys.stderr)
+
+    report = REPORT_FORMATS[fmt](args.output)
+    counts = {'ok': 0, 'failed': 0}
+    started = time.perf_counter()
+    queue = iter(pending)
+    in_flight = set()
+    executor = ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix='scan')
+
+    def submit_next():
+        thread = next(queue, None)
+        if thread is not None:
+            in_flight.add(executor.submit(scan_thread, app, thread, args.threshold, args.refresh))
+
+    def record(future):
+        row = future.result()
+        report.write(row)
+        counts[row['status']] += 1
+        progress = f"[{len(finished) + counts['ok'] + counts['failed']}/{total}] {row['thread_id']}"
+        if row['status'] == 'ok':
+            print(f"{progress} {row['comments']} comments, {row['toxic_count']} toxic "
+                  f"({row['toxic_percentage']:.1f}%) in {row['seconds']:.1f}s", file=sys.stderr)
+        else:
+            print(f"{progress} failed: {row['error']}", file=sys.stderr)
+
+    interrupted = False
+    try:
+        # Only a few threads are queued ahead, so an interruption leaves little work behind
+        for _ in range(args.workers * 2):
+            submit_next()
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                in_flight.discard(future)
+                record(future)
+                submit_next()
+    except KeyboardInterrupt:
+        # Threads already being scored are finished and reported; the rest wait for --resume
+        interrupted = True
+        running = [future for future in in_flight if not future.cancel()]
+        print(f"Interrupted; finishing the {len(running)} threads in progress (Ctrl-C again to abort)",
+              file=sys.stderr)
+        for future in running:
+            record(future)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        report.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"Scanned {counts['ok'] + counts['failed']} threads in {elapsed:.1f}s: {counts['ok']} ok, "
+          f"{counts['failed']} failed", file=sys.stderr)
+    if interrupted:
+        print("Run again with --resume to scan the remaining threads", file=sys.stderr)
+        raise SystemExit(130)
+    return counts
+
+
+def subreddit_name(text):
+    """'AskReddit' from 'AskReddit', 'r/AskReddit' or '/r/AskReddit/'."""
+    name = text.strip('/')
+    return name[2:] if name.lower().startswith('r/') else name
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score the threads of a subreddit listing for toxicity")
+    parser.add_argument('subreddit', type=subreddit_name, help="Subreddit name, with or without the r/ prefix")
+    parser.add_argument('--sort', choices=LISTING_SORTS, default='top')
+    parser.add_argument('--time', choices=LISTING_TIME_FILTERS, default='day',
+                        help="Time window of a 'top' or 'controversial' listing")
+    parser.add_argument('--limit', type=int, default=100, help="Threads to scan")
+    parser.add_argument('--output', help="Report file, JSON lines or .csv (default: <subreddit>-<sort>-<time>.jsonl)")
+    parser.add_argument('--format', choices=list(REPORT_FORMATS), help="Report format, instead of the extension's")
+    parser.add_argument('--checkpoint', help="Checkpoint file (default: <output>.checkpoint.json)")
+    parser.add_argument('--resume', action='store_true', help="Carry on with an interrupted scan")
+    parser.add_argument('--workers', type=int, default=4, help="Threads fetched and scored at once")
+    parser.add_argument('--rate', type=float, default=get_config().REDDIT_RATE_LIMIT or 1.0,
+                        help="Most requests per second to Reddit (default: REDDIT_RATE_LIMIT, or 1)")
+    parser.add_argument('--comments', type=int, help="Most comments fetched per thread (default: REDDIT_COMMENT_LIMIT)")
+    parser.add_argument('--threshold', type=float, help="Toxicity threshold (default: TOXICITY_THRESHOLD)")
+    parser.add_argument('--refresh', action='store_true', help="Score threads again even if they have a fresh stored analysis")
+    parser.add_argument('--verbose', action='store_true', help="Log at INFO instead of WARNING")
+    args = parser.parse_args(argv)
+    if args.output is None:
+        args.output = f"{args.subreddit}-{args.sort}-{args.time}.jsonl"
+
+    counts = run(args)
+    return 1 if counts['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,176 @@
+"""
+Tests for the moderation micro-batcher (app.batcher).
+"""
+import threading
+
+from app.batcher import MicroBatcher
+
+
+def test_duplicate_items_share_one_call():
+    calls = []
+    release = threading.Event()
+
+    def item_fn(item):
+        calls.append(item)
+        release.wait(5)
+        return item.upper()
+
+    batcher = MicroBatcher(item_fn=item_fn, window=0.01)
+    first = batcher.submit('k', 'text')
+    second = batcher.submit('k', 'text')
+    release.set()
+
+    assert first is second
+    assert first.result(5) == 'TEXT'
+    assert calls == ['text']
+    assert batcher.stats()['deduplicated'] == 1
+
+
+def test_release_keeps_a_shared_item_for_the_other_caller():
+    started = threading.Event()
+    release = threading.Event()
+
+    def item_fn(item):
+        started.set()
+        release.wait(5)
+        return item
+
+    batcher = MicroBatcher(item_fn=item_fn, window=0.01)
+    future = batcher.submit('k', 'text')
+    batcher.submit('k', 'text')
+    started.wait(5)
+
+    # One caller gives up; the other still gets the result
+    batcher.release('k', future)
+    release.set()
+
+    assert not future.cancelled()
+    assert future.result(5) == 'text'
+
+
+def test_item_released_by_every_caller_is_not_sent():
+    calls = []
+    batcher = MicroBatcher(item_fn=lambda item: calls.append(item) or item, window=0.2)
+    withdrawn = batcher.submit('a', 'withdrawn')
+    batcher.release('a', withdrawn)
+    kept = batcher.submit('b', 'kept')
+
+    assert kept.result(5) == 'kept'
+    assert withdrawn.cancelled()
+    assert calls == ['kept']
+    assert batcher.stats()['withdrawn'] == 1
+
+
+def test_cancelled_future_does_not_stop_the_dispatcher():
+    started = threading.Event()
+    release = threading.Event()
+
+    def item_fn(item):
+        started.set()
+        release.wait(5)
+        return item
+
+    batcher = MicroBatcher(item_fn=item_fn, window=0.01)
+    cancelled = batcher.submit('a', 'a')
+    started.wait(5)
+    # Running items cannot be cancelled, so their result is still delivered
+    assert not cancelled.cancel()
+    release.set()
+    assert cancelled.result(5) == 'a'
+
+    queued = batcher.submit('b', 'b')
+    assert queued.result(5) == 'b'
+
+
+def test_remote_scorer_release_leaves_shared_calls_running():
+    from app.scorers import RemoteScorer
+
+    release = threading.Event()
+
+    def item_fn(request):
+        _, text, _, _ = request
+        release.wait(5)
+        return text
+
+    batcher = MicroBatcher(item_fn=item_fn, window=0.01)
+    scorer = RemoteScorer(pool=None, batcher=batcher)
+    timed_out = scorer.submit('shared text', 0.02)
+    waiting = scorer.submit('shared text', 0.02)
+
+    # The request whose deadline passed lets go; the other one is unaffected
+    scorer.release('shared text', 0.02, timed_out)
+    release.set()
+
+    assert waiting.result(5) == 'shared text'
+
+
+def test_failed_shared_call_counts_once_in_the_breaker():
+    from app.resilience import CircuitBreaker
+    from app.scorers import RemoteScorer, fetch_toxicity_json
+
+    class FailingPool:
+        def predict(self, text, safer_value, api_name=None):
+            raise ConnectionError("Space is down")
+
+    breaker = CircuitBreaker(failure_threshold=3)
+    batcher = MicroBatcher(item_fn=fetch_toxicity_json, window=0.05)
+    scorer = RemoteScorer(pool=FailingPool(), batcher=batcher, breaker=breaker)
+    futures = [scorer.submit('same comment', 0.02) for _ in range(10)]
+    for future in futures:
+        assert isinstance(future.exception(5), ConnectionError)
+
+    assert breaker.stats()['failures'] == 1
+    assert breaker.state == breaker.CLOSED
+
+
+def test_cancelled_async_wait_leaves_the_shared_call_running():
+    import asyncio
+    from concurrent.futures import Future
+
+    from app.scorers import _wrap_future
+
+    shared = Future()
+
+    async def wait_and_disconnect():
+        waiter = asyncio.ensure_future(_wrap_future(shared))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+
+    asyncio.run(wait_and_disconnect())
+    assert not shared.cancelled()
+    shared.set_result('still wanted')
+    assert shared.result() == 'still wanted'
+
+
+def test_timed_out_requests_withdraw_their_queued_items():
+    import asyncio
+
+    from app.cache import NullCache
+    from app.resilience import Deadline
+    from app.scorers import RemoteScorer
+    from app.toxicity_detector import ToxicityDetector
+
+    release = threading.Event()
+
+    def item_fn(request):
+        release.wait(5)
+        return request[1]
+
+    # A long window keeps the items queued while the requests give up on them
+    batcher = MicroBatcher(item_fn=item_fn, window=0.5)
+    detector = ToxicityDetector(threshold=0.5, cache=NullCache())
+    detector._remote = RemoteScorer(pool=None, batcher=batcher)
+
+    expired = detector._remote.submit('expired', 0.02)
+    detector._resolve('expired', 0.02, expired, deadline=Deadline(0))
+    waited_sync = detector._remote.submit('waited sync', 0.02)
+    detector._resolve('waited sync', 0.02, waited_sync, deadline=Deadline(0.05))
+    expired_async = detector._remote.submit('expired async', 0.02)
+    asyncio.run(detector._resolve_async('expired async', 0.02, expired_async, deadline=Deadline(0)))
+    waited_async = detector._remote.submit('waited async', 0.02)
+    asyncio.run(detector._resolve_async('waited async', 0.02, waited_async, deadline=Deadline(0.05)))
+    release.set()
+
+    assert all(future.cancelled() for future in (expired, waited_sync, expired_async, waited_async))
+    assert batcher.stats()['withdrawn'] == 4
@@ -0,0 +1,68 @@
+"""
+Tests for the cache backends (app.cache).
+"""
+import json
+
+from app import create_app
+from app.cache import MemoryCache, SQLiteCache, estimate_size
+from config import TestingConfig
+
+
+def test_memory_cache_evicts_least_recently_used_entries_by_bytes():
+    cache = MemoryCache(max_bytes=1000)
+    for i in range(4):
+        cache.set(f"k{i}", b'x' * 200)
+    # Reading k0 makes k1 the least recently used entry
+    assert cache.get('k0') is not None
+    cache.set('k4', b'x' * 200)
+
+    assert cache.get('k1') is None
+    assert all(cache.get(key) is not None for key in ('k0', 'k2', 'k3', 'k4'))
+    stats = cache.stats()
+    assert stats['evictions'] == 1
+    assert stats['bytes'] <= 1000
+
+
+def test_memory_cache_skips_values_larger_than_the_budget():
+    cache = MemoryCache(max_bytes=100)
+    cache.set('small', b'x' * 10)
+    cache.set('large', b'x' * 500)
+
+    assert cache.get('large') is None
+    assert cache.get('small') is not None
+
+
+def test_estimated_size_is_close_to_the_json_size():
+    comment = {'id': 'c1', 'author': 'user', 'body': 'x' * 200, 'score': 12, 'depth': 1, 'parent_id': None}
+    thread = {'metadata': {'title': 'Thread'}, 'comments': [dict(comment, body='y' * (i % 300)) for i in range(500)]}
+    for value in (comment, thread):
+        encoded = len(json.dumps(value, separators=(',', ':')))
+        assert abs(estimate_size(value) - encoded) < encoded * 0.2
+
+
+def test_memory_caches_share_one_byte_budget():
+    class Config(TestingConfig):
+        CACHE_TYPE = 'simple'
+        CACHE_MAX_BYTES = 1000000
+        TOXICITY_SCORER = 'tiered'
+
+    app = create_app(Config)
+    caches = [app.extensions['score_cache'], app.extensions['reddit_cache'], app.extensions['analysis_store'].cache,
+              app.extensions['prefilter'].known_safe]
+
+    assert all(isinstance(cache, MemoryCache) for cache in caches)
+    assert sum(cache.max_bytes for cache in caches) <= Config.CACHE_MAX_BYTES
+
+
+def test_sqlite_cache_errors_are_logged_not_raised(tmp_path, caplog):
+    cache = SQLiteCache(str(tmp_path / 'cache.sqlite3'), namespace='scores')
+    cache.set('key', {'score': 0.5})
+    cache._connect().execute("DROP TABLE scores")
+
+    cache.set('key', {'score': 0.5})
+    cache.delete('key')
+    cache.clear()
+
+    assert cache.get('key') is None
+    assert [record.getMessage().split(':')[0] for record in caplog.records] == [
+        'Cache write failed', 'Cache delete failed', 'Cache clear failed', 'Cache read failed']
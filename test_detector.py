@@ -0,0 +1,102 @@
+"""
+Tests for concurrent comment scoring (app.toxicity_detector).
+"""
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+from app.cache import NullCache
+from app.scorers import RemoteScorer
+from app.toxicity_detector import ToxicityDetector
+
+
+class StubPool:
+    """Moderation pool whose score is the last word of the text; 'fail' raises and 'slow' hangs."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.lock = threading.Lock()
+        self.running = 0
+        self.most_running = 0
+
+    def predict(self, text, safer_value, api_name=None):
+        with self.lock:
+            self.running += 1
+            self.most_running = max(self.most_running, self.running)
+        try:
+            if text == 'fail':
+                raise RuntimeError('upstream error')
+            if text == 'slow':
+                self.release.wait(5)
+            else:
+                time.sleep(0.01)
+            score = float(text.split()[-1]) if text != 'slow' else 0.9
+            return None, json.dumps({'sum_value': score, 'hate': score, 'max_key': 'hate', 'max_value': score,
+                                     'is_flagged': score >= 0.5})
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+def thread_comments(bodies):
+    return [{'id': str(i), 'body': body} for i, body in enumerate(bodies)]
+
+
+def detector_for(pool, concurrency=4, call_timeout=20):
+    detector = ToxicityDetector(threshold=0.5, cache=NullCache(), scorer='remote')
+    detector._remote = RemoteScorer(pool, concurrency=concurrency)
+    detector._deadlines = lambda: (call_timeout, 60)
+    return detector
+
+
+@pytest.fixture
+def pool():
+    pool = StubPool()
+    yield pool
+    pool.release.set()
+
+
+def test_results_come_back_in_comment_order(pool):
+    bodies = [f"comment {i / 20}" for i in range(20)]
+    comments, stats = detector_for(pool).analyze_comments(thread_comments(bodies))
+
+    assert [c['body'] for c in comments] == bodies
+    assert [c['toxicity']['score'] for c in comments] == [i / 20 for i in range(20)]
+    assert pool.most_running > 1
+    assert stats['toxic_count'] == 10
+
+
+def test_failed_and_slow_calls_only_affect_their_own_comment(pool):
+    bodies = [f"comment {i / 10}" for i in range(10)]
+    bodies[3] = 'fail'
+    bodies[6] = 'slow'
+    detector = detector_for(pool, call_timeout=0.2)
+
+    started = time.perf_counter()
+    comments, stats = detector.analyze_comments(thread_comments(bodies))
+    elapsed = time.perf_counter() - started
+
+    assert comments[3]['toxicity']['status'] == 'unscored'
+    assert comments[6]['toxicity']['status'] == 'timeout'
+    for i, comment in enumerate(comments):
+        if i not in (3, 6):
+            assert comment['toxicity']['status'] == 'ok'
+            assert comment['toxicity']['score'] == i / 10
+    assert stats['unscored_count'] == 2
+    # The hanging call costs its own timeout, not one per later comment
+    assert elapsed < 1
+
+
+def test_concurrent_stats_equal_serial_stats(pool):
+    bodies = [f"comment {(i * 7 % 20) / 20}" for i in range(40)]
+    bodies[5] = 'fail'
+
+    _, serial = detector_for(pool, concurrency=1).analyze_comments(thread_comments(bodies))
+    _, concurrent = detector_for(pool, concurrency=8).analyze_comments(thread_comments(bodies))
+    _, gathered = asyncio.run(detector_for(pool, concurrency=8).analyze_comments_async(thread_comments(bodies)))
+
+    assert concurrent == serial
+    assert gathered == serial
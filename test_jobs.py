@@ -0,0 +1,66 @@
+"""
+Tests for background analysis jobs (app.jobs).
+"""
+import threading
+import time
+
+from app import create_app
+from app import jobs
+from app.jobs import DONE, JobQueue, MemoryJobStore, SQLiteJobStore
+from app.toxicity_detector import ToxicityDetector
+from config import TestingConfig
+
+
+class FakeApp:
+    def __init__(self, tmp_path, **config):
+        self.instance_path = str(tmp_path)
+        self.config = config
+
+
+def test_memory_store_serves_a_single_worker(tmp_path):
+    queue = JobQueue.from_app(FakeApp(tmp_path, WORKER_PROCESSES=1))
+    assert isinstance(queue.store, MemoryJobStore)
+
+
+def test_several_workers_share_a_sqlite_store(tmp_path):
+    queue = JobQueue.from_app(FakeApp(tmp_path, WORKER_PROCESSES=4))
+    assert isinstance(queue.store, SQLiteJobStore)
+
+
+def test_jobs_are_visible_to_every_worker_of_a_sqlite_store(tmp_path):
+    path = str(tmp_path / 'jobs.sqlite3')
+    submitting, polled = SQLiteJobStore(path), SQLiteJobStore(path)
+
+    job, created = submitting.create('abc123', 'https://reddit.com/comments/abc123', 0.02, 300)
+
+    assert created
+    assert polled.get(job['id'])['thread_id'] == 'abc123'
+    # A second submission of the thread joins the active job
+    assert submitting.create('abc123', None, 0.02, 300) == (polled.get(job['id']), False)
+
+
+def test_job_shares_a_running_analysis_of_its_thread(monkeypatch):
+    app = create_app(TestingConfig)
+    app.config['TOXICITY_SCORER'] = 'local'
+    fetched = []
+    monkeypatch.setattr(jobs, 'get_thread_data', lambda thread_id: fetched.append(thread_id))
+    queue = app.extensions['job_queue']
+    flights = app.extensions['analysis_flights']
+    job, _ = queue.store.create('abc123', None, app.config['SAFER_VALUE'], 300)
+
+    # A thread page is analyzing the thread when the job starts
+    with app.app_context(), flights.lead(('abc123', job['safer_value'])) as call:
+        worker = threading.Thread(target=queue._run, args=(job,))
+        worker.start()
+        deadline = time.monotonic() + 5
+        while not call.waiters and time.monotonic() < deadline:
+            time.sleep(0.01)
+        comments = [{'id': f"c{i}", 'body': text} for i, text in enumerate(['you idiot', 'nice post', 'thanks'])]
+        analyzed, _ = ToxicityDetector().analyze_comments(comments)
+        call.result = ({'title': 'Thread'}, analyzed, None)
+    worker.join(5)
+
+    finished = queue.get(job['id'])
+    assert fetched == []
+    assert finished['status'] == DONE
+    assert finished['stats']['total_comments'] == 3
@@ -0,0 +1,36 @@
+"""
+Tests for the queued logging setup (app.logs).
+"""
+import json
+import logging
+import queue
+
+from app.logs import JsonFormatter, LazyQueueHandler
+
+
+def _queued_record(message, *args, exc_info=None):
+    records = queue.SimpleQueue()
+    logger = logging.Logger('test_logs')
+    logger.addHandler(LazyQueueHandler(records))
+    logger.error(message, *args, exc_info=exc_info)
+    return records.get_nowait()
+
+
+def test_queued_record_keeps_its_arguments_as_they_were_when_logged():
+    fields = {'state': 'before'}
+    record = _queued_record('fields: %s', fields)
+    fields['state'] = 'after'
+
+    assert record.args is None
+    assert logging.Formatter('%(message)s').format(record) == "fields: {'state': 'before'}"
+
+
+def test_queued_record_keeps_the_traceback_text_but_not_its_frames():
+    try:
+        raise ValueError('boom')
+    except ValueError as e:
+        record = _queued_record('failed', exc_info=e)
+
+    assert record.exc_info is None
+    assert 'ValueError: boom' in logging.Formatter('%(message)s').format(record)
+    assert 'ValueError: boom' in json.loads(JsonFormatter().format(record))['exc_info']
@@ -0,0 +1,28 @@
+"""
+Tests for the Prometheus export (app.metrics).
+"""
+from app.cache import MemoryCache
+from app.metrics import Metrics
+from app.resilience import CircuitBreaker
+
+
+def test_monotonic_stats_are_exported_as_counters():
+    cache = MemoryCache()
+    cache.set('key', 'value')
+    cache.get('key')
+    cache.get('missing')
+    breaker = CircuitBreaker(failure_threshold=1)
+    breaker.record_failure()
+
+    text = Metrics().render({'score_cache': cache, 'moderation_breaker': breaker})
+
+    assert '# TYPE redtox_cache_hits_total counter' in text
+    assert 'redtox_cache_hits_total{name="scores"} 1' in text
+    assert 'redtox_cache_misses_total{name="scores"} 1' in text
+    assert '# TYPE redtox_breaker_opened_total counter' in text
+    assert 'redtox_breaker_opened_total{name="moderation"} 1' in text
+    # Values that go up and down stay gauges
+    assert '# TYPE redtox_cache_hit_rate gauge' in text
+    assert '# TYPE redtox_cache_entries gauge' in text
+    assert 'redtox_breaker_state{name="moderation",state="open"} 1' in text
+    assert 'redtox_cache_hits{' not in text
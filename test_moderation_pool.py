@@ -0,0 +1,69 @@
+"""
+Tests for the pooled moderation clients (app.moderation_pool).
+"""
+import pytest
+
+from app.moderation_pool import ModerationClientPool, PoolTimeoutError
+
+
+class FakeClient:
+    def __init__(self, space, fail_first=False):
+        self.space = space
+        self.fail_first = fail_first
+        self.calls = 0
+
+    def predict(self, text, safer, api_name=None):
+        self.calls += 1
+        if self.fail_first and self.calls == 1:
+            raise ConnectionError("stale connection")
+        return None, text
+
+
+def test_clients_are_reused_across_calls():
+    pool = ModerationClientPool('space', size=2, client_factory=FakeClient)
+    for _ in range(5):
+        assert pool.predict('text', 0.02) == (None, 'text')
+
+    stats = pool.stats()
+    assert stats['created'] == 1
+    assert stats['checkouts'] == 5
+    assert stats['idle'] == 1
+
+
+def test_checkout_times_out_when_every_client_is_busy():
+    pool = ModerationClientPool('space', size=1, client_factory=FakeClient)
+    entry = pool.checkout()
+    with pytest.raises(PoolTimeoutError):
+        pool.checkout(timeout=0.01)
+    pool.checkin(entry)
+    pool.checkin(pool.checkout(timeout=0.01))
+
+
+def test_failed_call_is_retried_on_a_rebuilt_client():
+    clients = []
+
+    def factory(space):
+        clients.append(FakeClient(space, fail_first=not clients))
+        return clients[-1]
+
+    pool = ModerationClientPool('space', size=1, client_factory=factory)
+
+    assert pool.predict('text', 0.02) == (None, 'text')
+    assert len(clients) == 2
+    assert pool.stats()['rebuilt'] == 1
+
+
+def test_outage_costs_one_rebuild_per_failed_call():
+    class DownClient(FakeClient):
+        def predict(self, text, safer, api_name=None):
+            raise ConnectionError("Space is down")
+
+    pool = ModerationClientPool('space', size=1, client_factory=DownClient)
+    for _ in range(3):
+        with pytest.raises(ConnectionError):
+            pool.predict('text', 0.02)
+
+    stats = pool.stats()
+    # Each failed call rebuilds once for its retry; the rebuilt client is not rebuilt again on checkout
+    assert stats['rebuilt'] == 3
+    assert stats['created'] == 4
@@ -0,0 +1,86 @@
+"""
+Tests for the keyword automaton of the prefilter (app.prefilter).
+"""
+import random
+
+from app.prefilter import KeywordAutomaton
+
+
+def naive_find(keywords, text):
+    """Every (end position, keyword) occurrence, by plain substring search."""
+    found = []
+    for keyword in keywords:
+        start = text.find(keyword)
+        while start != -1:
+            found.append((start + len(keyword), keyword))
+            start = text.find(keyword, start + 1)
+    return found
+
+
+def test_overlapping_and_nested_keywords_are_all_found():
+    automaton = KeywordAutomaton(['he', 'she', 'his', 'hers'])
+    assert sorted(automaton.find('ushers')) == ['he', 'hers', 'she']
+
+
+def test_matches_plain_substring_search():
+    rng = random.Random(7)
+    keywords = sorted({''.join(rng.choice('abc') for _ in range(rng.randint(1, 4))) for _ in range(15)})
+    automaton = KeywordAutomaton(keywords)
+    for _ in range(200):
+        text = ''.join(rng.choice('abcd') for _ in range(rng.randint(0, 40)))
+        assert sorted(automaton.find(text)) == sorted(keyword for _, keyword in naive_find(keywords, text))
+
+
+def test_text_without_keywords_finds_nothing():
+    assert KeywordAutomaton(['idiot', 'moron']).find('a perfectly polite comment') == []
+    assert KeywordAutomaton([]).find('anything') == []
+
+
+class FixedScorer:
+    """Local scorer stand-in returning a set score per text."""
+
+    vocabulary = ('idiot',)
+
+    def __init__(self, scores):
+        self.scores = scores
+
+    def score_batch(self, texts, safer_value=None):
+        return [{'score': self.scores[text], 'categories': {'harassment': self.scores[text]}, 'status': 'ok'}
+                for text in texts]
+
+
+def test_clean_verdict_caps_the_score_below_the_clean_band():
+    from app.prefilter import CLEAN, Prefilter
+
+    prefilter = Prefilter(FixedScorer({'ok then': 0.8}), clean_below=0.2, toxic_above=0.9)
+    decision, = prefilter.assess_batch(['ok then'], threshold=0.5)
+
+    assert (decision.verdict, decision.reason) == (CLEAN, 'short')
+    assert decision.result['score'] <= 0.2
+
+
+def test_verdict_contradicted_by_the_threshold_goes_to_the_remote_model():
+    from app.prefilter import TOXIC, UNCERTAIN, Prefilter
+
+    rude = 'a long and very rude comment here'
+    prefilter = Prefilter(FixedScorer({rude: 0.92, 'ok then': 0.8}), clean_below=0.2, toxic_above=0.9)
+
+    toxic, = prefilter.assess_batch([rude], threshold=0.7)
+    strict, = prefilter.assess_batch([rude], threshold=0.95)
+    # A short text's capped score would still be toxic at a threshold below the clean band
+    lenient, = prefilter.assess_batch(['ok then'], threshold=0.1)
+
+    assert toxic.verdict == TOXIC
+    assert (strict.verdict, strict.reason) == (UNCERTAIN, 'threshold')
+    assert (lenient.verdict, lenient.reason) == (UNCERTAIN, 'threshold')
+
+
+def test_known_safe_texts_are_remembered_per_safer_value():
+    from app.cache import MemoryCache
+    from app.prefilter import Prefilter
+
+    prefilter = Prefilter(FixedScorer({}), known_safe=MemoryCache())
+    prefilter.remember('a perfectly polite comment', {'score': 0.01, 'categories': {'harassment': 0.01}}, 0.02)
+
+    assert prefilter.is_known_safe('a perfectly polite comment', 0.02)
+    assert not prefilter.is_known_safe('a perfectly polite comment', 0.5)
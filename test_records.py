@@ -0,0 +1,99 @@
+"""
+Tests for the columnar storage of scored comments (app.records).
+"""
+from app.records import ScoredThread
+from app.stats import ScoreStats
+
+
+def scored_comment(comment_id, parent_id, score, status='ok'):
+    toxicity = {
+        'score': score,
+        'flagged': score > 0.5,
+        'categories': {'harassment': score, 'hate': score / 2},
+        'max_category': 'harassment',
+        'max_value': score,
+        'source': 'remote',
+        'status': status,
+    }
+    return {
+        'id': comment_id,
+        'author': 'user',
+        'body': f"Comment {comment_id}",
+        'score': 1,
+        'created_utc': 1700000000,
+        'permalink': f"/r/test/comments/t1/x/{comment_id}/",
+        'parent_id': parent_id,
+        'depth': 0 if parent_id is None else 1,
+        'body_hash': f"hash{comment_id}",
+        'toxicity': toxicity,
+    }
+
+
+def typical_thread():
+    comments = []
+    for i in range(50):
+        parent_id = None if i % 3 == 0 else f"c{i - 1}"
+        comments.append(scored_comment(f"c{i}", parent_id, (i % 10) / 10))
+    return comments
+
+
+def as_dict(comment):
+    return {**dict(comment), 'toxicity': dict(comment['toxicity'])}
+
+
+def test_round_trip_keeps_none_fields():
+    comments = typical_thread()
+    comments[1]['toxicity']['max_category'] = None
+    comments[2]['toxicity']['error'] = 'Timed out'
+
+    thread, header = ScoredThread.from_bytes(ScoredThread.from_comments(comments).to_bytes({'title': 'T'}))
+
+    assert header == {'title': 'T'}
+    assert [as_dict(comment) for comment in thread] == comments
+    assert thread[0]['parent_id'] is None
+    assert thread[1]['toxicity']['max_category'] is None
+
+
+def test_typical_thread_is_classified_by_column():
+    comments = typical_thread()
+    thread, _ = ScoredThread.from_bytes(ScoredThread.from_comments(comments).to_bytes())
+
+    # Top-level comments' None parent_id must not push rows onto the per-comment path
+    assert not thread._fallback_rows().any()
+
+    toxic_count = thread.classify(0.5)
+    assert toxic_count == sum(comment['toxicity']['score'] >= 0.5 for comment in comments)
+    assert [comment['toxicity']['is_toxic'] for comment in thread] == [
+        comment['toxicity']['score'] >= 0.5 for comment in comments
+    ]
+
+
+def test_only_rows_with_toxicity_extras_fall_back():
+    comments = typical_thread()
+    comments[4]['toxicity'] = {'status': 'error', 'error': 'Circuit open'}
+    comments[5]['flair'] = 'Moderator'
+    thread = ScoredThread.from_comments(comments)
+
+    assert thread._fallback_rows().nonzero()[0].tolist() == [4]
+    assert thread.classify(0.5) == sum(
+        comment['toxicity'].get('score', 0) >= 0.5 for comment in comments if comment['toxicity']['status'] == 'ok'
+    )
+    assert thread[4]['toxicity']['is_toxic'] is False
+
+
+def test_score_stats_match_the_comment_dicts():
+    comments = typical_thread()
+    comments[7]['toxicity'] = {'status': 'timeout'}
+    thread = ScoredThread.from_comments(comments)
+
+    from_columns = thread.score_stats().to_dict()
+    from_dicts = ScoreStats.from_comments(comments).to_dict()
+
+    assert from_columns['unscored'] == from_dicts['unscored'] == 1
+    assert from_columns['histogram'] == from_dicts['histogram']
+    assert from_columns['top_category'] == from_dicts['top_category']
+    assert from_columns['scores']['count'] == from_dicts['scores']['count']
+    assert abs(from_columns['scores']['mean'] - from_dicts['scores']['mean']) < 1e-9
+    for category, (total, count) in from_dicts['categories'].items():
+        assert from_columns['categories'][category][1] == count
+        assert abs(from_columns['categories'][category][0] - total) < 1e-9
@@ -0,0 +1,201 @@
+"""
+Tests for fetching threads from Reddit (app.reddit_client).
+"""
+import json
+
+import pytest
+import requests
+
+from app import create_app
+from app import reddit_client
+from app.reddit_client import FetchBudget, expand_more_comments, fetch_thread
+from config import TestingConfig
+
+
+def listing(count):
+    comments = [
+        {'kind': 't1', 'data': {'id': f"c{i}", 'name': f"t1_c{i}", 'author': 'user', 'body': f"Comment {i}",
+                                'score': 1, 'created_utc': 1700000000, 'parent_id': 't3_abc123',
+                                'permalink': f"/r/test/comments/abc123/x/c{i}/"}}
+        for i in range(count)
+    ]
+    post = {'kind': 't3', 'data': {'title': 'Thread', 'author': 'op', 'subreddit': 'test', 'num_comments': count}}
+    return json.dumps([{'data': {'children': [post]}}, {'data': {'children': comments}}]).encode('utf-8')
+
+
+class ConditionalResponse:
+    encoding = 'utf-8'
+
+    def __init__(self, status_code, body=b''):
+        self.status_code = status_code
+        self.headers = {'ETag': '"v1"'}
+        self.body = body
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def iter_content(self, chunk_size=1):
+        yield self.body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} Server Error")
+
+    def close(self):
+        self.closed = True
+
+
+class ConditionalSession:
+    """Answers 304 whenever the request revalidates the current ETag."""
+
+    def __init__(self, body, status_code=200):
+        self.body = body
+        self.status_code = status_code
+        self.not_modified = 0
+        self.responses = []
+
+    def get(self, url, headers=None, timeout=None, stream=False):
+        if (headers or {}).get('If-None-Match') == '"v1"':
+            self.not_modified += 1
+            response = ConditionalResponse(304)
+        else:
+            response = ConditionalResponse(self.status_code, self.body)
+        self.responses.append(response)
+        return response
+
+
+@pytest.fixture
+def session(monkeypatch):
+    session = ConditionalSession(listing(30))
+    monkeypatch.setattr(reddit_client, 'get_session', lambda: session)
+    return session
+
+
+@pytest.fixture
+def app():
+    app = create_app(TestingConfig)
+    with app.app_context():
+        yield app
+
+
+def test_not_modified_reuses_the_copy_parsed_with_the_same_budget(app, session):
+    first = fetch_thread('abc123', backend='json', budget=FetchBudget(max_comments=10))
+    again = fetch_thread('abc123', backend='json', budget=FetchBudget(max_comments=10))
+
+    assert session.not_modified == 1
+    assert again['comments'] == first['comments']
+
+
+def test_not_modified_copy_is_not_reused_for_a_larger_budget(app, session):
+    fetch_thread('abc123', backend='json', budget=FetchBudget(max_comments=5))
+    larger = fetch_thread('abc123', backend='json', budget=FetchBudget(max_comments=20))
+
+    assert session.not_modified == 0
+    assert len(larger['comments']) == 20
+
+
+@pytest.mark.parametrize('body, status_code', [(b'', 503), (b'{"not": "a listing"}', 200)])
+def test_failed_fetches_return_their_connection(app, monkeypatch, body, status_code):
+    session = ConditionalSession(body, status_code)
+    monkeypatch.setattr(reddit_client, 'get_session', lambda: session)
+
+    with pytest.raises(ValueError):
+        fetch_thread('abc123', backend='json', budget=FetchBudget(max_comments=10))
+    assert all(response.closed for response in session.responses)
+
+
+def test_fetched_and_revalidated_responses_are_closed(app, session):
+    fetch_thread('abc123', backend='json', budget=FetchBudget(max_comments=10))
+    fetch_thread('abc123', backend='json', budget=FetchBudget(max_comments=10))
+
+    assert session.not_modified == 1
+    assert all(response.closed for response in session.responses)
+
+
+class MoreChildrenResponse:
+    def __init__(self, things):
+        self.content = json.dumps({'json': {'errors': [], 'data': {'things': things}}}).encode('utf-8')
+
+    def raise_for_status(self):
+        pass
+
+
+class MoreChildrenSession:
+    """Answers morechildren calls from a map of comment ID -> (parent ID, depth)."""
+
+    def __init__(self, tree):
+        self.tree = tree
+        self.requested = []
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        self.requested.append(params['children'].split(','))
+        ids = params['children'].split(',')
+        # Like Reddit, answer with the requested comments and their replies
+        for parent in ids:
+            ids.extend(comment_id for comment_id, (parent_id, _) in self.tree.items() if parent_id == parent)
+        things = []
+        for comment_id in ids:
+            parent_id, depth = self.tree[comment_id]
+            things.append({'kind': 't1', 'data': {
+                'id': comment_id, 'name': f"t1_{comment_id}", 'parent_id': f"t1_{parent_id}", 'depth': depth,
+                'author': 'user', 'body': f"Reply {comment_id}", 'score': 1, 'created_utc': 1700000000,
+            }})
+        return MoreChildrenResponse(things)
+
+
+def stub(parent_id, depth, children):
+    return {'parent_id': parent_id, 'depth': depth, 'children': list(children)}
+
+
+def thread_with_stubs(*stubs):
+    comments = [{'id': f"c{i}", 'body': f"Comment {i}", 'depth': 0, 'parent_id': None} for i in range(3)]
+    return {'comments': comments, 'more': list(stubs)}
+
+
+def use_tree(monkeypatch, tree):
+    session = MoreChildrenSession(tree)
+    monkeypatch.setattr(reddit_client, 'get_session', lambda: session)
+    return session
+
+
+def test_expansion_stops_at_the_call_limit(app, monkeypatch):
+    tree = {f"r{i}": (f"c{i % 3}", 1) for i in range(5)}
+    session = use_tree(monkeypatch, tree)
+    thread = thread_with_stubs(*(stub(f"c{i % 3}", 1, [f"r{i}"]) for i in range(5)))
+
+    budget = FetchBudget(max_comments=50, max_calls=3)
+    expand_more_comments('abc123', thread, budget)
+
+    assert budget.calls == 3 and len(session.requested) == 3
+    assert len(thread['comments']) == 6
+    assert [s['children'] for s in thread['more']] == [['r3'], ['r4']]
+
+
+def test_expansion_stops_at_the_comment_limit(app, monkeypatch):
+    tree = {f"r{i}": ('c0', 1) for i in range(10)}
+    session = use_tree(monkeypatch, tree)
+    thread = thread_with_stubs(stub('c0', 1, [f"r{i}" for i in range(10)]), stub('c1', 1, ['x']))
+
+    expand_more_comments('abc123', thread, FetchBudget(max_comments=5, max_calls=10))
+
+    assert len(session.requested) == 1
+    assert [c['id'] for c in thread['comments']] == ['c0', 'r0', 'r1', 'c1', 'c2']
+    assert thread['more'] == [stub('c1', 1, ['x'])]
+
+
+def test_expansion_goes_shallow_first_and_keeps_to_the_depth_limit(app, monkeypatch):
+    tree = {'r0': ('c0', 1), 'deep': ('r0', 2), 'top': (None, 0)}
+    session = use_tree(monkeypatch, tree)
+    thread = thread_with_stubs(stub('c0', 1, ['r0']), stub(None, 0, ['top']))
+
+    expand_more_comments('abc123', thread, FetchBudget(max_comments=50, max_depth=1, max_calls=1))
+    assert session.requested == [['top']]
+
+    expand_more_comments('abc123', thread, FetchBudget(max_comments=50, max_depth=1, max_calls=1))
+    # The reply below the depth limit came back with r0 but isn't kept
+    assert [c['id'] for c in thread['comments']] == ['c0', 'r0', 'c1', 'c2', 'top']
+    assert thread['more'] == []
@@ -0,0 +1,99 @@
+"""
+Tests for the circuit breaker and deadlines (app.resilience).
+"""
+import time
+
+from app.resilience import CircuitBreaker, Deadline
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == breaker.CLOSED
+
+    breaker.record_failure()
+    assert breaker.state == breaker.OPEN
+    assert not breaker.allow()
+    assert breaker.stats()['rejected'] == 1
+
+
+def test_half_open_breaker_lets_one_probe_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+
+    assert breaker.state == breaker.HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == breaker.CLOSED
+    assert breaker.allow()
+
+
+def test_failed_probe_opens_the_breaker_again():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.01)
+    breaker.record_failure()
+    breaker.record_failure()
+    time.sleep(0.02)
+    assert breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == breaker.OPEN
+    assert breaker.stats()['opened'] == 2
+
+
+def test_deadline_caps_timeouts_at_the_time_left():
+    deadline = Deadline(0.5)
+    assert deadline.timeout(10) <= 0.5
+    assert deadline.timeout(0.1) == 0.1
+    assert not deadline.expired()
+
+    assert Deadline(0).expired()
+    assert Deadline(0).timeout(10) == 0.0
+
+
+def test_no_deadline_keeps_the_limit():
+    deadline = Deadline()
+    assert deadline.remaining() is None
+    assert deadline.timeout(5) == 5
+    assert deadline.timeout() is None
+    assert not deadline.expired()
+
+
+def test_no_hedge_request_while_the_circuit_is_open():
+    import asyncio
+
+    from app.resilience import LatencyTracker
+    from app.scorers import RemoteScorer
+
+    class SlowPool:
+        def __init__(self):
+            self.calls = 0
+
+        def predict(self, text, safer_value, api_name=None):
+            self.calls += 1
+            time.sleep(0.1)
+            return None, '{"sum_value": 0.1, "max_key": "hate", "max_value": 0.1, "is_flagged": false}'
+
+    latency = LatencyTracker(min_samples=1)
+    for _ in range(50):
+        latency.record(0.01)
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    pool = SlowPool()
+    scorer = RemoteScorer(pool, breaker=breaker, latency=latency, hedge=True)
+
+    future = scorer.submit('slow text', 0.02)
+    # The circuit opens while the call is running
+    breaker.record_failure()
+    scorer.result('slow text', 0.02, future, timeout=5)
+    async_future = scorer.submit('slow async text', 0.02)
+    breaker.record_failure()
+    asyncio.run(scorer.result_async('slow async text', 0.02, async_future, timeout=5))
+
+    assert scorer.hedged == 0
+    assert pool.calls == 2
+    assert breaker.stats()['rejected'] == 2
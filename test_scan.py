@@ -0,0 +1,92 @@
+"""
+Tests for the subreddit scan command (scan.py).
+"""
+import json
+
+import pytest
+
+import scan
+
+
+STATS = {
+    'total_comments': 10, 'unscored_count': 0, 'toxic_count': 2, 'toxic_percentage': 20.0, 'avg_toxicity': 0.3,
+    'score_percentiles': {'p50': 0.2, 'p90': 0.8, 'p99': 0.9}, 'top_category': 'hate', 'top_category_value': 0.9,
+    'categories': {'hate': 0.3},
+}
+
+
+def scored_row(thread):
+    return dict(scan.report_row(thread, STATS), seconds=1.0)
+
+
+def listed_threads(count):
+    return [{'id': f"t{i}", 'subreddit': 'test', 'title': f"Thread {i}"} for i in range(count)]
+
+
+@pytest.fixture
+def scanned(monkeypatch):
+    """Thread IDs the scan scores; scoring and listing never reach Reddit."""
+    scanned = []
+
+    def fake_scan_thread(app, thread, threshold=None, refresh=False):
+        scanned.append(thread['id'])
+        return scored_row(thread)
+
+    def no_listing(*args, **kwargs):
+        raise AssertionError("A resumed scan must not list the subreddit again")
+
+    monkeypatch.setattr(scan, 'scan_thread', fake_scan_thread)
+    monkeypatch.setattr(scan, 'fetch_subreddit_listing', no_listing)
+    return scanned
+
+
+def interrupted_scan(tmp_path, output_name, rows, torn):
+    output = tmp_path / output_name
+    scan.save_checkpoint(f"{output}.checkpoint.json", {
+        'version': scan.CHECKPOINT_VERSION, 'subreddit': 'test', 'sort': 'top', 'time_filter': 'day',
+        'limit': 5, 'created': 0, 'threads': listed_threads(5),
+    })
+    report = scan.REPORT_FORMATS[scan.report_format(str(output))](str(output))
+    for row in rows:
+        report.write(row)
+    report.close()
+    with open(output, 'a', encoding='utf-8') as f:
+        f.write(torn)
+    return output
+
+
+def test_resume_scans_only_threads_without_a_successful_row(tmp_path, scanned):
+    threads = listed_threads(5)
+    output = interrupted_scan(tmp_path, 'report.jsonl', [
+        scored_row(threads[0]),
+        scored_row(threads[1]),
+        dict(scan.report_row(threads[2], error='Timed out'), seconds=1.0),
+    ], torn='{"thread_id": "t3", "sta')
+
+    assert scan.main(['test', '--output', str(output), '--resume', '--workers', '2']) == 0
+
+    assert sorted(scanned) == ['t2', 't3', 't4']
+    with open(output, encoding='utf-8') as f:
+        rows = [json.loads(line) for line in f]
+    assert [row['thread_id'] for row in rows[:3]] == ['t0', 't1', 't2']
+    assert scan.finished_threads(str(output), 'jsonl') == {thread['id'] for thread in threads}
+
+
+def test_resume_of_a_csv_report(tmp_path, scanned):
+    threads = listed_threads(5)
+    output = interrupted_scan(tmp_path, 'report.csv', [
+        scored_row(thread) for thread in threads[:3]
+    ], torn='t3,test,Thread')
+
+    assert scan.main(['test', '--output', str(output), '--resume']) == 0
+
+    assert sorted(scanned) == ['t3', 't4']
+    assert len(scan.CsvReport.read(str(output))) == 5
+
+
+def test_scan_without_resume_keeps_an_existing_report(tmp_path, scanned):
+    output = interrupted_scan(tmp_path, 'report.jsonl', [], torn='')
+
+    with pytest.raises(SystemExit):
+        scan.main(['test', '--output', str(output)])
+    assert scanned == []
@@ -0,0 +1,71 @@
+"""
+Tests for single-flight coalescing (app.singleflight).
+"""
+import threading
+
+from app.singleflight import SingleFlight
+
+
+def wait_for_waiter(flights):
+    while not flights.stats()['coalesced']:
+        threading.Event().wait(0.01)
+
+
+def test_concurrent_callers_share_one_call():
+    flights = SingleFlight()
+    calls = []
+    release = threading.Event()
+
+    def work():
+        calls.append(1)
+        release.wait(5)
+        return 'result'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flights.do('k', work))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    wait_for_waiter(flights)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == ['result'] * 5
+    assert len(calls) == 1
+
+
+def test_callers_wait_for_a_led_call():
+    flights = SingleFlight()
+    results = []
+
+    with flights.lead('k') as call:
+        assert call is not None
+        with flights.lead('k') as other:
+            assert other is None
+        waiter = threading.Thread(target=lambda: results.append(flights.do('k', lambda: 'own')))
+        waiter.start()
+        wait_for_waiter(flights)
+        call.result = 'led'
+    waiter.join(5)
+
+    assert results == ['led']
+
+
+def test_abandoned_lead_lets_a_waiter_take_over():
+    flights = SingleFlight()
+    results = []
+
+    def stream():
+        with flights.lead('k') as call:
+            yield call
+
+    page = stream()
+    next(page)
+    waiter = threading.Thread(target=lambda: results.append(flights.do('k', lambda: 'own')))
+    waiter.start()
+    wait_for_waiter(flights)
+    # The client went away mid-stream
+    page.close()
+    waiter.join(5)
+
+    assert results == ['own']
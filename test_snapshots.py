@@ -0,0 +1,95 @@
+"""
+Tests for incremental re-analysis of changed threads (app.snapshots).
+"""
+import pytest
+
+from app.snapshots import ThreadSnapshot, body_hash
+from app.stats import ScoreStats
+
+
+def score(body):
+    """Deterministic stand-in for a moderation result."""
+    value = sum(map(ord, body)) % 100 / 100
+    if body.startswith('worst'):
+        value = 0.99
+    category = 'hate' if len(body) % 2 else 'violence'
+    return {'score': value, 'categories': {category: value}, 'max_category': category, 'max_value': value,
+            'status': 'ok'}
+
+
+def scored(comments):
+    for comment in comments:
+        comment['toxicity'] = score(comment['body'])
+    return comments
+
+
+def entry_for(comments):
+    return {'comments': comments, 'score_stats': ScoreStats.from_comments(comments).to_dict()}
+
+
+def assert_same_stats(updated, fresh):
+    assert updated.unscored == fresh.unscored
+    assert updated.scored == fresh.scored
+    assert updated.scores.mean == pytest.approx(fresh.scores.mean)
+    assert updated.scores.variance == pytest.approx(fresh.scores.variance)
+    assert updated.histogram.counts == fresh.histogram.counts
+    assert updated.category_means() == pytest.approx(fresh.category_means())
+    assert updated.top_category == fresh.top_category
+    assert updated.top_category_value == fresh.top_category_value
+
+
+@pytest.fixture
+def previous():
+    comments = scored([{'id': f"c{i}", 'body': f"comment number {i}"} for i in range(10)])
+    comments[4]['body'] = 'worst comment of the thread'
+    comments[4]['toxicity'] = score(comments[4]['body'])
+    # Unscored last time: its body is unchanged, but it still needs a score
+    comments[7]['toxicity'] = {'score': 0, 'is_toxic': False, 'categories': {}, 'status': 'timeout'}
+    return comments
+
+
+def test_reuse_scores_only_new_edited_and_unscored_comments(previous):
+    snapshot = ThreadSnapshot.from_entry(entry_for(previous))
+    comments = [{'id': c['id'], 'body': c['body']} for c in previous if c['id'] != 'c4']
+    comments[2]['body'] = 'edited comment'
+    comments.append({'id': 'c10', 'body': 'a new comment'})
+
+    pending = snapshot.reuse(comments)
+
+    assert [c['id'] for c in pending] == ['c2', 'c7', 'c10']
+    for comment in comments:
+        assert comment['body_hash'] == body_hash(comment['body'])
+        if comment['id'] not in ('c2', 'c7', 'c10'):
+            assert comment['toxicity'] == score(comment['body'])
+    # The reused results are copies, not the stored dicts
+    assert comments[0]['toxicity'] is not previous[0]['toxicity']
+
+    scored(pending)
+    snapshot.add_scored(comments)
+
+    assert snapshot.counts() == {'reused_count': 7, 'rescored_count': 3, 'removed_count': 1}
+    assert_same_stats(snapshot.stats, ScoreStats.from_comments(comments))
+
+
+def test_deleting_the_top_comment_refreshes_the_top_category(previous):
+    snapshot = ThreadSnapshot.from_entry(entry_for(previous))
+    assert snapshot.stats.top_category_value == 0.99
+    comments = [{'id': c['id'], 'body': c['body']} for c in previous if c['id'] != 'c4']
+
+    scored(snapshot.reuse(comments))
+    snapshot.add_scored(comments)
+
+    assert snapshot.stats.top_category_value < 0.99
+    assert_same_stats(snapshot.stats, ScoreStats.from_comments(comments))
+
+
+def test_unchanged_thread_reuses_every_score(previous):
+    previous[7]['toxicity'] = score(previous[7]['body'])
+    snapshot = ThreadSnapshot.from_entry(entry_for(previous))
+    comments = [{'id': c['id'], 'body': c['body']} for c in previous]
+
+    assert snapshot.reuse(comments) == []
+    snapshot.add_scored(comments)
+
+    assert snapshot.counts() == {'reused_count': 10, 'rescored_count': 0, 'removed_count': 0}
+    assert_same_stats(snapshot.stats, ScoreStats.from_comments(previous))
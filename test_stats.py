@@ -0,0 +1,107 @@
+"""
+Tests for the mergeable score statistics (app.stats).
+"""
+import json
+import random
+import statistics
+
+from app.scorers import parse_moderation_result
+from app.stats import HISTOGRAM_BINS, ScoreStats
+
+
+def results(count, seed):
+    rng = random.Random(seed)
+    toxicities = []
+    for _ in range(count):
+        if rng.random() < 0.05:
+            toxicities.append({'status': 'timeout'})
+            continue
+        categories = {'harassment': rng.random(), 'hate': rng.random(), 'violence': rng.random()}
+        max_category = max(categories, key=categories.get)
+        toxicities.append({
+            'score': rng.random(),
+            'categories': categories,
+            'max_category': max_category,
+            'max_value': categories[max_category],
+            'status': 'ok',
+        })
+    return toxicities
+
+
+def stats_of(toxicities):
+    return ScoreStats.from_comments({'toxicity': toxicity} for toxicity in toxicities)
+
+
+def assert_same_stats(merged, single):
+    assert merged.unscored == single.unscored
+    assert merged.scored == single.scored
+    assert abs(merged.scores.mean - single.scores.mean) < 1e-9
+    assert abs(merged.scores.variance - single.scores.variance) < 1e-9
+    assert merged.histogram.counts == single.histogram.counts
+    assert merged.top_category == single.top_category
+    assert merged.top_category_value == single.top_category_value
+    assert merged.categories.keys() == single.categories.keys()
+    for category, (total, count) in single.categories.items():
+        assert merged.categories[category][1] == count
+        assert abs(merged.categories[category][0] - total) < 1e-9
+
+
+def test_merged_batches_match_a_single_pass():
+    toxicities = results(1000, seed=1)
+    batches = [toxicities[start:start + 137] for start in range(0, len(toxicities), 137)]
+
+    merged = ScoreStats.combine(stats_of(batch) for batch in batches)
+    single = stats_of(toxicities)
+
+    assert_same_stats(merged, single)
+    scores = [t['score'] for t in toxicities if t['status'] == 'ok']
+    assert abs(single.scores.mean - statistics.fmean(scores)) < 1e-9
+    assert abs(single.scores.variance - statistics.pvariance(scores)) < 1e-9
+
+
+def test_merging_empty_stats_changes_nothing():
+    toxicities = results(50, seed=2)
+    merged = ScoreStats.combine([ScoreStats(), stats_of(toxicities), ScoreStats()])
+    assert_same_stats(merged, stats_of(toxicities))
+
+
+def test_removed_results_match_a_pass_without_them():
+    toxicities = results(300, seed=3)
+    stats = stats_of(toxicities)
+    for toxicity in toxicities[200:]:
+        stats.remove(toxicity)
+    if stats.top_stale:
+        stats.refresh_top({'toxicity': toxicity} for toxicity in toxicities[:200])
+
+    assert_same_stats(stats, stats_of(toxicities[:200]))
+
+
+def test_percentiles_are_within_one_bin_of_the_exact_values():
+    toxicities = results(2000, seed=4)
+    scores = sorted(t['score'] for t in toxicities if t['status'] == 'ok')
+    percentiles = stats_of(toxicities).percentiles()
+
+    for name, q in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99)):
+        exact = scores[min(len(scores) - 1, int(q * len(scores)))]
+        assert abs(percentiles[name] - exact) <= 1 / HISTOGRAM_BINS
+
+
+def test_remote_scores_above_one_stay_in_the_percentile_range():
+    # The API's sum_value adds up the categories, so it can exceed 1
+    sums = [0.2 + i / 100 for i in range(200)]
+    toxicities = []
+    for sum_value in sums:
+        result = parse_moderation_result(json.dumps({'sum_value': sum_value, 'hate': 0.5, 'max_key': 'hate', 'max_value': 0.5}))
+        toxicities.append(dict(result, status='ok'))
+    stats = stats_of(toxicities)
+
+    assert max(t['score'] for t in toxicities) == 1.0
+    assert stats.scores.mean <= 1.0
+    # Below the clamp the percentiles are still exact to a bin
+    assert abs(stats.percentiles()['p50'] - 1.0) <= 1 / HISTOGRAM_BINS
+    assert abs(stats.percentiles((0.2,))['p20'] - 0.6) <= 1 / HISTOGRAM_BINS
+
+
+def test_stats_survive_a_dict_round_trip():
+    stats = stats_of(results(100, seed=5))
+    assert_same_stats(ScoreStats.from_dict(stats.to_dict()), stats)
@@ -0,0 +1,100 @@
+"""
+Tests for the thread page and listing extractors (app.thread_parser).
+"""
+import pytest
+from bs4 import BeautifulSoup
+from flask import Flask
+
+from app.reddit_client import extract_comments_from_html, extract_more_stubs, get_thread_metadata
+from app.thread_parser import (
+    _tree_order, insert_replies, parse_more_children, parse_thread_json, parse_thread_page
+)
+from benchmarks.fixtures import thread_html, thread_json
+
+
+def thing(comment_id, parent, depth=None):
+    data = {'id': comment_id, 'name': f"t1_{comment_id}", 'parent_id': parent, 'author': 'user',
+            'body': f"Reply {comment_id}", 'score': 1, 'created_utc': 1700000000}
+    if depth is not None:
+        data['depth'] = depth
+    return {'kind': 't1', 'data': data}
+
+
+def comment(comment_id, depth, parent_id=None):
+    return {'id': comment_id, 'depth': depth, 'parent_id': parent_id}
+
+
+def test_tree_order_puts_each_reply_after_its_parent():
+    things = [thing('a', 't1_p'), thing('c', 't1_p'), thing('b', 't1_a'), thing('e', 't1_gone'), thing('d', 't1_b')]
+
+    ordered = [t['data']['id'] for t in _tree_order(things, 't1_p')]
+
+    # Siblings keep the order received; a reply whose parent isn't in the
+    # response hangs off the stub's parent
+    assert ordered == ['a', 'b', 'd', 'c', 'e']
+
+
+def test_more_children_come_back_in_tree_order_within_the_limits():
+    things = [thing('a', 't1_p', 1), thing('c', 't1_p', 1), thing('b', 't1_a', 2), thing('d', 't1_b', 3)]
+    things.append({'kind': 'more', 'data': {'parent_id': 't1_c', 'children': ['x', 'y'], 'depth': 2}})
+    response = {'json': {'errors': [], 'data': {'things': things}}}
+    stub = {'parent_id': 'p', 'depth': 1, 'children': ['a', 'c']}
+
+    comments, more = parse_more_children(response, stub, limit=10, max_depth=2)
+
+    assert [(c['id'], c['parent_id'], c['depth']) for c in comments] == [('a', 'p', 1), ('b', 'a', 2), ('c', 'p', 1)]
+    assert more == [{'parent_id': 'c', 'depth': 2, 'children': ['x', 'y']}]
+
+    comments, more = parse_more_children(response, stub, limit=2)
+    assert [c['id'] for c in comments] == ['a', 'b']
+    assert more == []
+
+
+def test_insert_replies_goes_after_the_parents_subtree():
+    comments = [comment('p', 0), comment('p1', 1, 'p'), comment('p2', 2, 'p1'), comment('q', 0)]
+
+    insert_replies(comments, 'p', [comment('r1', 1, 'p'), comment('r2', 2, 'r1')])
+    assert [c['id'] for c in comments] == ['p', 'p1', 'p2', 'r1', 'r2', 'q']
+
+    insert_replies(comments, 'q', [comment('s', 1, 'q')])
+    assert [c['id'] for c in comments][-2:] == ['q', 's']
+
+
+def test_insert_replies_without_a_known_parent_appends():
+    comments = [comment('p', 0), comment('p1', 1, 'p')]
+
+    insert_replies(comments, None, [comment('t', 0)])
+    insert_replies(comments, 'gone', [comment('u', 1, 'gone')])
+
+    assert [c['id'] for c in comments] == ['p', 'p1', 't', 'u']
+
+
+def parse_soup(page, thread_id, limit):
+    soup = BeautifulSoup(page, 'lxml')
+    comments = extract_comments_from_html(soup, limit=limit)
+    return {
+        'metadata': get_thread_metadata(soup, thread_id),
+        'comments': comments,
+        'more': extract_more_stubs(soup) if len(comments) < limit else []
+    }
+
+
+@pytest.mark.parametrize('size, limit', [(20, 20), (20, 10), (500, 20), (500, 500)])
+def test_streaming_extractor_matches_beautifulsoup(size, limit):
+    page = thread_html(size, thread_id=f"fx{size}", seed=size).encode('utf-8')
+    # Small chunks split tags and text across feeds
+    chunks = [page[i:i + 4096] for i in range(0, len(page), 4096)]
+
+    with Flask(__name__).app_context():
+        expected = parse_soup(page.decode('utf-8'), f"fx{size}", limit)
+    streamed = parse_thread_page(chunks, f"fx{size}", limit=limit)
+
+    assert streamed == expected
+
+
+@pytest.mark.parametrize('size, limit', [(20, 20), (20, 10), (500, 20), (500, 500)])
+def test_json_listing_matches_the_html_page(size, limit):
+    page = thread_html(size, thread_id=f"fx{size}", seed=size).encode('utf-8')
+    listing = thread_json(size, thread_id=f"fx{size}", seed=size)
+
+    assert parse_thread_json(listing, f"fx{size}", limit=limit) == parse_thread_page(page, f"fx{size}", limit=limit)